@@ -16,3 +16,6 @@ logger = logging.getLogger('deeprank')
 
 # Default PSSM path
 PATH_PSSM_SOURCE = None
+
+# Catalog of the source directories, see deeprank.tools.catalog
+SOURCE_CATALOG = None
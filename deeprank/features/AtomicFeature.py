@@ -5,6 +5,7 @@ import numpy as np
 import pdb2sql
 
 from deeprank.features import FeatureClass
+from deeprank.tools import StructureContext
 
 
 class AtomicFeature(FeatureClass):
@@ -16,7 +17,9 @@ class AtomicFeature(FeatureClass):
 
         Args:
 
-            pdbfile (str): pdb file of the molecule
+            pdbfile (str or pdb2sql or StructureContext): pdb file,
+                database or shared structure of the molecule. A database
+                or structure is used as is and is not closed by the class.
 
             chain1 (str): First chain ID, defaults to 'A'
             chain2 (str): Second chain ID, defaults to 'B'
@@ -87,7 +90,16 @@ class AtomicFeature(FeatureClass):
         self.atom_key = 'chainID, resSeq, resName, name'
 
         # read the pdb as an sql
-        self.sqldb = pdb2sql.pdb2sql(self.pdbfile)
+        self.shared_sql = isinstance(
+            self.pdbfile, (pdb2sql.pdb2sql, StructureContext))
+        self.structure = None
+        if isinstance(self.pdbfile, StructureContext):
+            self.structure = self.pdbfile
+            self.sqldb = self.structure.sql
+        elif self.shared_sql:
+            self.sqldb = self.pdbfile
+        else:
+            self.sqldb = pdb2sql.pdb2sql(self.pdbfile)
 
         # read the force field
         self.read_charge_file()
@@ -227,10 +239,6 @@ class AtomicFeature(FeatureClass):
         # TODO: replace this function with pdb2sql.get_contact_atoms
         # but need to add a filter parameter to filter out ligand.
 
-        # position of the chains
-        xyz1 = np.array(self.sqldb.get('x,y,z', chainID=self.chain1))
-        xyz2 = np.array(self.sqldb.get('x,y,z', chainID=self.chain2))
-
         # rowID of the chains
         index_a = self.sqldb.get('rowID', chainID=self.chain1)
         index_b = self.sqldb.get('rowID', chainID=self.chain2)
@@ -247,28 +255,37 @@ class AtomicFeature(FeatureClass):
         # in contact
         self.contact_pairs = {}
 
-        for i, x0 in enumerate(xyz1):
+        if self.structure is not None:
+            self._get_contact_atoms_from_structure(
+                index_a + index_b, list(resName1) + list(resName2))
+
+        else:
+            # position of the chains
+            xyz1 = np.array(self.sqldb.get('x,y,z', chainID=self.chain1))
+            xyz2 = np.array(self.sqldb.get('x,y,z', chainID=self.chain2))
+
+            for i, x0 in enumerate(xyz1):
 
-            # compute the contact atoms
-            contacts = np.where(
-                np.sqrt(np.sum((xyz2 - x0)**2, 1)) < self.contact_cutoff)[0]
+                # compute the contact atoms
+                contacts = np.where(
+                    np.sqrt(np.sum((xyz2 - x0)**2, 1)) < self.contact_cutoff)[0]
 
-            # if we have contact atoms and resA is not a ligand
-            if (len(contacts) > 0) and (resName1[i] in self.valid_resnames):
+                # if we have contact atoms and resA is not a ligand
+                if (len(contacts) > 0) and (resName1[i] in self.valid_resnames):
 
-                # add i to the list
-                # add the index of b if its resname is not a ligand
-                self.contact_atoms_A += [index_a[i]]
-                self.contact_atoms_B += [
-                    index_b[k] for k in contacts
-                    if resName2[k] in self.valid_resnames
-                ]
+                    # add i to the list
+                    # add the index of b if its resname is not a ligand
+                    self.contact_atoms_A += [index_a[i]]
+                    self.contact_atoms_B += [
+                        index_b[k] for k in contacts
+                        if resName2[k] in self.valid_resnames
+                    ]
 
-                # add the contact pairs to the list
-                self.contact_pairs[index_a[i]] = [
-                    index_b[k] for k in contacts
-                    if resName2[k] in self.valid_resnames
-                ]
+                    # add the contact pairs to the list
+                    self.contact_pairs[index_a[i]] = [
+                        index_b[k] for k in contacts
+                        if resName2[k] in self.valid_resnames
+                    ]
 
         # create a set of unique indexes
         self.contact_atoms_A = sorted(set(self.contact_atoms_A))
@@ -278,6 +295,35 @@ class AtomicFeature(FeatureClass):
         if len(self.contact_atoms_A) == 0:
             raise ValueError("No contact atoms detected in AtomicFeature")
 
+    def _get_contact_atoms_from_structure(self, index, resName):
+        """Get the contact atoms from the atom pairs memoized by the
+        shared structure.
+
+        Args:
+            index (list(int)): rowID of the atoms of the chains
+            resName (list(str)): resName of the atoms of the chains
+        """
+        resName = dict(zip(index, resName))
+
+        index_a, index_b, dist = self.structure.get_contact_atom_pairs(
+            self.contact_cutoff, self.chain1, self.chain2)
+        mask = dist < self.contact_cutoff
+
+        for ia, ib in zip(index_a[mask].tolist(), index_b[mask].tolist()):
+
+            # resA is a ligand
+            if resName[ia] not in self.valid_resnames:
+                continue
+
+            if ia not in self.contact_pairs:
+                self.contact_atoms_A += [ia]
+                self.contact_pairs[ia] = []
+
+            # add the index of b if its resname is not a ligand
+            if resName[ib] in self.valid_resnames:
+                self.contact_atoms_B += [ib]
+                self.contact_pairs[ia] += [ib]
+
     def _extend_contact_to_residue(self):
         """Extend the contact atoms to entire residue where one atom is
         contacting."""
@@ -372,22 +418,23 @@ class AtomicFeature(FeatureClass):
             ataltResName[rowID] = altResName
             attype[rowID] = type_
 
-        # put the charge in SQL
-        self.sqldb.add_column('CHARGE')
-        self.sqldb.update_column('CHARGE', atcharge)
+        # the columns may already exist in a shared database
+        colnames = self.sqldb.get_colnames()
 
-        # put the VDW in SQL
-        self.sqldb.add_column('eps')
-        self.sqldb.update_column('eps', ateps)
+        def _set_column(name, values, coltype='FLOAT'):
+            if name not in colnames:
+                self.sqldb.add_column(name, coltype)
+            self.sqldb.update_column(name, values)
 
-        self.sqldb.add_column('sig')
-        self.sqldb.update_column('sig', atsig)
+        # put the charge in SQL
+        _set_column('CHARGE', atcharge)
 
-        self.sqldb.add_column('type', 'TEXT')
-        self.sqldb.update_column('type', attype)
+        # put the VDW in SQL
+        _set_column('eps', ateps)
+        _set_column('sig', atsig)
 
-        self.sqldb.add_column('altRes', 'TEXT')
-        self.sqldb.update_column('altRes', ataltResName)
+        _set_column('type', attype, 'TEXT')
+        _set_column('altRes', ataltResName, 'TEXT')
 
     @staticmethod
     def _get_altResName(resName, atNames):
@@ -914,7 +961,8 @@ class AtomicFeature(FeatureClass):
 #
 ########################################################################
 
-def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
+def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2,
+                        structure=None):
     """Main function called in deeprank for the feature calculations.
 
     Args:
@@ -923,10 +971,15 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
         featgrp_raw (str): name of the group where to save human readable data
         chain1 (str): First chain ID
         chain2 (str): Second chain ID
+        structure (StructureContext, optional): shared structure
+            of the molecule
     """
     path = os.path.dirname(os.path.realpath(__file__))
     FF = path + '/forcefield/'
 
+    if structure is not None:
+        pdb_data = structure
+
     atfeat = AtomicFeature(pdb_data,
                            chain1=chain1,
                            chain2=chain2,
@@ -949,7 +1002,8 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
     atfeat.export_data_hdf5(featgrp_raw)
 
     # close
-    atfeat.sqldb._close()
+    if not atfeat.shared_sql:
+        atfeat.sqldb._close()
 
 
 ########################################################################
@@ -3,6 +3,7 @@ import warnings
 import pdb2sql
 
 from deeprank.features import FeatureClass
+from deeprank.tools import StructureContext
 
 try:
     import freesasa
@@ -23,7 +24,10 @@ class BSA(FeatureClass):
         >>> pip install freesasa
 
         Args:
-            pdb_data (list(byte) or str): pdb data or pdb filename
+            pdb_data (list(byte) or str or pdb2sql.interface or
+                StructureContext): pdb data, pdb filename, database or
+                shared structure of the molecule. A database or structure
+                is used as is and is not closed by the class.
             chain1 (str, optional): name of the first chain
             chain2 (str, optional): name of the second chain
 
@@ -34,7 +38,17 @@ class BSA(FeatureClass):
             >>> bsa.sql._close()
         """
         self.pdb_data = pdb_data
-        self.sql = pdb2sql.interface(pdb_data)
+        self.shared_sql = isinstance(
+            pdb_data, (pdb2sql.interface, StructureContext))
+        if isinstance(pdb_data, StructureContext):
+            self.sql = pdb_data.sql
+        elif self.shared_sql:
+            self.sql = pdb_data
+        else:
+            self.sql = pdb2sql.interface(pdb_data)
+        # the structure memoizes the contacts
+        self.contacts = pdb_data if isinstance(
+            pdb_data, StructureContext) else self.sql
         self.chain1 = chain1
         self.chain2 = chain2
         self.chains_label = [chain1, chain2]
@@ -86,7 +100,7 @@ class BSA(FeatureClass):
         self.bsa_data = {}
         self.bsa_data_xyz = {}
 
-        ctc_res = self.sql.get_contact_residues(cutoff=cutoff, chain1=self.chain1, chain2=self.chain2)
+        ctc_res = self.contacts.get_contact_residues(cutoff=cutoff, chain1=self.chain1, chain2=self.chain2)
         ctc_res = ctc_res[self.chain1] + ctc_res[self.chain2]
 
         # handle with small interface or no interface
@@ -138,7 +152,8 @@ class BSA(FeatureClass):
 ########################################################################
 
 
-def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
+def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2,
+                        structure=None):
     """Main function called in deeprank for the feature calculations.
 
     Args:
@@ -147,9 +162,13 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
         featgrp_raw (str): name of the group where to save human readable data
         chain1 (str): First chain ID
         chain2 (str): Second chain ID
+        structure (StructureContext, optional): shared structure
+            of the molecule
     """
 
     # create the BSA instance
+    if structure is not None:
+        pdb_data = structure
     bsa = BSA(pdb_data, chain1, chain2)
 
     # get the structure/calc
@@ -163,7 +182,8 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
     bsa.export_data_hdf5(featgrp_raw)
 
     # close the file
-    bsa.sql._close()
+    if not bsa.shared_sql:
+        bsa.sql._close()
 
 
 ########################################################################
@@ -31,7 +31,13 @@ class FeatureClass(object):
         self.feature_data_xyz = {}
 
     def export_data_hdf5(self, featgrp):
-        """Export the data in xyz-val format in an HDF5 file group.
+        """Export the data in human readable format in an HDF5 file group.
+
+        The attribute 'format' of the group sets how the data are stored:
+        'text' (default) as fixed-width strings, 'compound' as compound
+        datasets with the fields chainID, resSeq, resName, (name) and
+        values, read back as typed arrays. Nothing is stored if the
+        group is None.
 
         Arguments:
             featgrp {[hdf5_group]} -- The hdf5 group of the feature
@@ -43,9 +49,19 @@ class FeatureClass(object):
                 {(chainID, resSeq, resName): [values]}
         """
 
+        if featgrp is None:
+            return
+
         # loop through the datadict and name
         for name, data in self.feature_data.items():
 
+            if featgrp.attrs.get('format', 'text') == 'compound':
+                if name + '_raw' in featgrp:
+                    del featgrp[name + '_raw']
+                featgrp.create_dataset(name + '_raw',
+                                       data=self.get_compound_data(data))
+                continue
+
             ds = []
             for key, value in data.items():
 
@@ -84,6 +100,42 @@ class FeatureClass(object):
                 featgrp.create_dataset(name + '_raw', data=ds)
 
 
+    @staticmethod
+    def get_compound_data(data):
+        """Convert the data of a feature in a structured array.
+
+        Arguments:
+            data {dict} -- {(chainID, resSeq, resName[, name]): [values]}
+
+        Returns:
+            np.ndarray -- structured array with the fields chainID,
+                resSeq, resName, name (atomic features only) and values
+        """
+        if not data:
+            return np.array([])
+
+        keys = list(data.keys())
+        values = np.array(list(data.values()), dtype=np.float64)
+        values = values.reshape(len(keys), -1)
+
+        # the text columns are stored as bytes
+        columns = []
+        for col in zip(*keys):
+            col = np.array(col)
+            if col.dtype.kind == 'U':
+                col = col.astype('S')
+            columns.append(col)
+
+        names = ['chainID', 'resSeq', 'resName', 'name'][:len(columns)]
+        dtype = [(n, col.dtype) for n, col in zip(names, columns)]
+        dtype.append(('values', np.float64, (values.shape[1],)))
+
+        ds = np.empty(len(keys), dtype=dtype)
+        for n, col in zip(names, columns):
+            ds[n] = col
+        ds['values'] = values
+        return ds
+
     def export_dataxyz_hdf5(self, featgrp):
         """Export the data in xyz-val format in an HDF5 file group.
 
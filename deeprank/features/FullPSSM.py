@@ -1,3 +1,4 @@
+import hashlib
 import os
 import warnings
 
@@ -6,6 +7,8 @@ import pdb2sql
 
 from deeprank import config
 from deeprank.features import FeatureClass
+from deeprank.tools import StructureContext
+from deeprank.tools.catalog import SourceCatalog
 
 ########################################################################
 #
@@ -25,7 +28,10 @@ class FullPSSM(FeatureClass):
 
         Args:
             mol_name (str): name of the molecule. Defaults to None.
-            pdb_file (str): name of the pdb_file. Defaults to None.
+            pdb_file (str or pdb2sql.interface or StructureContext): name
+                of the pdb_file, pdb data, database or shared structure of
+                the molecule. A database or structure is used as is and
+                is not closed by the class. Defaults to None.
             chain1 (str): First chain ID. Defaults to 'A'
             chain2 (str): Second chain ID. Defaults to 'B'
             pssm_path (str): path to the pssm data. Defaults to None.
@@ -85,14 +91,35 @@ class FullPSSM(FeatureClass):
         """Get the bared mol name."""
         return mol_name.split('_')[0]
 
-    def read_PSSM_data(self):
-        """Read the PSSM data into a dictionary."""
+    @classmethod
+    def find_pssm_files(cls, pssm_path, mol_name):
+        """Find the PSSM files of a molecule.
+
+        Args:
+            pssm_path (str): path to the pssm data
+            mol_name (str): name of the molecule
 
-        names = os.listdir(self.pssm_path)
-        fnames = list(filter(lambda x: self.mol_name in x, names))
+        Returns:
+            list(str): names of the PSSM files
+        """
+        catalog = config.SOURCE_CATALOG or SourceCatalog()
+        fnames = catalog.startswith(pssm_path, mol_name)
         # if decoy pssm files not exist, use reference pssm files
         if not fnames:
-            fnames = list(filter(lambda x: self.ref_mol_name in x, names))
+            fnames = catalog.startswith(pssm_path,
+                                        cls.get_ref_mol_name(mol_name))
+        return fnames
+
+    def read_PSSM_data(self):
+        """Read the PSSM data into a dictionary.
+
+        The PSSM files are the files of pssm_path whose name starts with
+        the molecule name, or with the reference name if there are none.
+        They are looked up in config.SOURCE_CATALOG, if set, so that
+        the directory is not listed again for each molecule.
+        """
+
+        fnames = self.find_pssm_files(self.pssm_path, self.mol_name)
         num_pssm_files = len(fnames)
 
         if num_pssm_files == 0:
@@ -167,7 +194,17 @@ class FullPSSM(FeatureClass):
     def get_feature_value(self, cutoff=5.5):
         """get the feature value."""
 
-        sql = pdb2sql.interface(self.pdb_file)
+        shared_sql = isinstance(
+            self.pdb_file, (pdb2sql.interface, StructureContext))
+        if isinstance(self.pdb_file, StructureContext):
+            sql = self.pdb_file.sql
+        elif shared_sql:
+            sql = self.pdb_file
+        else:
+            sql = pdb2sql.interface(self.pdb_file)
+        # the structure memoizes the contacts
+        contacts = self.pdb_file if isinstance(
+            self.pdb_file, StructureContext) else sql
 
         # set achors for all residues and get their xyz
         xyz_info, xyz = self.get_residue_center(sql)
@@ -178,9 +215,10 @@ class FullPSSM(FeatureClass):
 
         # get interface contact residues
         # ctc_res = {"A":[chain 1 residues], "B": [chain2 residues]}
-        ctc_res = sql.get_contact_residues(cutoff=cutoff,
+        ctc_res = contacts.get_contact_residues(cutoff=cutoff,
                             chain1=self.chain1, chain2=self.chain2)
-        sql._close()
+        if not shared_sql:
+            sql._close()
         ctc_res = ctc_res[self.chain1] + ctc_res[self.chain2]
 
         # handle with small interface or no interface
@@ -238,7 +276,36 @@ class FullPSSM(FeatureClass):
 ########################################################################
 
 
-def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2, out_type='pssmvalue'):
+def __cache_key__(featgrp):
+    """Part of the feature cache key specific to the PSSM features.
+
+    The PSSM files are found from the name of the molecule, the key
+    contains their contents and their names without the molecule name,
+    i.e. the chains, so that a molecule stored under another name with
+    the same PSSM files still hits the cache.
+
+    Args:
+        featgrp (h5py.Group): group of the xyz features of the molecule
+
+    Returns:
+        str: sha256 of the PSSM files of the molecule
+    """
+    sha = hashlib.sha256()
+    path = config.PATH_PSSM_SOURCE
+    if path is None:
+        return sha.hexdigest()
+
+    mol_name = os.path.split(featgrp.name)[0].lstrip('/')
+    for fname in sorted(FullPSSM.find_pssm_files(path, mol_name)):
+        chains = fname.split('.', 1)[1:]
+        sha.update('.'.join(chains).encode() + b'\0')
+        with open(os.path.join(path, fname), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2,
+                        out_type='pssmvalue', structure=None):
     """Main function called in deeprank for the feature calculations.
 
     Args:
@@ -248,6 +315,8 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2, out_type
         chain1 (str): First chain ID
         chain2 (str): Second chain ID
         out_type (str): which feature to generate, 'pssmvalue' or 'pssmic'.
+        structure (StructureContext, optional): shared structure
+            of the molecule
     """
 
     if config.PATH_PSSM_SOURCE is None:
@@ -259,6 +328,9 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2, out_type
     mol_name = os.path.split(featgrp.name)[0]
     mol_name = mol_name.lstrip('/')
 
+    if structure is not None:
+        pdb_data = structure
+
     pssm = FullPSSM(mol_name, pdb_data, chain1=chain1, chain2=chain2,
                     pssm_path=path, out_type=out_type)
 
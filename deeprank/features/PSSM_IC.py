@@ -1,4 +1,5 @@
 from deeprank.features.FullPSSM import FullPSSM
+from deeprank.features.FullPSSM import __cache_key__
 from deeprank.features.FullPSSM import __compute_feature__ as func
 
 ########################################################################
@@ -17,10 +18,11 @@ class PSSM_IC(FullPSSM):
 #
 ##########################################################################
 
-def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
+def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2,
+                        structure=None):
 
     func(pdb_data, featgrp, featgrp_raw, chain1=chain1, chain2=chain2,
-        out_type='pssmic')
+        out_type='pssmic', structure=structure)
 
 ##########################################################################
 #
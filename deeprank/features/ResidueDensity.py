@@ -4,6 +4,7 @@ import pdb2sql
 
 from deeprank.features import FeatureClass
 from deeprank import config
+from deeprank.tools import StructureContext
 
 
 class ResidueDensity(FeatureClass):
@@ -12,7 +13,10 @@ class ResidueDensity(FeatureClass):
         """Compute the residue contacts between polar/apolar/charged residues.
 
         Args:
-            pdb_data (list(byte) or str): pdb data or pdb filename
+            pdb_data (list(byte) or str or pdb2sql.interface or
+                StructureContext): pdb data, pdb filename, database or
+                shared structure of the molecule. A database or structure
+                is used as is and is not closed by the class.
             chain1 (str): First chain ID. Defaults to 'A'
             chain2 (str): Second chain ID. Defaults to 'B'
 
@@ -23,7 +27,17 @@ class ResidueDensity(FeatureClass):
         """
 
         self.pdb_data = pdb_data
-        self.sql = pdb2sql.interface(pdb_data)
+        self.shared_sql = isinstance(
+            pdb_data, (pdb2sql.interface, StructureContext))
+        if isinstance(pdb_data, StructureContext):
+            self.sql = pdb_data.sql
+        elif self.shared_sql:
+            self.sql = pdb_data
+        else:
+            self.sql = pdb2sql.interface(pdb_data)
+        # the structure memoizes the contacts
+        self.contacts = pdb_data if isinstance(
+            pdb_data, StructureContext) else self.sql
         self.chains_label = [chain1, chain2]
         self.chain1 = chain1
         self.chain2 = chain2
@@ -42,7 +56,7 @@ class ResidueDensity(FeatureClass):
         # res = {('chain1,resSeq,resName'): set(
         #                               ('chain2,res1Seq,res1Name),
         #                               ('chain2,res2Seq,res2Name'))}
-        res = self.sql.get_contact_residues(chain1=self.chains_label[0],
+        res = self.contacts.get_contact_residues(chain1=self.chains_label[0],
                                            chain2=self.chains_label[1],
                                            cutoff=cutoff,
                                            return_contact_pairs=True)
@@ -88,7 +102,8 @@ class ResidueDensity(FeatureClass):
         # handle with small interface or no interface
         if total_ctc == 0:
             # first close the sql
-            self.sql._close()
+            if not self.shared_sql:
+                self.sql._close()
 
             raise ValueError(
                 f"No residue contact found with the cutoff {cutoff}Å. "
@@ -158,7 +173,8 @@ class residue_pair(object):
 #
 ########################################################################
 
-def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
+def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2,
+                        structure=None):
     """Main function called in deeprank for the feature calculations.
 
     Args:
@@ -167,9 +183,13 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
         featgrp_raw (str): name of the group where to save human readable data
         chain1 (str): First chain ID
         chain2 (str): Second chain ID
+        structure (StructureContext, optional): shared structure
+            of the molecule
     """
 
     # create instance
+    if structure is not None:
+        pdb_data = structure
     resdens = ResidueDensity(pdb_data, chain1=chain1, chain2=chain2)
 
     # get the residue conacts
@@ -183,7 +203,8 @@ def __compute_feature__(pdb_data, featgrp, featgrp_raw, chain1, chain2):
     resdens.export_data_hdf5(featgrp_raw)
 
     # close sql
-    resdens.sql._close()
+    if not resdens.shared_sql:
+        resdens.sql._close()
 
 ########################################################################
 #
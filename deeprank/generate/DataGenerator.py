@@ -1,10 +1,22 @@
 import importlib
 import copy
+import inspect
+import io
+import itertools
+import json
+import multiprocessing
 import os
 import re
+import shutil
 import sys
+import tempfile
+import threading
+import time
 import warnings
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from functools import partial
+from time import perf_counter
 
 import h5py
 import numpy as np
@@ -13,6 +25,21 @@ import deeprank
 from deeprank import config
 from deeprank.config import logger
 from deeprank.generate import GridTools as gt
+from deeprank.generate.FeatureCache import FeatureCache
+from deeprank.generate.HDF5Writer import HDF5Writer
+from deeprank.generate.StageTimer import StageTimer
+from deeprank.generate.SupervisedPool import SupervisedPool
+from deeprank.tools import StructureContext
+from deeprank.tools.archives import PDB_EXTENSIONS, is_archive, \
+    list_archive, load_pdb, open_pdb, pdb_name
+from deeprank.tools.catalog import FileIndex, SourceCatalog, has_wildcards
+from deeprank.tools.augmentation import is_virtual
+from deeprank.tools.columnar import (is_columnar, read_pdb_data,
+                                     read_structure, sql_to_columns,
+                                     write_columns)
+from deeprank.tools.compaction import compact_hdf5
+from deeprank.tools.prescreen import count_contact_atoms
+from deeprank.tools.splatting import MAPPING_MODES
 import pdb2sql
 from pdb2sql.align import align as align_along_axis
 from pdb2sql.align import align_interface
@@ -23,33 +50,149 @@ except ImportError:
     def tqdm(x):
         return x
 
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
 try:
     from pycuda import driver, compiler, gpuarray, tools
     import pycuda.autoinit
+    _cuda_available = True
 except ImportError:
-    pass
+    _cuda_available = False
 
 
 def _printif(string, cond): return print(string) if cond else None
 
 
+def _structure_kwargs(func, structure):
+    """Get the keyword arguments passing the shared structure to a
+    feature/target function.
+
+    Functions that do not have a 'structure' argument only get the pdb data.
+
+    Args:
+        func (callable): __compute_feature__ or __compute_target__
+        structure (StructureContext): structure of the molecule or None
+
+    Returns:
+        dict: {'structure': structure} or empty dict
+    """
+    if structure is None:
+        return {}
+    try:
+        params = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return {}
+    if 'structure' in params:
+        return {'structure': structure}
+    return {}
+
+
+def _time_stage(timer, mol, stage):
+    """Time a stage of a molecule.
+
+    Args:
+        timer (StageTimer): timer or None
+        mol (str): name of the molecule
+        stage (str): name of the stage
+
+    Returns:
+        context manager timing the stage if timer is not None
+    """
+    if timer is None:
+        return nullcontext()
+    return timer.time(mol, stage)
+
+
+def _get_raw_format(featgrp_raw):
+    """Get the format of the raw features stored in a group.
+
+    Args:
+        featgrp_raw (h5py.Group): group features_raw or None
+
+    Returns:
+        str: 'text', 'compound' or None
+    """
+    if featgrp_raw is None:
+        return None
+    return featgrp_raw.attrs.get('format', 'text')
+
+
+# DataGenerator instance used by the worker processes of create_database
+_worker_generator = None
+
+
+def _init_worker(generator, pssm_source):
+    """Initialize a worker process of create_database or _update_hdf5.
+
+    Args:
+        generator (DataGenerator): instance creating the database
+        pssm_source (str): path of the PSSM files
+    """
+    global _worker_generator
+    _worker_generator = generator
+    config.PATH_PSSM_SOURCE = pssm_source
+    config.SOURCE_CATALOG = generator.source_catalog
+
+
+def _create_mol_group_worker(cplx, verbose, remove_error, contact_distance):
+    """Create the group of a conformation in an in-memory HDF5 file.
+
+    Args:
+        cplx (str): pdb file of the conformation
+        verbose (bool): print creation details
+        remove_error (bool): skip targets/grid if the features errored
+        contact_distance (float): contact distance cutoff
+
+    Returns:
+        tuple: molecule name, native file, file image,
+            feature error flag, grid error flag
+    """
+    return _worker_generator._create_mol_group_image(
+        cplx, verbose, remove_error, contact_distance)
+
+
+def _update_mol_group_worker(inputs):
+    """Update the group of a molecule in an in-memory HDF5 file.
+
+    Args:
+        inputs (tuple): molecule name, task, complex and native
+            (see DataGenerator._get_update_inputs) or None
+
+    Returns:
+        tuple: file image, feature error flag or None
+    """
+    if inputs is None:
+        return None
+    return _worker_generator._update_mol_group_image(*inputs)
+
+
 class DataGenerator(object):
 
     def __init__(self, chain1, chain2,
                  pdb_select=None, pdb_source=None,
                  pdb_native=None, pssm_source=None, align=None,
                  compute_targets=None, compute_features=None,
-                 data_augmentation=None, hdf5='database.h5',
-                 mpi_comm=None):
+                 data_augmentation=None, virtual_augmentation=False,
+                 hdf5='database.h5', mpi_comm=None, structure_format='pdb',
+                 feature_cache=None, timing=None, source_catalog=None,
+                 raw_format='text'):
         """Generate the data (features/targets/maps) required for deeprank.
 
         Args:
             chain1 (str): First chain ID
             chain2 (str): Second chain ID
             pdb_select (list(str), optional): List of individual conformation for mapping
-            pdb_source (list(str), optional): List of folders where to find the pdbs for mapping
+            pdb_source (list(str), optional): List of folders where to find the pdbs for mapping.
+                Pdb files, .pdb.gz files and .tar, .tar.gz, .tgz or .zip archives of pdb
+                files are also accepted. The folders and archives are searched for
+                .pdb and .pdb.gz files, the members of the archives are read without
+                being extracted.
             pdb_native (list(str), optional): List of folders where to find the native comformations,
                 nust set it if having targets to compute in parameter "compute_targets".
+                Accepts the same sources as pdb_source.
             pssm_source (list(str), optional): List of folders where to find the PSSM files
             align (dict, optional): Dicitionary to align the compexes,
                                     e.g. align = {"selection":{"chainID":["A","B"]},"axis":"z"}}
@@ -59,11 +202,42 @@ class DataGenerator(object):
                 "pdb_native" must be set if having targets to compute.
             compute_features (list(str), optional): List of python files computing the features
             data_augmentation (int, optional): Number of rotation performed one each complex
+            virtual_augmentation (bool, optional): only store the rotation
+                parameters of the augmented complexes and link the data of the
+                original. The coordinates are rotated when they are read.
+                Defaults to False.
             hdf5 (str, optional): name of the hdf5 file where the data is saved, default to 'database.h5'
             mpi_comm (MPI_COMM): MPI COMMUNICATOR
+            structure_format (str, optional): 'pdb' stores the complexes as
+                pdb lines, 'columnar' as arrays of coordinates, codes and
+                numbers read without parsing text (see tools.columnar).
+                Defaults to 'pdb'.
+            feature_cache (str or FeatureCache, optional): directory of the
+                cache of the features, or cache, reused across databases
+                built from the same pdbs. Defaults to None.
+            timing (str, optional): record the time spent by each molecule
+                in each stage (see StageTimer) and log a summary at the end
+                of create_database and map_features: 'log' only logs it,
+                'attrs' also stores the times of each molecule in its
+                attrs['timing'] and the summary in the file attrs['timing']
+                (json strings), 'json' also saves them in <hdf5>.timing.json.
+                Defaults to None (no timing).
+            source_catalog (str or SourceCatalog, optional): directory
+                where the listings of the source directories are saved, or
+                catalog. The pdb and PSSM directories are listed once and
+                listed again only when they are modified.
+                Defaults to None, i.e. the listings are kept in memory.
+            raw_format (str, optional): storage of the human readable
+                features in the group features_raw: 'text' as fixed-width
+                strings, 'compound' as compound datasets of the residue/atom
+                fields and of the values in full precision (see
+                FeatureClass.export_data_hdf5), or None not to store them.
+                Defaults to 'text'.
 
         Raises:
             NotADirectoryError: if the source are not found
+            ValueError: if the structure format, timing or raw format
+                is not supported
 
         Example:
 
@@ -104,18 +278,51 @@ class DataGenerator(object):
         self.compute_features = compute_features
 
         self.data_augmentation = data_augmentation
+        self.virtual_augmentation = virtual_augmentation
 
         self.hdf5 = hdf5
 
         self.mpi_comm = mpi_comm
 
+        if structure_format not in ('pdb', 'columnar'):
+            raise ValueError(
+                f"structure_format must be 'pdb' or 'columnar', "
+                f"got {structure_format}")
+        self.structure_format = structure_format
+
+        if isinstance(feature_cache, str):
+            feature_cache = FeatureCache(feature_cache)
+        self.feature_cache = feature_cache
+
+        if timing not in (None, 'log', 'attrs', 'json'):
+            raise ValueError(
+                f"timing must be None, 'log', 'attrs' or 'json', "
+                f"got {timing}")
+        self.timing = timing
+        self.timer = StageTimer() if timing is not None else None
+
+        if raw_format not in ('text', 'compound', None):
+            raise ValueError(
+                f"raw_format must be 'text', 'compound' or None, "
+                f"got {raw_format}")
+        self.raw_format = raw_format
+
+        if not isinstance(source_catalog, SourceCatalog):
+            source_catalog = SourceCatalog(source_catalog)
+        self.source_catalog = source_catalog
+        config.SOURCE_CATALOG = self.source_catalog
+
         # set helper attributes
         self.all_pdb = []
         self.all_native = []
         self.pdb_path = []
 
+        # hdf5 path of the native stored for each native file
+        self.native_paths = {}
+
         self.feature_error = []
         self.grid_error = []
+        self.prescreen_error = []
         self.map_error = []
 
         self.logger = logger
@@ -141,7 +348,10 @@ class DataGenerator(object):
         for src in self.pdb_source:
             if os.path.isdir(src):
                 self.all_pdb += [os.path.join(src, fname)
-                                 for fname in os.listdir(src) if fname.endswith('.pdb')]
+                                 for fname in self.source_catalog.list(src)
+                                 if fname.endswith(PDB_EXTENSIONS)]
+            elif is_archive(src):
+                self.all_pdb += list_archive(src)
             elif os.path.isfile(src):
                 self.all_pdb.append(src)
 
@@ -152,18 +362,31 @@ class DataGenerator(object):
         for src in self.pdb_native:
             if os.path.isdir(src):
                 self.all_native += [os.path.join(src, fname)
-                                    for fname in os.listdir(src)]
-            if os.path.isfile(src):
+                                    for fname in self.source_catalog.list(src)]
+            elif is_archive(src):
+                self.all_native += list_archive(src)
+            elif os.path.isfile(src):
                 self.all_native.append(src)
 
+        # index the conformations and natives by file name
+        self.pdb_index = FileIndex(self.all_pdb)
+        self.native_index = FileIndex(self.all_native)
+
         # filter the cplx if required
         if self.pdb_select:
             for i in self.pdb_select:
-                self.pdb_path += list(filter(lambda x: i in x,
-                                             self.all_pdb))
+                self.pdb_path += self._find_files(i, self.pdb_index)
         else:
             self.pdb_path = self.all_pdb
 
+    def __getstate__(self):
+        """Exclude the open hdf5 file and the MPI communicator
+        when the instance is sent to the worker processes."""
+        state = self.__dict__.copy()
+        state.pop('f5', None)
+        state['mpi_comm'] = None
+        return state
+
 # ====================================================================================
 #
 #       CREATE THE DATABASE ALL AT ONCE IF ALL OPTIONS ARE GIVEN
@@ -176,7 +399,16 @@ class DataGenerator(object):
             remove_error=True,
             prog_bar=False,
             contact_distance=8.5,
-            random_seed=None):
+            random_seed=None,
+            n_workers=None,
+            resume=False,
+            write_queue_size=None,
+            mpi_chunk_size=1,
+            mpi_merge='link',
+            prescreen=None,
+            min_contact_atoms=1,
+            timeout=None,
+            max_memory=None):
         """Create the hdf5 file architecture and compute the features/targets.
 
         Args:
@@ -185,6 +417,48 @@ class DataGenerator(object):
             prog_bar (bool, optional): use tqdm
             contact_distance (float): contact distance cutoff, defaults to 8.5Å
             random_seed (int): random seed for getting rotation axis and angle
+            n_workers (int, optional): number of local processes computing
+                the features/targets of the molecules. The hdf5 file is
+                written by the calling process only. Defaults to None,
+                i.e. serial run.
+            resume (bool, optional): keep a journal of the completed
+                molecules in the file <hdf5>.journal and, if the hdf5 file
+                already exists, only compute the molecules that are not
+                in the journal. Half-written molecules are recomputed.
+                Defaults to False.
+            write_queue_size (int, optional): write the molecules in the
+                hdf5 file in a background thread while the next ones are
+                computed, with at most write_queue_size molecules waiting
+                to be written. Defaults to None, i.e. the molecules are
+                written as they are computed.
+            mpi_chunk_size (int, optional): number of molecules sent at
+                once by rank 0 to a rank asking for work when using MPI.
+                Defaults to 1.
+            mpi_merge (str, optional): how the files of the MPI ranks,
+                i.e. <rank>_<hdf5>, are gathered in the hdf5 file:
+                'link' creates external links to their molecules and
+                keeps them, 'copy' copies their molecules and removes
+                them, None leaves them as they are. Defaults to 'link'.
+            prescreen (str, optional): count the contact atoms of the
+                chains from the coordinates of the pdb files before
+                creating the groups. The molecules with less than
+                min_contact_atoms contact atoms in a chain are listed in
+                self.prescreen_error and skipped ('reject') or still
+                computed ('flag'). The pdb files that the screening can
+                not parse are computed. Defaults to None, i.e. no
+                screening.
+            min_contact_atoms (int, optional): minimum number of atoms of
+                each chain within contact_distance of the other chain.
+                Defaults to 1.
+            timeout (float, optional): compute each molecule in its own
+                process, stopped after timeout seconds. The molecules
+                whose process times out, crashes, raises an exception or
+                exceeds max_memory are added to self.feature_error.
+                n_workers molecules are computed at once. Defaults to
+                None, i.e. no supervision.
+            max_memory (int, optional): compute each molecule in its own
+                process (see timeout) with an address space limited to
+                max_memory bytes. Defaults to None.
 
         Raises:
             ValueError: If creation of the group errored.
@@ -212,12 +486,38 @@ class DataGenerator(object):
         >>>
         >>> #create new files
         >>> database.create_database(prog_bar=True)
+        >>>
+        >>> #or compute the molecules with 8 processes
+        >>> database.create_database(prog_bar=True, n_workers=8)
+        >>>
+        >>> #restart an interrupted run where it stopped
+        >>> database.create_database(prog_bar=True, resume=True)
+        >>>
+        >>> #overlap the computation and the writing of the molecules
+        >>> database.create_database(prog_bar=True, write_queue_size=4)
+        >>>
+        >>> #skip the molecules without interface
+        >>> database.create_database(prog_bar=True, prescreen='reject')
+        >>>
+        >>> #isolate the molecules that hang or crash
+        >>> database.create_database(n_workers=8, timeout=600,
+        >>>                          max_memory=8 * 2**30)
         """
         # check decoy pdb files
         if not self.pdb_path:
             raise ValueError(f"Decoy pdb files not found. Check class "
                              f"parameters 'pdb_source' and 'pdb_select'.")
 
+        if mpi_merge not in ['link', 'copy', None]:
+            raise ValueError(
+                f"mpi_merge must be 'link', 'copy' or None, got {mpi_merge}")
+
+        if prescreen not in ['reject', 'flag', None]:
+            raise ValueError(
+                f"prescreen must be 'reject', 'flag' or None, got {prescreen}")
+        self.prescreen = prescreen
+        self.min_contact_atoms = min_contact_atoms
+
         # deals with the parallelization
         self.local_pdbs = self.pdb_path
 
@@ -228,21 +528,49 @@ class DataGenerator(object):
             size = 1
 
         if size > 1:
-            if rank == 0:
-                pdbs = [self.pdb_path[i::size] for i in range(size)]
-                self.local_pdbs = pdbs[0]
-                # send to other procs
-                for iP in range(1, size):
-                    self.mpi_comm.send(pdbs[iP], dest=iP, tag=11)
-            else:
-                # receive procs
-                self.local_pdbs = self.mpi_comm.recv(source=0, tag=11)
             # change hdf5 name
+            hdf5 = self.hdf5
             h5path, h5name = os.path.split(self.hdf5)
             self.hdf5 = os.path.join(h5path, f"{rank:03d}_{h5name}")
+            shards = [os.path.join(h5path, f"{r:03d}_{h5name}")
+                      for r in range(size)]
+
+        # journal of the completed molecules
+        self.journal = None
+        if resume:
+            self.journal = self.hdf5 + '.journal'
+            if not os.path.isfile(self.hdf5) and os.path.isfile(self.journal):
+                os.remove(self.journal)
+
+        # start the local workers, or the supervisor forking the
+        # supervised ones, before opening the file so that they don't
+        # inherit its handle
+        pool = None
+        if timeout is not None or max_memory is not None:
+            pool = SupervisedPool(
+                n_workers or 1, initializer=_init_worker,
+                initargs=(self, config.PATH_PSSM_SOURCE),
+                timeout=timeout, max_memory=max_memory,
+                on_error=self._get_failed_mol_group)
+        elif n_workers is not None and n_workers > 1:
+            pool = multiprocessing.Pool(
+                n_workers, initializer=_init_worker,
+                initargs=(self, config.PATH_PSSM_SOURCE))
 
         # open the file
-        self.f5 = h5py.File(self.hdf5, 'w')
+        completed = set()
+        if self.journal is not None and os.path.isfile(self.hdf5):
+            self.f5 = h5py.File(self.hdf5, 'a')
+            completed = self._resume_from_journal()
+        else:
+            self.f5 = h5py.File(self.hdf5, 'w')
+
+        # the molecules are handed out by rank 0 on request
+        if size > 1:
+            if rank == 0 and resume and mpi_merge == 'copy':
+                # molecules already gathered by a previous run
+                completed.update(self._read_journal(hdf5 + '.journal'))
+            self.local_pdbs = self._get_mpi_pdbs(completed, mpi_chunk_size)
 
         # set metadata to hdf5 file
         self.f5.attrs['DeepRank_version'] = deeprank.__version__
@@ -268,244 +596,24 @@ class DataGenerator(object):
         cplx_tqdm = tqdm(self.local_pdbs, desc=desc,
                          disable=not prog_bar)
 
-        for cplx in cplx_tqdm:
-
-            cplx_tqdm.set_postfix(mol=os.path.basename(cplx))
-            self.logger.info(f'\nProcessing PDB file: {cplx}')
-
-            # names of the molecule
-            mol_name = os.path.splitext(os.path.basename(cplx))[0]
-            mol_aug_name_list = []
-
-            try:
-
-                ################################################
-                #   get the pdbs of the conformation and its ref
-                #   for the original data (not augmetned one)
-                ################################################
-
-                if verbose:
-                    self.logger.info(
-                        f'\nMolecule: {mol_name}.'
-                        f'\nStart generating top HDF5 group "{mol_name}"...'
-                        f'\n{"":4s}Reading PDB data into database...')
-
-                # get the bare name of the molecule
-                # and define the name of the native
-                # i.e. 1AK4_100w -> 1AK4
-                bare_mol_name = mol_name.split('_')[0]
-                ref_name = bare_mol_name + '.pdb'
-
-                # check if we have a decoy or native
-                # and find the reference
-                if mol_name == bare_mol_name:
-                    ref = cplx
-                else:
-                    if len(self.all_native) > 0:
-                        ref = list(
-                            filter(lambda x: ref_name in x, self.all_native))
-                        if len(ref) == 0:
-                            raise ValueError('Native not found')
-                        else:
-                            if len(ref) > 1:
-                                warnings.warn(
-                                    f'Multiple native reference found, here used {ref[0]}')
-                            ref = ref[0]
-                        if ref == '':
-                            ref = None
-                    else:
-                        ref = None
-
-                # crete a subgroup for the molecule
-                molgrp = self.f5.require_group(mol_name)
-                molgrp.attrs['type'] = 'molecule'
-
-                # add the ref and the complex
-                self._add_pdb(molgrp, cplx, 'complex')
-                if ref is not None:
-                    self._add_pdb(molgrp, ref, 'native')
-
-                if verbose:
-                    self.logger.info(
-                        f'{"":4s}Generated subgroup "complex"'
-                        f' to store pdb data of the current model.')
-                    if ref:
-                        self.logger.info(
-                            f'{"":4s}Generated subgroup "native"'
-                            f' to store pdb data of the reference molecule.')
-
-                ################################################
-                #   add the features
-                ################################################
-                feature_error_flag = False  # when False: success; when True: failed
-
-                if self.compute_features is not None:
-                    if verbose:
-                        self.logger.info(
-                            f'{"":4s}Calculating features...')
-
-                    molgrp.require_group('features')
-                    molgrp.require_group('features_raw')
-
-                    feature_error_flag = self._compute_features(self.compute_features,
-                                                                molgrp['complex'][(
-                                                                )],
-                                                                molgrp['features'],
-                                                                molgrp['features_raw'],
-                                                                self.chain1,
-                                                                self.chain2,
-                                                                self.logger)
-                    if feature_error_flag:
-                        self.feature_error += [mol_name]
-                        # ignore the targets/grid/augmentation computation
-                        # and directly go to next molecule. Remove errored
-                        # molecule later.
-                        # Otherwise, keep computing and report errored mol.
-                        if remove_error:
-                            continue
-
-                    if verbose:
-                        if not feature_error_flag or not remove_error:
-                            self.logger.info(
-                                f'\n{"":4s}Generated subgroup "features"'
-                                f' to store xyz-based feature values.'
-                                f'{"":4s}Generated subgroup "features_raw"'
-                                f' to store human read feature values')
-
-                ################################################
-                #   add the targets
-                ################################################
-                if self.compute_targets is not None:
-                    if verbose:
-                        self.logger.info(
-                            f'{"":4s}Calculating targets...')
-
-                    molgrp.require_group('targets')
-
-                    self._compute_targets(self.compute_targets,
-                                          molgrp['complex'][()],
-                                          molgrp['targets'])
-
-                    if verbose:
-                        self.logger.info(
-                            f'{"":4s}Generated subgroup "targets" '
-                            f'to store targets, such as BIN_CLASS, dockQ, etc.')
-
-                ################################################
-                #   add the box center
-                ################################################
-                if verbose:
-                    self.logger.info(
-                        f'{"":4s}Calculating grid box center...')
-
-                grid_error_flag = False
-                molgrp.require_group('grid_points')
-
-                try:
-                    center = self._get_grid_center(
-                        molgrp['complex'][()], contact_distance)
-                    molgrp['grid_points'].create_dataset(
-                        'center', data=center)
-                    if verbose:
-                        self.logger.info(
-                            f'{"":4s}Generated subgroup "grid_points"'
-                            f' to store grid box center.')
-                except ValueError as ex:
-                    grid_error_flag = True
-                    self.grid_error += [mol_name]
-                    self.logger.exception(ex)
-                    if remove_error:
-                        continue
-
-                ################################################
-                #   DATA AUGMENTATION
-                ################################################
-
-                # GET ALL THE NAMES
-                if self.data_augmentation is not None:
-                    mol_aug_name_list = [
-                        mol_name +
-                        '_r%03d' %
-                        (idir +
-                         1) for idir in range(
-                            self.data_augmentation)]
-                else:
-                    mol_aug_name_list = []
-
-                if verbose and mol_aug_name_list:
-                    self.logger.info(
-                        f'{"":2s}Start augmenting data'
-                        f' with {self.data_augmentation} times...')
-
-                # loop over the complexes
-                for mol_aug_name in mol_aug_name_list:
+        # the pool gets the pdbs by batches when they are sent by rank 0
+        batch_size = len(self.pdb_path)
+        if size > 1 and pool is not None:
+            batch_size = (n_workers or 1) * mpi_chunk_size
 
-                    # crete a subgroup for the molecule
-                    molgrp = self.f5.require_group(mol_aug_name)
-                    molgrp.attrs['type'] = 'molecule'
+        writer = None
+        if write_queue_size is not None:
+            writer = HDF5Writer(write_queue_size)
 
-                    # copy the ref into it
-                    if ref is not None:
-                        self._add_pdb(molgrp, ref, 'native')
-
-                    # get the rotation axis and angle
-                    if self.align is None:
-                        axis, angle = pdb2sql.transform.get_rot_axis_angle(
-                            random_seed)
-                    else:
-                        axis, angle = self._get_aligned_rotation_axis_angle(random_seed,
-                                                                            self.align)
-
-                    # create the new pdb and get molecule center
-                    # molecule center is the origin of rotation)
-                    mol_center = self._add_aug_pdb(
-                        molgrp, cplx, 'complex', axis, angle)
-
-                    # copy the targets/features
-                    if 'targets' in self.f5[mol_name]:
-                        self.f5.copy(mol_name + '/targets/', molgrp)
-                    self.f5.copy(mol_name + '/features/', molgrp)
-
-                    # rotate the feature
-                    self._rotate_feature(
-                        molgrp, axis, angle, mol_center)
-
-                    # grid center used to create grid box
-                    molgrp.require_group('grid_points')
-                    center = pdb2sql.transform.rot_xyz_around_axis(
-                        self.f5[mol_name + '/grid_points/center'],
-                        axis, angle, mol_center)
-
-                    molgrp['grid_points'].create_dataset(
-                        'center', data=center)
-
-                    # store the rotation axis/angl/center as attriutes
-                    # in case we need them later
-                    molgrp.attrs['axis'] = axis
-                    molgrp.attrs['angle'] = angle
-                    molgrp.attrs['center'] = mol_center
-
-                # cache aug mols if original mol has errored features
-                if feature_error_flag:
-                    self.feature_error += mol_aug_name_list
-                if grid_error_flag:
-                    self.grid_error += mol_aug_name_list
-
-                if verbose and mol_aug_name_list:
-                    self.logger.info(
-                        f'{"":2s}Completed data augmentation'
-                        f' and generated top HDF5 groups, e.g. {mol_aug_name}.')
-
-                ################################################
-                # Successul message
-                ################################################
-                if verbose:
-                    self.logger.info(
-                        f'\nSuccessfully generated top HDF5 group "{mol_name}".\n')
-
-            # all other errors
-            except BaseException:
-                raise
+        try:
+            self._create_all_mol_groups(cplx_tqdm, pool, batch_size, writer,
+                                        verbose, remove_error,
+                                        contact_distance, random_seed)
+        finally:
+            if writer is not None:
+                writer.close()
+            if pool is not None:
+                pool.terminate()
 
         ##################################################
         # Post processing
@@ -515,7 +623,9 @@ class DataGenerator(object):
         if errored_mol:
             if remove_error:
                 for mol in errored_mol:
-                    del self.f5[mol]
+                    # already removed by a previous run when resuming
+                    if mol in self.f5:
+                        del self.f5[mol]
                 if self.feature_error:
                     self.logger.info(
                         f'Molecules with errored features are removed:'
@@ -534,10 +644,884 @@ class DataGenerator(object):
                         f'The following molecules have errored grid points:'
                         f'\n{self.grid_error}')
 
+        if self.prescreen_error:
+            self.logger.warning(
+                f'Molecules with less than {min_contact_atoms} contact '
+                f'atoms ({"skipped" if prescreen == "reject" else "kept"}):'
+                f'\n{self.prescreen_error}')
+
+        self._report_timing(self.f5)
+
         # close the file
         self.f5.close()
         self.logger.info(
             f'\n# Successfully created database: {self.hdf5}\n')
+        if self.feature_cache is not None:
+            self.logger.info(
+                f'Feature cache: {self.feature_cache.stats()}')
+
+        # gather the files of the ranks in a single one
+        if size > 1 and mpi_merge is not None:
+            self.mpi_comm.Barrier()
+            if rank == 0:
+                self._merge_hdf5(hdf5, shards, mpi_merge,
+                                 journal=resume)
+                self.logger.info(
+                    f'\n# Gathered the files of the MPI ranks in: {hdf5}\n')
+            self.mpi_comm.Barrier()
+            if mpi_merge == 'copy':
+                self.hdf5 = hdf5
+
+    def _create_all_mol_groups(self, cplx_tqdm, pool, batch_size, writer,
+                               verbose, remove_error, contact_distance,
+                               random_seed):
+        """Create the groups of all the local molecules and their
+        augmented copies."""
+
+        for mol_data in self._iter_mol_groups(
+                cplx_tqdm, pool, batch_size, writer is not None, verbose,
+                remove_error, contact_distance):
+            if writer is None:
+                self._write_mol_group(*mol_data, remove_error,
+                                      random_seed, verbose)
+            else:
+                writer.submit(self._write_mol_group, *mol_data,
+                              remove_error, random_seed, verbose)
+
+    def _write_mol_group(self, cplx, mol_name, ref, image,
+                         feature_error_flag, grid_error_flag,
+                         remove_error, random_seed, verbose):
+        """Store a computed molecule and create its augmented copies.
+
+        Args:
+            cplx (str): pdb file of the conformation
+            mol_name (str): name of the molecule
+            ref (str): pdb file of the native or None
+            image (bytes): image of the in-memory HDF5 file containing
+                the group of the molecule or None if already in self.f5
+                or if its computation failed
+            feature_error_flag (bool): the features errored
+            grid_error_flag (bool): the grid center errored
+            remove_error (bool): skip the augmentation of errored molecules
+            random_seed (int): random seed for getting rotation axis and angle
+            verbose (bool): print creation details
+        """
+
+        if image is not None:
+            with _time_stage(self.timer, mol_name, 'write'):
+                with h5py.File(io.BytesIO(image), 'r') as f5mol:
+                    self._copy_mol_image(f5mol[mol_name], ref)
+
+            # times of the stages computed by a worker
+            molgrp = self.f5[mol_name]
+            if 'timing' in molgrp.attrs:
+                if self.timer is not None:
+                    self.timer.update(
+                        mol_name, json.loads(molgrp.attrs['timing']))
+                del molgrp.attrs['timing']
+
+        if feature_error_flag:
+            self.feature_error += [mol_name]
+        if grid_error_flag:
+            self.grid_error += [mol_name]
+
+        # the augmentation is ignored for errored molecules
+        # which are removed later.
+        # Otherwise, keep computing and report errored mol.
+        mol_aug_name_list = []
+        if not (remove_error and (feature_error_flag or grid_error_flag)) \
+                and mol_name in self.f5:
+
+            ################################################
+            #   DATA AUGMENTATION
+            ################################################
+            with _time_stage(self.timer, mol_name, 'augmentation'):
+                mol_aug_name_list = self._augment_mol_group(
+                    mol_name, cplx, ref, random_seed, verbose)
+
+            # cache aug mols if original mol has errored features
+            if feature_error_flag:
+                self.feature_error += mol_aug_name_list
+            if grid_error_flag:
+                self.grid_error += mol_aug_name_list
+
+            ################################################
+            # Successul message
+            ################################################
+            if verbose:
+                self.logger.info(
+                    f'\nSuccessfully generated top HDF5 group "{mol_name}".\n')
+
+        if self.journal is not None:
+            self._add_to_journal(mol_name, mol_aug_name_list,
+                                 feature_error_flag, grid_error_flag)
+
+    def _copy_mol_image(self, imgrp, ref):
+        """Copy the group of a molecule computed in another file.
+
+        The native is linked to the one already stored in self.f5
+        instead of being copied again.
+
+        Args:
+            imgrp (h5py.Group): group of the molecule in the image
+            ref (str): pdb file of the native or None
+        """
+        path = self.native_paths.get(ref)
+        if path is not None and path not in self.f5:
+            path = None
+        self._copy_mol_group(imgrp, self.f5, path)
+        if path is None and 'native' in imgrp:
+            self.native_paths[ref] = imgrp.name + '/native'
+
+    @staticmethod
+    def _copy_mol_group(molgrp, f5, native_path=None):
+        """Copy the group of a molecule in another file.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            f5 (h5py.File): destination file
+            native_path (str, optional): path of a native of f5 linked
+                instead of copying the native of the molecule.
+                Defaults to None.
+        """
+        native = molgrp.get('native', getlink=True)
+        if native_path is None or not isinstance(native, h5py.HardLink):
+            molgrp.file.copy(molgrp, f5)
+            return
+
+        newgrp = f5.create_group(molgrp.name)
+        for key, value in molgrp.attrs.items():
+            newgrp.attrs[key] = value
+        for name in molgrp:
+            link = molgrp.get(name, getlink=True)
+            if name == 'native':
+                newgrp[name] = f5[native_path]
+            elif isinstance(link, h5py.HardLink):
+                molgrp.file.copy(molgrp[name], newgrp)
+            else:
+                newgrp[name] = link
+
+    def _add_to_journal(self, mol_name, mol_aug_name_list,
+                        feature_error_flag, grid_error_flag):
+        """Record a completed molecule in the journal.
+
+        The hdf5 file is flushed first so that a molecule in the journal
+        is always entirely written on disk.
+
+        Args:
+            mol_name (str): name of the molecule
+            mol_aug_name_list (list(str)): names of its augmented copies
+            feature_error_flag (bool): the features errored
+            grid_error_flag (bool): the grid center errored
+        """
+        self.f5.flush()
+        entry = {'name': mol_name,
+                 'augmented': mol_aug_name_list,
+                 'feature_error': bool(feature_error_flag),
+                 'grid_error': bool(grid_error_flag)}
+        with open(self.journal, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _read_journal(journal):
+        """Read the entries of a journal.
+
+        Args:
+            journal (str): journal file
+
+        Returns:
+            dict: {molecule name: entry}
+        """
+        entries = {}
+        if os.path.isfile(journal):
+            with open(journal) as f:
+                for line in f:
+                    # the last line may be truncated by a crash
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry['name']] = entry
+        return entries
+
+    def _resume_from_journal(self):
+        """Skip the molecules of the journal and remove the half-written ones.
+
+        The molecules recorded in the journal are removed from
+        self.local_pdbs and their errors are added to self.feature_error
+        and self.grid_error. The groups of self.f5 that are not in the
+        journal are deleted to be computed again. The natives of the
+        molecules kept are recorded in self.native_paths to be linked
+        by the next molecules.
+
+        Returns:
+            set(str): names of the molecules of the journal
+        """
+
+        entries = self._read_journal(self.journal)
+
+        # a molecule written without error must still be in the file
+        entries = {name: entry for name, entry in entries.items()
+                   if entry['feature_error'] or entry['grid_error']
+                   or name in self.f5}
+
+        # rewrite the journal without the truncated/obsolete entries
+        with open(self.journal, 'w') as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry) + '\n')
+
+        completed = set()
+        for name, entry in entries.items():
+            completed.add(name)
+            completed.update(entry['augmented'])
+            if entry['feature_error']:
+                self.feature_error += [name] + entry['augmented']
+            if entry['grid_error']:
+                self.grid_error += [name] + entry['augmented']
+
+        # remove the half-written molecules
+        for name in list(self.f5.keys()):
+            if name not in completed:
+                del self.f5[name]
+
+        # the next molecules link the natives already stored
+        pdbs = {pdb_name(cplx): cplx for cplx in self.local_pdbs}
+        for name in entries:
+            if name not in pdbs or name not in self.f5 or \
+                    'native' not in self.f5[name]:
+                continue
+            try:
+                ref = self._get_native(pdbs[name], name)
+            except ValueError:
+                continue
+            self.native_paths.setdefault(ref, self.f5[name]['native'].name)
+
+        self.local_pdbs = [
+            cplx for cplx in self.local_pdbs
+            if pdb_name(cplx) not in entries]
+
+        self.logger.info(
+            f'\n# Resume {self.hdf5}: {len(entries)} molecules already '
+            f'completed, {len(self.local_pdbs)} left')
+
+        return set(entries)
+
+    def _get_mpi_pdbs(self, completed, chunk_size):
+        """Get the pdbs computed by this MPI rank.
+
+        Rank 0 splits the pdbs in chunks and sends them to the ranks
+        asking for work, from a thread so that the requests are answered
+        while it computes its own chunks. Without thread support in MPI,
+        rank 0 only hands out the chunks, or answers the pending requests
+        before each of its pdbs if there is a single other rank. The
+        other ranks ask for a new chunk once they have computed the
+        previous one.
+
+        Args:
+            completed (set(str)): molecules already computed by this rank
+            chunk_size (int): number of pdbs sent at once
+
+        Yields:
+            str: pdb file
+        """
+        from mpi4py import MPI
+
+        comm = self.mpi_comm
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+
+        def name(cplx):
+            return pdb_name(cplx)
+
+        # all the ranks must know what is left to compute
+        completed = comm.gather(completed, root=0)
+
+        if rank != 0:
+            while True:
+                comm.send(rank, dest=0, tag=12)
+                chunk = comm.recv(source=0, tag=11)
+                if not chunk:
+                    return
+                yield from chunk
+
+        completed = set().union(*completed)
+        pdbs = [cplx for cplx in self.pdb_path if name(cplx) not in completed]
+        chunks = deque(pdbs[i:i + chunk_size]
+                       for i in range(0, len(pdbs), chunk_size))
+        lock = threading.Lock()
+
+        def next_chunk():
+            with lock:
+                return chunks.popleft() if chunks else []
+
+        def serve():
+            """Answer the requests until each rank got an empty chunk."""
+            nworking = size - 1
+            while nworking > 0:
+                # polled so that waiting does not keep a core busy
+                while not comm.Iprobe(source=MPI.ANY_SOURCE, tag=12):
+                    time.sleep(0.01)
+                dest = comm.recv(source=MPI.ANY_SOURCE, tag=12)
+                chunk = next_chunk()
+                comm.send(chunk, dest=dest, tag=11)
+                if not chunk:
+                    nworking -= 1
+
+        if MPI.Query_thread() >= MPI.THREAD_SERIALIZED:
+            # this thread makes no MPI call until the server is joined,
+            # i.e. until all the ranks are done
+            server = threading.Thread(target=serve, daemon=True)
+            server.start()
+            try:
+                for chunk in iter(next_chunk, []):
+                    yield from chunk
+            finally:
+                server.join()
+            return
+
+        if size > 2:
+            serve()
+            return
+
+        local_chunk = deque()
+        nworking = size - 1
+        while chunks or local_chunk or nworking > 0:
+
+            # answer the pending requests or wait for the last ones
+            while nworking > 0 and (
+                    not (chunks or local_chunk) or
+                    comm.Iprobe(source=MPI.ANY_SOURCE, tag=12)):
+                dest = comm.recv(source=MPI.ANY_SOURCE, tag=12)
+                chunk = chunks.popleft() if chunks else []
+                comm.send(chunk, dest=dest, tag=11)
+                if not chunk:
+                    nworking -= 1
+
+            if not local_chunk and chunks:
+                local_chunk.extend(chunks.popleft())
+            if local_chunk:
+                yield local_chunk.popleft()
+
+    @staticmethod
+    def _merge_hdf5(hdf5, shards, mode='link', journal=False):
+        """Gather the molecules of several hdf5 files in a single one.
+
+        Args:
+            hdf5 (str): output hdf5 file
+            shards (list(str)): hdf5 files to gather
+            mode (str, optional): 'link' creates external links to the
+                molecules of the shards, 'copy' copies them and removes
+                the shards. Defaults to 'link'.
+            journal (bool, optional): gather the journals of the shards
+                in <hdf5>.journal when copying. Defaults to False.
+
+        Example:
+            >>> DataGenerator._merge_hdf5(
+            >>>     '1ak4.hdf5', ['000_1ak4.hdf5', '001_1ak4.hdf5'], 'copy')
+        """
+
+        shards = [f for f in shards if os.path.isfile(f)]
+
+        # molecules gathered by a previous run are kept when copying
+        if mode == 'copy' and journal and os.path.isfile(hdf5):
+            f5 = h5py.File(hdf5, 'a')
+        else:
+            f5 = h5py.File(hdf5, 'w')
+
+        # path of the copied natives indexed by their pdb data
+        natives = {}
+
+        for shard in shards:
+            with h5py.File(shard, 'r') as f5shard:
+                for key, value in f5shard.attrs.items():
+                    f5.attrs[key] = value
+                for name in f5shard:
+                    if name in f5:
+                        del f5[name]
+                    if mode == 'link':
+                        # relative path resolved from the directory of hdf5
+                        f5[name] = h5py.ExternalLink(
+                            os.path.relpath(shard, os.path.dirname(
+                                os.path.abspath(hdf5))), name)
+                    elif 'native' in f5shard[name]:
+                        # the natives shared by the shards are copied once
+                        data = read_pdb_data(
+                            f5shard[name + '/native']).tobytes()
+                        path = natives.get(data)
+                        if path is not None and path not in f5:
+                            path = None
+                        DataGenerator._copy_mol_group(
+                            f5shard[name], f5, path)
+                        if path is None:
+                            natives[data] = name + '/native'
+                    else:
+                        f5shard.copy(name, f5)
+        f5.close()
+
+        if mode == 'copy':
+            for shard in shards:
+                if journal and os.path.isfile(shard + '.journal'):
+                    with open(shard + '.journal') as fin, \
+                            open(hdf5 + '.journal', 'a') as fout:
+                        fout.write(fin.read())
+                    os.remove(shard + '.journal')
+                os.remove(shard)
+
+    def _iter_mol_groups(self, cplx_tqdm, pool, batch_size, in_memory,
+                         verbose, remove_error, contact_distance):
+        """Create the top HDF5 group of each conformation.
+
+        The groups are computed in the order of self.local_pdbs.
+        With a process pool or in_memory, the groups are computed in
+        in-memory HDF5 files whose images are copied to self.f5 by
+        _write_mol_group, so that this process remains the only one
+        writing in the output file. Otherwise they are directly
+        written in self.f5.
+
+        Args:
+            cplx_tqdm (tqdm): progress bar over self.local_pdbs
+            pool (multiprocessing.Pool): worker processes or None
+            batch_size (int): number of pdbs sent at once to the pool
+            in_memory (bool): compute the groups in in-memory files
+            verbose (bool): print creation details
+            remove_error (bool): skip the targets/grid of errored molecules
+            contact_distance (float): contact distance cutoff
+
+        Yields:
+            tuple: pdb file, molecule name, native file, file image or
+                None, feature error flag, grid error flag
+        """
+
+        # the pdbs are screened by this thread before being computed
+        pdbs = self._prescreen_pdbs(cplx_tqdm, contact_distance)
+
+        if pool is None and not in_memory:
+            for cplx in pdbs:
+                cplx_tqdm.set_postfix(mol=os.path.basename(cplx))
+                self.logger.info(f'\nProcessing PDB file: {cplx}')
+                mol_name = pdb_name(cplx)
+                ref, feature_error_flag, grid_error_flag = \
+                    self._create_mol_group(
+                        self.f5, cplx, mol_name, verbose,
+                        remove_error, contact_distance)
+                yield (cplx, mol_name, ref, None,
+                       feature_error_flag, grid_error_flag)
+            return
+
+        if pool is None:
+            for cplx in pdbs:
+                cplx_tqdm.set_postfix(mol=os.path.basename(cplx))
+                self.logger.info(f'\nProcessing PDB file: {cplx}')
+                yield (cplx,) + self._create_mol_group_image(
+                    cplx, verbose, remove_error, contact_distance)
+            return
+
+        compute = partial(_create_mol_group_worker, verbose=verbose,
+                          remove_error=remove_error,
+                          contact_distance=contact_distance)
+
+        # the pdbs are only read by this thread
+        # as they may be received from MPI rank 0
+        while True:
+            batch = list(itertools.islice(pdbs, batch_size))
+            if not batch:
+                break
+            # imap returns the results in the order of the pdbs so that
+            # the file has the same content as the one of a serial run
+            for cplx, result in zip(batch, pool.imap(compute, batch)):
+                cplx_tqdm.set_postfix(mol=os.path.basename(cplx))
+                self.logger.info(f'\nProcessing PDB file: {cplx}')
+                yield (cplx,) + result
+
+    def _prescreen_pdbs(self, pdbs, contact_distance):
+        """Screen the interface of the pdbs before computing them.
+
+        Args:
+            pdbs (iterable(str)): pdb files
+            contact_distance (float): contact distance cutoff
+
+        Yields:
+            str: pdb files to compute
+        """
+        for cplx in pdbs:
+            if self.prescreen is not None:
+                try:
+                    ncontacts = count_contact_atoms(
+                        cplx, self.chain1, self.chain2, contact_distance)
+                except (OSError, ValueError) as e:
+                    # left to pdb2sql which reports the error if any
+                    self.logger.warning(
+                        f'\n{pdb_name(cplx)}: not screened, {e}')
+                    yield cplx
+                    continue
+                if min(ncontacts) < self.min_contact_atoms:
+                    mol_name = pdb_name(cplx)
+                    self.prescreen_error += [mol_name]
+                    self.logger.info(
+                        f'\n{mol_name}: {ncontacts} contact atoms')
+                    if self.prescreen == 'reject':
+                        continue
+            yield cplx
+
+    def _create_mol_group_image(self, cplx, verbose, remove_error,
+                                contact_distance):
+        """Create the group of a conformation in an in-memory HDF5 file.
+
+        Args:
+            cplx (str): pdb file of the conformation
+            verbose (bool): print creation details
+            remove_error (bool): skip targets/grid if the features errored
+            contact_distance (float): contact distance cutoff
+
+        Returns:
+            tuple: molecule name, native file, file image,
+                feature error flag, grid error flag
+        """
+        mol_name = pdb_name(cplx)
+        f5 = h5py.File(mol_name + '.hdf5', 'w',
+                       driver='core', backing_store=False)
+        ref, feature_error_flag, grid_error_flag = self._create_mol_group(
+            f5, cplx, mol_name, verbose, remove_error, contact_distance)
+
+        # the times of the stages are sent with the molecule
+        if self.timer is not None:
+            f5[mol_name].attrs['timing'] = json.dumps(
+                self.timer.pop(mol_name))
+        f5.flush()
+        image = f5.id.get_file_image()
+        f5.close()
+        return mol_name, ref, image, feature_error_flag, grid_error_flag
+
+    def _get_failed_mol_group(self, cplx, reason):
+        """Report a molecule whose supervised process failed.
+
+        Args:
+            cplx (str): pdb file of the conformation
+            reason (str): reason of the failure
+
+        Returns:
+            tuple: molecule name, native file, file image,
+                feature error flag, grid error flag
+        """
+        mol_name = pdb_name(cplx)
+        self.logger.error(f'\n{mol_name} failed: {reason}')
+        return mol_name, None, None, True, False
+
+    def _get_native(self, cplx, mol_name):
+        """Find the native conformation of a molecule.
+
+        Args:
+            cplx (str): pdb file of the conformation
+            mol_name (str): name of the molecule
+
+        Raises:
+            ValueError: If the native is not found
+
+        Returns:
+            str: pdb file of the native or None
+        """
+
+        # get the bare name of the molecule
+        # and define the name of the native
+        # i.e. 1AK4_100w -> 1AK4
+        bare_mol_name = mol_name.split('_')[0]
+        ref_name = bare_mol_name + '.pdb'
+
+        # check if we have a decoy or native
+        # and find the reference
+        if mol_name == bare_mol_name:
+            ref = cplx
+        else:
+            if len(self.all_native) > 0:
+                ref = self._find_files(ref_name, self.native_index)
+                if len(ref) == 0:
+                    raise ValueError('Native not found')
+                else:
+                    if len(ref) > 1:
+                        warnings.warn(
+                            f'Multiple native reference found, here used {ref[0]}')
+                    ref = ref[0]
+                if ref == '':
+                    ref = None
+            else:
+                ref = None
+
+        return ref
+
+    def _create_mol_group(self, f5, cplx, mol_name, verbose,
+                          remove_error, contact_distance):
+        """Create the group of a conformation with its pdbs, features,
+        targets and grid center.
+
+        Args:
+            f5 (h5py.File): file where to create the group
+            cplx (str): pdb file of the conformation
+            mol_name (str): name of the group
+            verbose (bool): print creation details
+            remove_error (bool): skip targets/grid if the features errored
+            contact_distance (float): contact distance cutoff
+
+        Returns:
+            tuple: native file, feature error flag, grid error flag
+        """
+
+        ################################################
+        #   get the pdbs of the conformation and its ref
+        #   for the original data (not augmetned one)
+        ################################################
+
+        if verbose:
+            self.logger.info(
+                f'\nMolecule: {mol_name}.'
+                f'\nStart generating top HDF5 group "{mol_name}"...'
+                f'\n{"":4s}Reading PDB data into database...')
+
+        ref = self._get_native(cplx, mol_name)
+
+        # crete a subgroup for the molecule
+        molgrp = f5.require_group(mol_name)
+        molgrp.attrs['type'] = 'molecule'
+
+        # add the ref and the complex
+        with _time_stage(self.timer, mol_name, 'ingest'):
+            self._add_pdb(molgrp, cplx, 'complex')
+            if ref is not None:
+                self._add_native(molgrp, ref)
+
+        if verbose:
+            self.logger.info(
+                f'{"":4s}Generated subgroup "complex"'
+                f' to store pdb data of the current model.')
+            if ref:
+                self.logger.info(
+                    f'{"":4s}Generated subgroup "native"'
+                    f' to store pdb data of the reference molecule.')
+
+        # the structure is parsed once for all the features/targets
+        with StructureContext(read_structure(molgrp['complex']),
+                              self.chain1, self.chain2) as structure:
+            feature_error_flag, grid_error_flag = self._compute_mol_data(
+                molgrp, structure, verbose, remove_error, contact_distance)
+
+        return ref, feature_error_flag, grid_error_flag
+
+    def _compute_mol_data(self, molgrp, structure, verbose,
+                          remove_error, contact_distance):
+        """Compute the features, targets and grid center of a molecule.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            structure (StructureContext): structure of the molecule
+            verbose (bool): print creation details
+            remove_error (bool): skip targets/grid if the features errored
+            contact_distance (float): contact distance cutoff
+
+        Returns:
+            tuple: feature error flag, grid error flag
+        """
+
+        ################################################
+        #   add the features
+        ################################################
+        feature_error_flag = False  # when False: success; when True: failed
+
+        if self.compute_features is not None:
+            if verbose:
+                self.logger.info(
+                    f'{"":4s}Calculating features...')
+
+            molgrp.require_group('features')
+            featgrp_raw = self._require_raw_group(molgrp)
+
+            feature_error_flag = self._compute_features(self.compute_features,
+                                                        structure.pdb_data,
+                                                        molgrp['features'],
+                                                        featgrp_raw,
+                                                        self.chain1,
+                                                        self.chain2,
+                                                        self.logger,
+                                                        structure,
+                                                        self.feature_cache,
+                                                        self.timer)
+            # ignore the targets/grid computation of errored molecule
+            if feature_error_flag and remove_error:
+                return feature_error_flag, False
+
+            if verbose:
+                self.logger.info(
+                    f'\n{"":4s}Generated subgroup "features"'
+                    f' to store xyz-based feature values.')
+                if self.raw_format is not None:
+                    self.logger.info(
+                        f'{"":4s}Generated subgroup "features_raw"'
+                        f' to store human read feature values')
+
+        ################################################
+        #   add the targets
+        ################################################
+        if self.compute_targets is not None:
+            if verbose:
+                self.logger.info(
+                    f'{"":4s}Calculating targets...')
+
+            molgrp.require_group('targets')
+
+            self._compute_targets(self.compute_targets,
+                                  structure.pdb_data,
+                                  molgrp['targets'],
+                                  structure,
+                                  self.timer)
+
+            if verbose:
+                self.logger.info(
+                    f'{"":4s}Generated subgroup "targets" '
+                    f'to store targets, such as BIN_CLASS, dockQ, etc.')
+
+        ################################################
+        #   add the box center
+        ################################################
+        if verbose:
+            self.logger.info(
+                f'{"":4s}Calculating grid box center...')
+
+        grid_error_flag = False
+        molgrp.require_group('grid_points')
+
+        try:
+            with _time_stage(self.timer, molgrp.name.lstrip('/'),
+                             'grid_center'):
+                center = self._get_grid_center(structure, contact_distance)
+            molgrp['grid_points'].create_dataset(
+                'center', data=center)
+            if verbose:
+                self.logger.info(
+                    f'{"":4s}Generated subgroup "grid_points"'
+                    f' to store grid box center.')
+        except ValueError as ex:
+            grid_error_flag = True
+            self.logger.exception(ex)
+
+        return feature_error_flag, grid_error_flag
+
+    def _require_raw_group(self, molgrp):
+        """Get the group of the human readable features of a molecule.
+
+        The group is created in self.raw_format if needed.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+
+        Returns:
+            h5py.Group: group features_raw or None if not stored
+        """
+        if 'features_raw' in molgrp:
+            return molgrp['features_raw']
+        if self.raw_format is None:
+            return None
+        grp = molgrp.create_group('features_raw')
+        if self.raw_format != 'text':
+            grp.attrs['format'] = self.raw_format
+        return grp
+
+    def _augment_mol_group(self, mol_name, cplx, ref, random_seed, verbose):
+        """Create the rotated copies of a molecule group.
+
+        Args:
+            mol_name (str): name of the original group
+            cplx (str): pdb file of the conformation
+            ref (str): pdb file of the native or None
+            random_seed (int): random seed for getting rotation axis and angle
+            verbose (bool): print creation details
+
+        Returns:
+            list(str): names of the augmented groups
+        """
+
+        # GET ALL THE NAMES
+        if self.data_augmentation is not None:
+            mol_aug_name_list = [
+                mol_name +
+                '_r%03d' %
+                (idir +
+                 1) for idir in range(
+                    self.data_augmentation)]
+        else:
+            mol_aug_name_list = []
+
+        if verbose and mol_aug_name_list:
+            self.logger.info(
+                f'{"":2s}Start augmenting data'
+                f' with {self.data_augmentation} times...')
+
+        # loop over the complexes
+        src_center = None
+        for mol_aug_name in mol_aug_name_list:
+
+            # crete a subgroup for the molecule
+            molgrp = self.f5.require_group(mol_aug_name)
+            molgrp.attrs['type'] = 'molecule'
+
+            # get the rotation axis and angle
+            if self.align is None:
+                axis, angle = pdb2sql.transform.get_rot_axis_angle(
+                    random_seed)
+            else:
+                axis, angle = self._get_aligned_rotation_axis_angle(random_seed,
+                                                                    self.align)
+
+            if self.virtual_augmentation:
+
+                # only link the data of the original
+                # the rotation is applied when reading it
+                if src_center is None:
+                    src_center = self._get_mol_center(
+                        read_pdb_data(self.f5[mol_name + '/complex']))
+                mol_center = src_center
+                self._add_virtual_aug(self.f5, molgrp, mol_name)
+
+            else:
+
+                # link the ref into it
+                if ref is not None:
+                    self._add_native(molgrp, ref)
+
+                # create the new pdb and get molecule center
+                # molecule center is the origin of rotation)
+                mol_center = self._add_aug_pdb(
+                    molgrp, cplx, 'complex', axis, angle)
+
+                # copy the targets/features
+                if 'targets' in self.f5[mol_name]:
+                    self.f5.copy(mol_name + '/targets/', molgrp)
+                self.f5.copy(mol_name + '/features/', molgrp)
+
+                # rotate the feature
+                self._rotate_feature(
+                    molgrp, axis, angle, mol_center)
+
+            # grid center used to create grid box
+            molgrp.require_group('grid_points')
+            center = pdb2sql.transform.rot_xyz_around_axis(
+                self.f5[mol_name + '/grid_points/center'],
+                axis, angle, mol_center)
+
+            molgrp['grid_points'].create_dataset(
+                'center', data=center)
+
+            # store the rotation axis/angl/center as attriutes
+            # in case we need them later
+            molgrp.attrs['axis'] = axis
+            molgrp.attrs['angle'] = angle
+            molgrp.attrs['center'] = mol_center
+
+        if verbose and mol_aug_name_list:
+            self.logger.info(
+                f'{"":2s}Completed data augmentation'
+                f' and generated top HDF5 groups, e.g. {mol_aug_name}.')
+
+        return mol_aug_name_list
 
     def aug_data(self, augmentation, keep_existing_aug=True, random_seed=None):
         """Augment exiting original PDB data and features.
@@ -595,16 +1579,13 @@ class DataGenerator(object):
                 range(aug_id_start, aug_id_start + augmentation)]
 
             # loop over the complexes
+            src_center = None
             for mol_aug_name in mol_aug_name_list:
 
                 # crete a subgroup for the molecule
                 molgrp = f5.require_group(mol_aug_name)
                 molgrp.attrs['type'] = 'molecule'
 
-                # copy the ref into it
-                if 'native' in f5[mol_name]:
-                    f5.copy(mol_name + '/native', molgrp)
-
                 # get the rotation axis and angle
                 if self.align is None:
                     axis, angle = pdb2sql.transform.get_rot_axis_angle(
@@ -613,18 +1594,34 @@ class DataGenerator(object):
                     axis, angle = self._get_aligned_rotation_axis_angle(random_seed,
                                                                         self.align)
 
-                # create the new pdb and get molecule center
-                # molecule center is the origin of rotation)
-                mol_center = self._add_aug_pdb(
-                    molgrp, f5[mol_name + '/complex'][()], 'complex', axis, angle)
+                if self.virtual_augmentation:
 
-                # copy the targets/features
-                if 'targets' in f5[mol_name]:
-                    f5.copy(mol_name + '/targets/', molgrp)
-                f5.copy(mol_name + '/features/', molgrp)
+                    # only link the data of the original
+                    if src_center is None:
+                        src_center = self._get_mol_center(
+                            read_pdb_data(f5[mol_name + '/complex']))
+                    mol_center = src_center
+                    self._add_virtual_aug(f5, molgrp, mol_name)
 
-                # rotate the feature
-                self._rotate_feature(molgrp, axis, angle, mol_center)
+                else:
+
+                    # link the ref into it
+                    if 'native' in f5[mol_name]:
+                        molgrp['native'] = f5[mol_name + '/native']
+
+                    # create the new pdb and get molecule center
+                    # molecule center is the origin of rotation)
+                    mol_center = self._add_aug_pdb(
+                        molgrp, read_pdb_data(f5[mol_name + '/complex']),
+                        'complex', axis, angle)
+
+                    # copy the targets/features
+                    if 'targets' in f5[mol_name]:
+                        f5.copy(mol_name + '/targets/', molgrp)
+                    f5.copy(mol_name + '/features/', molgrp)
+
+                    # rotate the feature
+                    self._rotate_feature(molgrp, axis, angle, mol_center)
 
                 # grid center used to create grid box
                 molgrp.require_group('grid_points')
@@ -650,12 +1647,20 @@ class DataGenerator(object):
 #
 # ====================================================================================
 
-    def add_feature(self, remove_error=True, prog_bar=True):
+    def add_feature(self, remove_error=True, prog_bar=True, n_workers=None):
         """Add a feature to an existing hdf5 file.
 
+        Only the features of self.compute_features that are missing
+        from a molecule are computed. The molecules can be computed by
+        a pool of worker processes, the results being written in the
+        file by the calling process only. self.hdf5 can also be a list
+        of files, whose molecules are then computed by the same pool.
+
         Args:
             remove_error (bool): remove errored molecule
             prog_bar (bool, optional): use tqdm
+            n_workers (int, optional): number of worker processes.
+                Defaults to None (serial).
 
         Example:
 
@@ -668,55 +1673,42 @@ class DataGenerator(object):
         >>> database.add_feature(remove_error=True, prog_bar=True)
         """
 
-        # check if file exists
-        if not os.path.isfile(self.hdf5):
-            raise FileNotFoundError(
-                'File %s does not exists' % self.hdf5)
-
-        # get the folder names
-        f5 = h5py.File(self.hdf5, 'a')
-        fnames = f5.keys()
-
-        # get the non rotated ones
-        fnames_original = list(
-            filter(lambda x: not re.search(r'_r\d+$', x), fnames))
-
-        # get the rotated ones
-        fnames_augmented = list(
-            filter(lambda x: re.search(r'_r\d+$', x), fnames))
-
         # check feature_error
         if not self.feature_error:
             self.feature_error = []
 
-        # computes the features of the original
+        def get_task(molgrp):
+            if self.compute_features is None or \
+                    re.search(r'_r\d+$', molgrp.name):
+                return None
+            done = self._get_computed_modules(molgrp, 'features')
+            missing = [f for f in self.compute_features if f not in done]
+            if not missing:
+                return None
+            return {'features': missing, 'done': done}
+
         desc = '{:25s}'.format('Add features')
-        for cplx_name in tqdm(
-                fnames_original,
-                desc=desc,
-                ncols=100,
-                disable=not prog_bar):
+        self._update_hdf5(get_task, self._finalize_add_feature,
+                          n_workers, prog_bar, desc,
+                          remove_error=remove_error)
 
-            # molgrp
-            molgrp = f5[cplx_name]
+        if self.feature_cache is not None:
+            self.logger.info(
+                f'Feature cache: {self.feature_cache.stats()}')
 
-            error_flag = False
-            if self.compute_features is not None:
+    def _finalize_add_feature(self, f5, feature_error, remove_error):
+        """Copy the new features to the augmented molecules of a file
+        and remove the errored molecules.
 
-                # the internal features
-                molgrp.require_group('features')
-                molgrp.require_group('features_raw')
-
-                error_flag = self._compute_features(self.compute_features,
-                                                    molgrp['complex'][()],
-                                                    molgrp['features'],
-                                                    molgrp['features_raw'],
-                                                    self.chain1,
-                                                    self.chain2,
-                                                    self.logger)
+        Args:
+            f5 (h5py.File): updated file
+            feature_error (list(str)): molecules with errored features
+            remove_error (bool): remove errored molecule
+        """
 
-                if error_flag:
-                    self.feature_error += [cplx_name]
+        # get the rotated ones
+        fnames_augmented = list(
+            filter(lambda x: re.search(r'_r\d+$', x), f5.keys()))
 
         # copy the data from the original to the augmented
         for cplx_name in fnames_augmented:
@@ -724,9 +1716,15 @@ class DataGenerator(object):
             # group of the molecule
             aug_molgrp = f5[cplx_name]
 
+            # the virtual groups link the data of the source
+            if is_virtual(aug_molgrp):
+                continue
+
             # get the source group
-            mol_name = re.split(r'_r\d+', molgrp.name)[0]
+            mol_name = re.split(r'_r\d+', cplx_name)[0]
             src_molgrp = f5[mol_name]
+            if 'features' not in src_molgrp:
+                continue
 
             # get the rotation parameters
             axis = aug_molgrp.attrs['axis']
@@ -734,12 +1732,12 @@ class DataGenerator(object):
             center = aug_molgrp.attrs['center']
 
             # copy the features to the augmented
-            for k in molgrp['features']:
+            aug_molgrp.require_group('features')
+            for k in src_molgrp['features']:
                 if k not in aug_molgrp['features']:
 
                     # copy
                     data = src_molgrp['features/' + k][()]
-                    aug_molgrp.require_group('features')
                     aug_molgrp.create_dataset(
                         "features/" + k, data=data)
 
@@ -749,26 +1747,31 @@ class DataGenerator(object):
 
         # find errored augmented molecules
         tmp_aug_error = []
-        for mol in self.feature_error:
+        for mol in feature_error:
             tmp_aug_error += list(filter(lambda x: mol in x,
                                          fnames_augmented))
-        self.feature_error += tmp_aug_error
+        feature_error = feature_error + tmp_aug_error
+        self.feature_error += feature_error
 
         #  Remove errored molecules
-        if self.feature_error:
+        if feature_error:
             if remove_error:
-                for mol in self.feature_error:
+                for mol in feature_error:
                     del f5[mol]
                 self.logger.info(
                     f'Molecules with errored features are removed:\n'
-                    f'{self.feature_error}')
+                    f'{feature_error}')
             else:
                 self.logger.warning(
                     f"The following molecules has errored features:\n"
-                    f'{self.feature_error}')
+                    f'{feature_error}')
 
-        # close the file
-        f5.close()
+        # the file lists all the features computed in its molecules
+        if self.compute_features is None:
+            return
+        features = list(f5.attrs.get('features', []))
+        features += [f for f in self.compute_features if f not in features]
+        f5.attrs['features'] = features
 
 # ====================================================================================
 #
@@ -801,11 +1804,17 @@ class DataGenerator(object):
                 targrp.create_dataset(name, data=np.array([value]))
         f5.close()
 
-    def add_target(self, prog_bar=False):
+    def add_target(self, prog_bar=False, n_workers=None):
         """Add a target to an existing hdf5 file.
 
+        Only the targets of self.compute_targets that are missing from a
+        molecule are computed, in parallel if n_workers is given (see
+        add_feature). self.hdf5 can also be a list of files.
+
         Args:
             prog_bar (bool, optional): Use tqdm
+            n_workers (int, optional): number of worker processes.
+                Defaults to None (serial).
 
         Example:
 
@@ -818,64 +1827,70 @@ class DataGenerator(object):
         >>> database.add_target(prog_bar=True)
         """
 
-        # check if file exists
-        if not os.path.isfile(self.hdf5):
-            raise FileNotFoundError(
-                'File %s does not exists' % self.hdf5)
-
-        # name of the hdf5 file
-        f5 = h5py.File(self.hdf5, 'a')
-
-        # get the folder names
-        fnames = f5.keys()
-
-        # get the non rotated ones
-        fnames_original = list(
-            filter(lambda x: not re.search(r'_r\d+$', x), fnames))
-        fnames_augmented = list(
-            filter(lambda x: re.search(r'_r\d+$', x), fnames))
+        def get_task(molgrp):
+            if self.compute_targets is None or \
+                    re.search(r'_r\d+$', molgrp.name):
+                return None
+            done = self._get_computed_modules(molgrp, 'targets')
+            missing = [t for t in self.compute_targets if t not in done]
+            if not missing:
+                return None
+            return {'targets': missing, 'done': done}
 
-        # compute the targets  of the original
         desc = '{:25s}'.format('Add targets')
+        self._update_hdf5(get_task, self._finalize_add_target,
+                          n_workers, prog_bar, desc)
 
-        for cplx_name in tqdm(fnames_original, desc=desc,
-                              ncols=100, disable=not prog_bar):
-
-            # group of the molecule
-            molgrp = f5[cplx_name]
-
-            # add the targets
-            if self.compute_targets is not None:
+    def _finalize_add_target(self, f5, feature_error):
+        """Copy the new targets to the augmented molecules of a file.
 
-                molgrp.require_group('targets')
-                self._compute_targets(self.compute_targets,
-                                      molgrp['complex'][()],
-                                      molgrp['targets'])
+        Args:
+            f5 (h5py.File): updated file
+            feature_error (list(str)): not used
+        """
 
         # copy the targets of the original to the rotated
-        for cplx_name in fnames_augmented:
+        for cplx_name in f5.keys():
+
+            if not re.search(r'_r\d+$', cplx_name):
+                continue
 
             # group of the molecule
             aug_molgrp = f5[cplx_name]
 
+            # the virtual groups link the data of the source
+            if is_virtual(aug_molgrp):
+                continue
+
             # get the source group
-            mol_name = re.split(r'_r\d+', molgrp.name)[0]
+            mol_name = re.split(r'_r\d+', cplx_name)[0]
             src_molgrp = f5[mol_name]
+            if 'targets' not in src_molgrp:
+                continue
 
             # copy the targets to the augmented
-            for k in molgrp['targets']:
+            aug_molgrp.require_group('targets')
+            for k in src_molgrp['targets']:
                 if k not in aug_molgrp['targets']:
                     data = src_molgrp['targets/' + k][()]
-                    aug_molgrp.require_group('targets')
                     aug_molgrp.create_dataset(
                         "targets/" + k, data=data)
 
-        # close the file
-        f5.close()
+        # the file lists all the targets computed in its molecules
+        if self.compute_targets is None:
+            return
+        targets = list(f5.attrs.get('targets', []))
+        targets += [t for t in self.compute_targets if t not in targets]
+        f5.attrs['targets'] = targets
 
-    def realign_complexes(self, align, compute_features=None, pssm_source=None):
+    def realign_complexes(self, align, compute_features=None, pssm_source=None,
+                          n_workers=None):
         """Align all the complexes already present in the HDF5.
 
+        The features of the aligned complexes are recomputed, in
+        parallel if n_workers is given (see add_feature). self.hdf5 can
+        also be a list of files.
+
         Arguments:
             align {dict} -- alignement dictionary (see __init__)
 
@@ -885,6 +1900,7 @@ class DataGenerator(object):
                                        the attrs['features'] of the file (if present)
              pssm_source {str} -- path of the pssm files. If None the source specfied in
                                   the attrs['pssm_source'] will be used (if present) (default: {None})
+            n_workers {int} -- number of worker processes (default: {None})
 
         Raises:
             ValueError: If no PSSM detected
@@ -899,17 +1915,19 @@ class DataGenerator(object):
         >>>                           pssm_source='./1ak4_pssm/')
         """
 
-        f5 = h5py.File(self.hdf5, 'a')
+        # the attributes of the first file are used for all the files
+        files = self._get_hdf5_files()
+        with h5py.File(files[0], 'r') as f5:
+            attrs = dict(f5.attrs)
 
-        mol_names = f5.keys()
         self.logger.info(
             f'\n# Start aligning the HDF5 database: {self.hdf5}')
 
         # deal with the features
         if self.compute_features is None:
             if compute_features is None:
-                if 'features' in f5.attrs:
-                    self.compute_features = list(f5.attrs['features'])
+                if 'features' in attrs:
+                    self.compute_features = list(attrs['features'])
             else:
                 self.compute_features = compute_features
 
@@ -920,24 +1938,255 @@ class DataGenerator(object):
         elif pssm_source is not None:
             config.PATH_PSSM_SOURCE = pssm_source
 
-        elif 'pssm_source' in f5.attrs:
-            config.PATH_PSSM_SOURCE = f5.attrs['pssm_source']
+        elif 'pssm_source' in attrs:
+            config.PATH_PSSM_SOURCE = attrs['pssm_source']
         else:
             raise ValueError('No pssm source detected')
 
-        # loop over the complexes
-        desc = '{:25s}'.format('Add features')
-        for mol in tqdm(mol_names, desc=desc, ncols=100):
+        # the virtual groups link the complex and features of
+        # their source which are realigned in place
+        def get_task(molgrp):
+            if is_virtual(molgrp):
+                return None
+            return {'align': align, 'features': self.compute_features or [],
+                    'done': []}
+
+        desc = '{:25s}'.format('Realign complexes')
+        self._update_hdf5(get_task, self._finalize_realign,
+                          n_workers, True, desc)
 
-            # align the pdb
+    def _finalize_realign(self, f5, feature_error):
+        """Update the virtual molecules of a realigned file.
+
+        Args:
+            f5 (h5py.File): updated file
+            feature_error (list(str)): not used
+        """
+        for mol in f5.keys():
             molgrp = f5[mol]
-            pdb = molgrp['complex'][()]
+            if is_virtual(molgrp):
+                if 'mapped_features' in molgrp:
+                    del molgrp['mapped_features']
+                molgrp.attrs['center'] = self._get_mol_center(
+                    read_pdb_data(molgrp['complex']))
+
+# ====================================================================================
+#
+#       UPDATE THE MOLECULES OF EXISTING DATASETS
+#
+# ====================================================================================
+
+    def _get_hdf5_files(self):
+        """Get the list of the existing hdf5 files to update.
+
+        Raises:
+            FileNotFoundError: if a file does not exist
+
+        Returns:
+            list(str): self.hdf5 as a list
+        """
+        files = self.hdf5
+        if isinstance(files, str):
+            files = [files]
+        for fname in files:
+            if not os.path.isfile(fname):
+                raise FileNotFoundError(
+                    'File %s does not exists' % fname)
+        return list(files)
+
+    @staticmethod
+    def _get_computed_modules(molgrp, name):
+        """Get the feature or target modules already computed for a molecule.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            name (str): 'features' or 'targets'
+
+        Returns:
+            list(str): names of the modules
+        """
+        if name in molgrp and 'modules' in molgrp[name].attrs:
+            return list(molgrp[name].attrs['modules'])
+
+        # the groups of older files do not list their modules
+        return list(molgrp.file.attrs.get(name, []))
+
+    @staticmethod
+    def _add_computed_module(grp, module):
+        """Record a module computed in the features or targets group."""
+        modules = list(grp.attrs.get('modules', []))
+        if module not in modules:
+            grp.attrs['modules'] = modules + [module]
+
+    def _update_hdf5(self, get_task, finalize, n_workers, prog_bar, desc,
+                     **kwargs):
+        """Update the molecules of the hdf5 files.
+
+        The molecules of all the files are streamed to a pool of worker
+        processes that compute them in in-memory files. The files are
+        only opened by this process, which writes the results in the
+        order of the molecules so that the files are identical to the
+        ones of a serial run. Each file is finalized and closed as soon
+        as all its molecules are written.
 
-            sqldb = self._get_aligned_sqldb(pdb, align)
-            data = sqldb.sql2pdb()
+        Args:
+            get_task (callable): function returning the task of a
+                molecule group (see _update_mol_group) or None
+            finalize (callable): function called with the file and its
+                molecules with errored features once they are written
+            n_workers (int): number of worker processes or None
+            prog_bar (bool): use tqdm
+            desc (str): description of the progress bar
+            **kwargs: keyword arguments of finalize
+        """
+
+        files = self._get_hdf5_files()
+        mols = []
+        for fname in files:
+            with h5py.File(fname, 'r') as f5:
+                mols += [(fname, mol) for mol in f5]
+
+        remaining = {fname: 0 for fname in files}
+        for fname, _ in mols:
+            remaining[fname] += 1
+        feature_error = {fname: [] for fname in files}
+
+        pool = None
+        batch_size = 1
+        if n_workers is not None and n_workers > 1:
+            pool = multiprocessing.Pool(
+                n_workers, initializer=_init_worker,
+                initargs=(self, config.PATH_PSSM_SOURCE))
+            batch_size = 4 * n_workers
+
+        opened = {}
+
+        def close(fname):
+            if fname in opened:
+                f5 = opened.pop(fname)
+            else:
+                f5 = h5py.File(fname, 'a')
+            with f5:
+                finalize(f5, feature_error[fname], **kwargs)
+
+        try:
+            # the files without molecule are only finalized
+            for fname in files:
+                if remaining[fname] == 0:
+                    close(fname)
+
+            mol_iter = iter(tqdm(mols, desc=desc, ncols=100,
+                                 disable=not prog_bar))
+            while True:
+                batch = list(itertools.islice(mol_iter, batch_size))
+                if not batch:
+                    break
+
+                tasks = []
+                for fname, mol in batch:
+                    if fname not in opened:
+                        opened[fname] = h5py.File(fname, 'a')
+                    tasks.append(get_task(opened[fname][mol]))
+
+                if pool is None:
+                    results = [None] * len(batch)
+                else:
+                    args = [self._get_update_inputs(opened[fname][mol], task)
+                            if task is not None else None
+                            for (fname, mol), task in zip(batch, tasks)]
+                    results = pool.imap(_update_mol_group_worker, args)
+
+                for (fname, mol), task, image in zip(batch, tasks, results):
+                    if task is not None:
+                        molgrp = opened[fname][mol]
+                        if image is None:
+                            error_flag = self._update_mol_group(molgrp, task)
+                        else:
+                            error_flag = self._copy_mol_update(
+                                molgrp, task, *image)
+                        if error_flag:
+                            feature_error[fname] += [mol]
+
+                    remaining[fname] -= 1
+                    if remaining[fname] == 0:
+                        close(fname)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            for f5 in opened.values():
+                f5.close()
+
+    @staticmethod
+    def _get_update_inputs(molgrp, task):
+        """Read the data of a molecule needed by a worker.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            task (dict): task of the molecule
+
+        Returns:
+            tuple: molecule name, task, complex, native or None
+        """
+        native = None
+        if task.get('targets') and 'native' in molgrp:
+            native = read_pdb_data(molgrp['native'])
+        return (molgrp.name.lstrip('/'), task,
+                read_structure(molgrp['complex']), native)
+
+    def _update_mol_group_image(self, mol_name, task, complex_data,
+                                native):
+        """Update a molecule in an in-memory HDF5 file.
 
-            data = np.array(data).astype('|S78')
-            molgrp['complex'][...] = data
+        Args:
+            mol_name (str): name of the molecule
+            task (dict): task of the molecule
+            complex_data (dict or np.array): columns or pdb lines
+            native (np.array): pdb lines of the native or None
+
+        Returns:
+            tuple: file image, feature error flag
+        """
+        f5 = h5py.File(mol_name + '.hdf5', 'w',
+                       driver='core', backing_store=False)
+        molgrp = f5.create_group(mol_name)
+        if isinstance(complex_data, dict):
+            write_columns(molgrp, 'complex', complex_data)
+        else:
+            molgrp.create_dataset('complex', data=complex_data)
+        if native is not None:
+            molgrp.create_dataset('native', data=native)
+
+        error_flag = self._update_mol_group(molgrp, task)
+        f5.flush()
+        image = f5.id.get_file_image()
+        f5.close()
+        return image, error_flag
+
+    def _update_mol_group(self, molgrp, task):
+        """Align a molecule and compute its features and targets.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            task (dict): task of the molecule with the keys
+                'align' (dict): alignement dictionary, if any
+                'features' (list(str)): features to compute, if any
+                'targets' (list(str)): targets to compute, if any
+                'done' (list(str)): features/targets already computed
+
+        Returns:
+            bool: feature error flag
+        """
+        if task.get('align') is not None:
+
+            # align the pdb in the format it is stored
+            structure_format = 'columnar' if is_columnar(
+                molgrp['complex']) else 'pdb'
+            pdb = read_pdb_data(molgrp['complex'])
+
+            sqldb = self._get_aligned_sqldb(pdb, task['align'])
+            del molgrp['complex']
+            self._write_structure(molgrp, 'complex', sqldb, structure_format)
 
             # remove prexisting features
             old_dir = ['features', 'features_raw', 'mapped_features']
@@ -945,20 +2194,71 @@ class DataGenerator(object):
                 if od in molgrp:
                     del molgrp[od]
 
-            # the internal features
-            molgrp.require_group('features')
-            molgrp.require_group('features_raw')
+        error_flag = False
+        with StructureContext(read_structure(molgrp['complex']), self.chain1,
+                              self.chain2) as structure:
 
-            # compute features
-            error_flag = self._compute_features(self.compute_features,
-                                                molgrp['complex'][()],
-                                                molgrp['features'],
-                                                molgrp['features_raw'],
-                                                self.chain1,
-                                                self.chain2,
-                                                self.logger)
+            if task.get('features'):
+                molgrp.require_group('features')
+                molgrp['features'].attrs['modules'] = task['done']
+                featgrp_raw = self._require_raw_group(molgrp)
+                error_flag = self._compute_features(task['features'],
+                                                    structure.pdb_data,
+                                                    molgrp['features'],
+                                                    featgrp_raw,
+                                                    self.chain1,
+                                                    self.chain2,
+                                                    self.logger,
+                                                    structure,
+                                                    self.feature_cache,
+                                                    self.timer)
 
-        f5.close()
+            if task.get('targets'):
+                molgrp.require_group('targets')
+                molgrp['targets'].attrs['modules'] = task['done']
+                self._compute_targets(task['targets'],
+                                      structure.pdb_data,
+                                      molgrp['targets'],
+                                      structure,
+                                      self.timer)
+
+        return error_flag
+
+    @staticmethod
+    def _copy_mol_update(molgrp, task, image, error_flag):
+        """Copy the data of a molecule updated in an in-memory file.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            task (dict): task of the molecule
+            image (bytes): image of the in-memory file
+            error_flag (bool): feature error flag
+
+        Returns:
+            bool: feature error flag
+        """
+        with h5py.File(io.BytesIO(image), 'r') as f5mol:
+            imgrp = f5mol[molgrp.name]
+
+            if task.get('align') is not None:
+                for name in ['complex', 'features', 'features_raw',
+                             'mapped_features']:
+                    if name in molgrp:
+                        del molgrp[name]
+                f5mol.copy(imgrp['complex'], molgrp)
+
+            for name in ['features', 'features_raw', 'targets']:
+                if name not in imgrp:
+                    continue
+                grp = molgrp.require_group(name)
+                for key, value in imgrp[name].attrs.items():
+                    grp.attrs[key] = value
+                for dset in imgrp[name]:
+                    if dset in grp:
+                        del grp[dset]
+                    f5mol.copy(imgrp[name][dset], grp)
+
+        return error_flag
 
 # ====================================================================================
 #
@@ -967,9 +2267,24 @@ class DataGenerator(object):
 # ====================================================================================
 
     def _get_grid_center(self, pdb, contact_distance):
+        """Get the center of the contact atoms.
+
+        Args:
+            pdb (list(bytes) or StructureContext): pdb data or structure
+            contact_distance (float): contact distance cutoff
+
+        Returns:
+            np.array: center of the contact atoms
+        """
 
-        sqldb = pdb2sql.interface(pdb)
-        contact_atoms = sqldb.get_contact_atoms(cutoff=contact_distance,
+        # the structure memoizes the contacts
+        if isinstance(pdb, StructureContext):
+            sqldb = pdb.sql
+            contacts = pdb
+        else:
+            sqldb = pdb2sql.interface(pdb)
+            contacts = sqldb
+        contact_atoms = contacts.get_contact_atoms(cutoff=contact_distance,
             chain1=self.chain1, chain2=self.chain2)
 
         tmp = []
@@ -980,7 +2295,8 @@ class DataGenerator(object):
         center_contact = np.mean(
             np.array(sqldb.get('x,y,z', rowID=contact_atoms)), 0)
 
-        sqldb._close()
+        if not isinstance(pdb, StructureContext):
+            sqldb._close()
 
         return center_contact
 
@@ -1039,7 +2355,7 @@ class DataGenerator(object):
                      reset=False, use_tmpdir=False,
                      time=False,
                      prog_bar=True, grid_prog_bar=False,
-                     remove_error=True):
+                     remove_error=True, write_queue_size=None):
         """Map the feature on a grid of points centered at the interface.
 
         If features to map are not given, they will be are automatically
@@ -1049,7 +2365,9 @@ class DataGenerator(object):
         Args:
             grid_info (dict): Informaton for the grid.
                 See deeprank.generate.GridTools.py for details.
-            cuda (bool, optional): Use CUDA
+            cuda (bool, optional): Use CUDA. Without CUDA, the grids are
+                mapped by the multi-threaded CPU kernels, see
+                deeprank.tools.cpu_kernel.
             gpu_block (None, optional): GPU block size to be used
             cuda_kernel (str, optional): filename containing CUDA kernel
             cuda_func_name (str, optional): The name of the function in the kernel
@@ -1060,6 +2378,11 @@ class DataGenerator(object):
             prog_bar (bool, optional): use tqdm for each molecule
             grid_prog_bar (bool, optional): use tqdm for each grid
             remove_error (bool, optional): remove the data that errored
+            write_queue_size (int, optional): compress and write the grids
+                in a background thread while the next molecules are
+                mapped, with at most write_queue_size molecules waiting
+                to be written. Defaults to None, i.e. the grids are
+                written as they are mapped.
 
         Example:
 
@@ -1071,6 +2394,7 @@ class DataGenerator(object):
         >>>     'number_of_points': [30,30,30],
         >>>     'resolution': [1.,1.,1.],
         >>>     'atomic_densities': {'C':1.7, 'N':1.55, 'O':1.52, 'S':1.8},
+        >>>     'mapping': 'exact',  # or 'fft', faster for many atoms
         >>> }
         >>>
         >>> database.map_features(grid_info,try_sparse=True,time=False,prog_bar=True)
@@ -1088,6 +2412,12 @@ class DataGenerator(object):
                         'CUDA mapping disabled when using MPI')
                     cuda = False
 
+        # map with the compiled CPU kernels without pycuda
+        if cuda and not _cuda_available:
+            self.logger.warning(
+                'CUDA not available, mapping with the CPU kernels')
+            cuda = False
+
         # name of the hdf5 file
         f5 = h5py.File(self.hdf5, 'a')
 
@@ -1118,6 +2448,15 @@ class DataGenerator(object):
             if m not in grid_info:
                 grid_info[m] = 'ind'
 
+        # evaluate the kernels on the grid points by default
+        if 'mapping' not in grid_info:
+            grid_info['mapping'] = 'exact'
+        if grid_info['mapping'] not in MAPPING_MODES:
+            f5.close()
+            raise ValueError(
+                f"grid_info['mapping'] must be one of {MAPPING_MODES}, "
+                f"got {grid_info['mapping']}")
+
         ################################################################
         #
         ################################################################
@@ -1152,6 +2491,46 @@ class DataGenerator(object):
         if not prog_bar:
             self.logger.info(f'{desc}: {self.hdf5}')
 
+        writer = None
+        if write_queue_size is not None:
+            writer = HDF5Writer(write_queue_size)
+
+        try:
+            self._map_all_features(f5, mol_tqdm, grid_info, grid_info_ref,
+                                   reset, cuda, gpu_block, cuda_func,
+                                   cuda_atomic, time, grid_prog_bar,
+                                   try_sparse, writer)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        # remove the molecule with issues
+        if self.map_error:
+            if remove_error:
+                for mol in self.map_error:
+                    del f5[mol]
+                self.logger.warning(
+                    f"Molecules with errored feature mapping are removed:\n"
+                    f"{self.map_error}")
+            else:
+                self.logger.warning(
+                    f"The following moleclues have errored feature mapping:\n"
+                    f"{self.map_error}")
+
+        self._report_timing(f5)
+
+        # close he hdf5 file
+        f5.close()
+
+    def _map_all_features(self, f5, mol_tqdm, grid_info, grid_info_ref,
+                          reset, cuda, gpu_block, cuda_func, cuda_atomic,
+                          time, grid_prog_bar, try_sparse, writer):
+        """Map the features of all the molecules of the hdf5 file.
+
+        With a writer, the grids of a molecule are kept in memory and
+        written by the writer thread while the next molecule is mapped.
+        """
+
         # loop over the data files
         for mol in mol_tqdm:
             mol_tqdm.set_postfix(mol=mol)
@@ -1183,44 +2562,229 @@ class DataGenerator(object):
 
             try:
                 # compute the data we want on the grid
-                gt.GridTools(
-                    molgrp=f5[mol],
-                    chain1=self.chain1,
-                    chain2=self.chain2,
-                    number_of_points=grid_info['number_of_points'],
-                    resolution=grid_info['resolution'],
-                    atomic_densities=grid_info['atomic_densities'],
-                    atomic_densities_mode=grid_info['atomic_densities_mode'],
-                    feature=grid_info['feature'],
-                    feature_mode=grid_info['feature_mode'],
-                    cuda=cuda,
-                    gpu_block=gpu_block,
-                    cuda_func=cuda_func,
-                    cuda_atomic=cuda_atomic,
-                    time=time,
-                    prog_bar=grid_prog_bar,
-                    try_sparse=try_sparse)
+                with _time_stage(self.timer, mol, 'mapping'):
+                    grid = gt.GridTools(
+                        molgrp=f5[mol],
+                        chain1=self.chain1,
+                        chain2=self.chain2,
+                        number_of_points=grid_info['number_of_points'],
+                        resolution=grid_info['resolution'],
+                        atomic_densities=grid_info['atomic_densities'],
+                        atomic_densities_mode=grid_info['atomic_densities_mode'],
+                        feature=grid_info['feature'],
+                        feature_mode=grid_info['feature_mode'],
+                        cuda=cuda,
+                        gpu_block=gpu_block,
+                        cuda_func=cuda_func,
+                        cuda_atomic=cuda_atomic,
+                        time=time,
+                        prog_bar=grid_prog_bar,
+                        try_sparse=try_sparse,
+                        timer=self.timer,
+                        defer_write=writer is not None,
+                        mapping=grid_info['mapping'])
+
+                if writer is not None:
+                    writer.submit(self._write_grid_data, grid, mol)
 
             except BaseException:
                 self.map_error.append(mol)
                 self.logger.exception(
                     f'Error during the mapping of {mol}')
 
-        # remove the molecule with issues
-        if self.map_error:
-            if remove_error:
-                for mol in self.map_error:
-                    del f5[mol]
-                self.logger.warning(
-                    f"Molecules with errored feature mapping are removed:\n"
-                    f"{self.map_error}")
-            else:
-                self.logger.warning(
-                    f"The following moleclues have errored feature mapping:\n"
-                    f"{self.map_error}")
+    def _report_timing(self, f5):
+        """Log and store the times of the stages of the molecules.
 
-        # close he hdf5 file
-        f5.close()
+        Args:
+            f5 (h5py.File): file of the molecules
+        """
+        if self.timer is None:
+            return
+
+        self.logger.info(
+            f'\nTime of the stages (s) in {self.hdf5}:\n'
+            f'{self.timer.table()}')
+
+        if self.timing == 'attrs':
+            f5.attrs['timing'] = json.dumps(self.timer.summary())
+            for mol, record in list(self.timer.records.items()):
+                if mol not in f5:
+                    continue
+                times = json.loads(f5[mol].attrs.get('timing', '{}'))
+                times.update(record)
+                f5[mol].attrs['timing'] = json.dumps(times)
+
+        elif self.timing == 'json':
+            self.timer.save(self.hdf5 + '.timing.json')
+
+    def _write_grid_data(self, grid, mol):
+        """Write the grid data of a molecule kept in memory.
+
+        Args:
+            grid (GridTools): mapped grid of the molecule
+            mol (str): name of the molecule
+        """
+        try:
+            with _time_stage(self.timer, mol, 'grid_write'):
+                grid.write_pending()
+        except BaseException:
+            self.map_error.append(mol)
+            self.logger.exception(
+                f'Error during the mapping of {mol}')
+
+# ====================================================================================
+#
+#       ESTIMATE THE COST OF THE DATABASE
+#
+# ====================================================================================
+
+    def estimate_cost(self, grid_info=None, n_samples=5, random_seed=None,
+                      try_sparse=True, compression='keep', tmpdir=None,
+                      **kwargs):
+        """Estimate the cost of the database from a sampled dry run.
+
+        A random subset of the conformations is computed with the
+        features, targets and data augmentation of the generator and
+        mapped with grid_info in a temporary file. The wall time and the
+        size of the file are extrapolated to all the conformations. The
+        temporary file is removed and self is not modified.
+
+        The peak memory is the maximum resident memory of this process
+        and of its workers (n_workers) since they started, which may
+        include the memory used before the dry run.
+
+        Args:
+            grid_info (dict, optional): information of the grid, see
+                map_features. Defaults to None, i.e. no mapping.
+            n_samples (int, optional): number of conformations computed.
+                Defaults to 5.
+            random_seed (int, optional): random seed of the sampling
+                and of the data augmentation. Defaults to None.
+            try_sparse (bool, optional): store the grids in sparse format.
+                Defaults to True.
+            compression (str, optional): compression of the file measured,
+                see deeprank.tools.compaction.compact_hdf5.
+                Defaults to 'keep'.
+            tmpdir (str, optional): directory of the temporary file.
+                Defaults to None, i.e. the directory of self.hdf5, so that
+                the writing time is measured on the target file system.
+            **kwargs: arguments of create_database, e.g. n_workers
+
+        Returns:
+            dict: 'n_molecules' and 'n_samples' the number of conformations
+                of the database and of the dry run, 'wall_time' (s),
+                'peak_memory' (bytes) and 'hdf5_size' (bytes) extrapolated
+                to the database, 'wall_time_per_molecule' and
+                'hdf5_size_per_molecule' per conformation (including its
+                augmented copies), 'errors' the molecules that errored in
+                the dry run and 'stages' the extrapolated total time of
+                each stage (s, see StageTimer).
+
+        Raises:
+            ValueError: if no conformation is found
+
+        Example:
+
+        >>> database = DataGenerator(chain1='C', chain2='D',
+        >>>                          pdb_source='./1AK4/decoys/',
+        >>>                          pdb_native='./1AK4/native/',
+        >>>                          compute_features=['deeprank.features.BSA'],
+        >>>                          data_augmentation=10,
+        >>>                          hdf5='1ak4.hdf5')
+        >>> grid_info = {'number_of_points': [30, 30, 30],
+        >>>              'resolution': [1., 1., 1.],
+        >>>              'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52}}
+        >>> cost = database.estimate_cost(grid_info, n_samples=10,
+        >>>                               n_workers=4, compression='lzf')
+        >>> print(cost['wall_time'] / 3600, cost['hdf5_size'] / 2**30)
+        """
+        if not self.pdb_path:
+            raise ValueError(f"Decoy pdb files not found. Check class "
+                             f"parameters 'pdb_source' and 'pdb_select'.")
+
+        n_molecules = len(self.pdb_path)
+        n_samples = min(n_samples, n_molecules)
+        index = np.random.RandomState(random_seed).choice(
+            n_molecules, n_samples, replace=False)
+
+        if tmpdir is None:
+            tmpdir = os.path.dirname(os.path.abspath(self.hdf5))
+        tmpdir = tempfile.mkdtemp(prefix='.deeprank_estimate_', dir=tmpdir)
+
+        # the dry run is made by a copy of the generator with its own
+        # file, errors and timer. The feature cache is not used so that
+        # the features are actually computed
+        sample = copy.copy(self)
+        sample.pdb_path = [self.pdb_path[i] for i in sorted(index)]
+        sample.hdf5 = os.path.join(tmpdir, os.path.basename(self.hdf5))
+        sample.mpi_comm = None
+        sample.feature_cache = None
+        sample.native_paths = {}
+        sample.feature_error = []
+        sample.grid_error = []
+        sample.prescreen_error = []
+        sample.map_error = []
+        sample.timing = 'log'
+        sample.timer = StageTimer()
+
+        self.logger.info(
+            f'\n# Estimate the cost of {self.hdf5} from '
+            f'{n_samples}/{n_molecules} conformations')
+
+        try:
+            t0 = perf_counter()
+            sample.create_database(random_seed=random_seed, **kwargs)
+            if grid_info is not None:
+                with h5py.File(sample.hdf5, 'r') as f5:
+                    empty = len(f5) == 0
+                if not empty:
+                    sample.map_features(copy.deepcopy(grid_info),
+                                        try_sparse=try_sparse,
+                                        prog_bar=False)
+            wall_time = perf_counter() - t0
+
+            compact_hdf5(sample.hdf5, compression=compression)
+            size = os.path.getsize(sample.hdf5)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        # ru_maxrss is in kilobytes on linux and in bytes on macos
+        peak_memory = None
+        if resource is not None:
+            unit = 1 if sys.platform == 'darwin' else 1024
+            peak_memory = unit * max(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+        scale = n_molecules / n_samples
+        cost = {'n_molecules': n_molecules,
+                'n_samples': n_samples,
+                'wall_time': wall_time * scale,
+                'wall_time_per_molecule': wall_time / n_samples,
+                'peak_memory': peak_memory,
+                'hdf5_size': int(size * scale),
+                'hdf5_size_per_molecule': size / n_samples,
+                'errors': sorted(set(sample.feature_error +
+                                     sample.grid_error +
+                                     sample.prescreen_error +
+                                     sample.map_error)),
+                'stages': OrderedDict(
+                    (stage, s['total'] * scale)
+                    for stage, s in sample.timer.summary().items())}
+
+        memory = 'unknown' if peak_memory is None \
+            else f'{peak_memory / 2**20:.0f} MB'
+        self.logger.info(
+            f'\n# Estimated cost of {self.hdf5} '
+            f'({n_molecules} conformations):\n'
+            f'wall time   : {cost["wall_time"]:.0f} s\n'
+            f'peak memory : {memory}\n'
+            f'hdf5 size   : {cost["hdf5_size"] / 2**20:.1f} MB')
+        if cost['errors']:
+            self.logger.warning(
+                f'Molecules errored during the dry run:\n{cost["errors"]}')
+
+        return cost
 
 # ====================================================================================
 #
@@ -1228,7 +2792,8 @@ class DataGenerator(object):
 #
 # ====================================================================================
 
-    def remove(self, feature=True, pdb=True, points=True, grid=False):
+    def remove(self, feature=True, pdb=True, points=True, grid=False,
+               compression='keep'):
         """Remove data from the data set.
 
         Equivalent to the cleandata command line tool. Once the data has been
@@ -1239,6 +2804,12 @@ class DataGenerator(object):
             pdb (bool, optional): Remove the pdbs
             points (bool, optional): remove teh grid points
             grid (bool, optional): remove the maps
+            compression (str, optional): compression of the compacted
+                file, see deeprank.tools.compaction.compact_hdf5.
+                Defaults to 'keep'.
+
+        Returns:
+            int: number of bytes reclaimed
         """
 
         self.logger.debug('Remove features')
@@ -1255,6 +2826,7 @@ class DataGenerator(object):
 
             if feature and 'features' in mol_grp:
                 del mol_grp['features']
+            if feature and 'features_raw' in mol_grp:
                 del mol_grp['features_raw']
             if pdb and 'complex' in mol_grp and 'native' in mol_grp:
                 del mol_grp['complex']
@@ -1267,8 +2839,10 @@ class DataGenerator(object):
         f5.close()
 
         # reclaim the space
-        os.system('h5repack %s _tmp.h5py' % self.hdf5)
-        os.system('mv _tmp.h5py %s' % self.hdf5)
+        reclaimed = compact_hdf5(self.hdf5, compression=compression)
+        self.logger.info(
+            f'Reclaimed {reclaimed} bytes in {self.hdf5}')
+        return reclaimed
 
 
 # ====================================================================================
@@ -1498,14 +3072,40 @@ class DataGenerator(object):
         pdb_name = [name.split()[0] + '.pdb' for name in pdb_name]
 
         # create the filters
+        index = FileIndex(self.pdb_path)
         tmp_path = []
         for name in pdb_name:
-            tmp_path += list(filter(lambda x: name in x,
-                                    self.pdb_path))
+            tmp_path += self._find_files(name, index)
 
         # update the pdb_path
         self.pdb_path = tmp_path
 
+    @staticmethod
+    def _find_files(name, index):
+        """Find the files matching a name.
+
+        Full file names, with or without the .pdb extension, are looked
+        up in the index. Glob patterns, e.g. '1AK4_*w', are matched with
+        the file names. Other names, e.g. '1AK4' for all the
+        conformations of a case, are matched as prefixes of the file
+        names, or as substrings of the paths if no file name starts
+        with them.
+
+        Args:
+            name (str): file name, pattern or part of the path
+            index (FileIndex): index of the files
+
+        Returns:
+            list(str): matching file paths
+        """
+        for key in (name, name + '.pdb'):
+            if key in index:
+                return index[key]
+        if has_wildcards(name):
+            return index.glob(name) or index.glob(name + '.pdb')
+        return index.startswith(name) or \
+            [f for f in index.files if name in f]
+
 
 # ====================================================================================
 #
@@ -1514,7 +3114,8 @@ class DataGenerator(object):
 # ====================================================================================
 
     @staticmethod
-    def _compute_features(feat_list, pdb_data, featgrp, featgrp_raw, chain1, chain2, logger):
+    def _compute_features(feat_list, pdb_data, featgrp, featgrp_raw, chain1, chain2, logger,
+                          structure=None, cache=None, timer=None):
         """Compute the features.
 
         Args:
@@ -1524,25 +3125,99 @@ class DataGenerator(object):
             pdb_data (bytes): PDB translated in bytes
             featgrp (str): name of the group where to store the xyz feature
             featgrp_raw (str): name of the group where to store the raw feature
+                or None
             chain1 (str): First chain ID
             chain2 (str): Second chain ID
             logger (logger): name of logger object
+            structure (StructureContext, optional): structure of the
+                molecule shared by the features accepting a
+                'structure' argument
+            cache (FeatureCache, optional): cache of the features,
+                used when the structure is given
+            timer (StageTimer, optional): timer of the features
 
         Return:
             bool: error happened or not
         """
         error_flag = False  # when False: success; when True: failed
+        mol_name = featgrp.parent.name.lstrip('/')
         for feat in feat_list:
             try:
-                feat_module = importlib.import_module(feat, package=None)
-                feat_module.__compute_feature__(pdb_data, featgrp, featgrp_raw,
-                    chain1, chain2)
+                stage = 'feature:' + feat.split('.')[-1]
+                with _time_stage(timer, mol_name, stage):
+                    DataGenerator._compute_feature(
+                        feat, pdb_data, featgrp, featgrp_raw, chain1,
+                        chain2, structure, cache)
+
             except Exception as ex:
                 logger.exception(ex)
                 error_flag = True
 
         return error_flag
 
+    @staticmethod
+    def _compute_feature(feat, pdb_data, featgrp, featgrp_raw, chain1, chain2,
+                         structure, cache):
+        """Compute the features of a module (see _compute_features)."""
+        feat_module = importlib.import_module(feat, package=None)
+        kwargs = _structure_kwargs(
+            feat_module.__compute_feature__, structure)
+
+        if cache is None or structure is None:
+            feat_module.__compute_feature__(pdb_data, featgrp, featgrp_raw,
+                                            chain1, chain2, **kwargs)
+        else:
+            # only compute the features missing from the cache
+            key = cache.get_key(
+                structure, featgrp, chain1, chain2, feat_module,
+                _get_raw_format(featgrp_raw))
+            if not cache.load(key, featgrp, featgrp_raw):
+                DataGenerator._compute_cached_feature(
+                    feat_module, key, cache, pdb_data, featgrp,
+                    featgrp_raw, chain1, chain2, **kwargs)
+
+        # add_feature only computes the modules not listed
+        DataGenerator._add_computed_module(featgrp, feat)
+
+    @staticmethod
+    def _compute_cached_feature(feat_module, key, cache, pdb_data, featgrp,
+                                featgrp_raw, chain1, chain2, **kwargs):
+        """Compute a feature, store it in the cache and in the molecule.
+
+        The feature is computed in an in-memory file whose groups have
+        the names of the groups of the molecule.
+
+        Args:
+            feat_module (module): feature module
+            key (str): key of the cache entry
+            cache (FeatureCache): cache of the features
+            pdb_data (bytes): PDB translated in bytes
+            featgrp (h5py.Group): group where to store the xyz feature
+            featgrp_raw (h5py.Group): group where to store the raw feature
+                or None
+            chain1 (str): First chain ID
+            chain2 (str): Second chain ID
+            **kwargs: keyword arguments of the feature function
+        """
+        with h5py.File(key + '.hdf5', 'w', driver='core',
+                       backing_store=False) as f5:
+            grp = f5.create_group(featgrp.name)
+            grp_raw = None
+            if featgrp_raw is not None:
+                grp_raw = f5.create_group(featgrp_raw.name)
+                grp_raw.attrs.update(featgrp_raw.attrs)
+            feat_module.__compute_feature__(pdb_data, grp, grp_raw,
+                                            chain1, chain2, **kwargs)
+            cache.store(key, grp, grp_raw)
+
+            for src, dest in [(grp, featgrp), (grp_raw, featgrp_raw)]:
+                if src is None:
+                    continue
+                for name in src:
+                    if name in dest:
+                        del dest[name]
+                    f5.copy(src[name], dest)
+
 
 # ====================================================================================
 #
@@ -1551,18 +3226,28 @@ class DataGenerator(object):
 # ====================================================================================
 
     @staticmethod
-    def _compute_targets(targ_list, pdb_data, targrp):
+    def _compute_targets(targ_list, pdb_data, targrp, structure=None,
+                         timer=None):
         """Compute the targets.
 
         Args:
             targ_list (list(str)): list of function name
             pdb_data (bytes): PDB translated in btes
             targrp (str): name of the group where to store the targets
-            logger (logger): name of logger object
+            structure (StructureContext, optional): structure of the
+                molecule shared by the targets accepting a
+                'structure' argument
+            timer (StageTimer, optional): timer of the targets
         """
+        mol_name = targrp.parent.name.lstrip('/')
         for targ in targ_list:
             targ_module = importlib.import_module(targ, package=None)
-            targ_module.__compute_target__(pdb_data, targrp)
+            kwargs = _structure_kwargs(
+                targ_module.__compute_target__, structure)
+            stage = 'target:' + targ.split('.')[-1]
+            with _time_stage(timer, mol_name, stage):
+                targ_module.__compute_target__(pdb_data, targrp, **kwargs)
+            DataGenerator._add_computed_module(targrp, targ)
 
 
 # ====================================================================================
@@ -1577,14 +3262,23 @@ class DataGenerator(object):
 
         Args:
             molgrp (str): mopl group where tp add the pdb
-            pdbfile (str): psb file to add
+            pdbfile (str): psb file to add, .pdb.gz file or member of
+                an archive (see deeprank.tools.archives)
             name (str): dataset name in the hdf5 molgroup
         """
 
         # no alignement
         if self.align is None:
+
+            # the columns are extracted from the database
+            if self.structure_format == 'columnar':
+                sqldb = pdb2sql.pdb2sql(load_pdb(pdbfile))
+                self._write_structure(molgrp, name, sqldb)
+                sqldb._close()
+                return
+
             # read the pdb and extract the ATOM lines
-            with open(pdbfile, 'r') as fi:
+            with open_pdb(pdbfile) as fi:
                 data = [line.split('\n')[0]
                         for line in fi if line.startswith('ATOM')]
 
@@ -1592,13 +3286,51 @@ class DataGenerator(object):
         elif isinstance(self.align, dict):
 
             sqldb = self._get_aligned_sqldb(pdbfile, self.align)
-            data = sqldb.sql2pdb()
+            self._write_structure(molgrp, name, sqldb)
+            return
 
         #  PDB default line length is 80
         #  http://www.wwpdb.org/documentation/file-format
         data = np.array(data).astype('|S78')
         molgrp.create_dataset(name, data=data)
 
+    def _write_structure(self, molgrp, name, sqldb, structure_format=None):
+        """Store the structure of a database in a molgrp.
+
+        Args:
+            molgrp (h5py.Group): group where to add the structure
+            sqldb (pdb2sql.pdb2sql): database of the structure
+            name (str): dataset name in the hdf5 molgroup
+            structure_format (str, optional): 'pdb' or 'columnar'.
+                Defaults to self.structure_format.
+        """
+        structure_format = structure_format or self.structure_format
+        if structure_format == 'columnar':
+            write_columns(molgrp, name, sql_to_columns(sqldb))
+        else:
+            data = np.array(sqldb.sql2pdb()).astype('|S78')
+            molgrp.create_dataset(name, data=data)
+
+    def _add_native(self, molgrp, ref):
+        """Add the native of a molecule.
+
+        The native file is stored once in self.f5. The next molecules
+        sharing it get a hard link to the stored dataset. The in-memory
+        files of the workers get their own copy, which is linked again
+        when the molecule is copied in self.f5.
+
+        Args:
+            molgrp (h5py.Group): group of the molecule
+            ref (str): pdb file of the native
+        """
+        path = self.native_paths.get(ref)
+        if path is not None and path in molgrp.file:
+            molgrp['native'] = molgrp.file[path]
+        else:
+            self._add_pdb(molgrp, ref, 'native')
+            if molgrp.file == getattr(self, 'f5', None):
+                self.native_paths[ref] = molgrp['native'].name
+
     # @staticmethod
     def _get_aligned_sqldb(self, pdbfile, dict_align):
         """return a sqldb of the pdb that is aligned as specified in the dict
@@ -1614,13 +3346,13 @@ class DataGenerator(object):
             dict_align['export'] = False
 
         if dict_align['selection'] == 'interface':
-            sqldb = align_interface(pdbfile, plane=dict_align['plane'],
+            sqldb = align_interface(load_pdb(pdbfile), plane=dict_align['plane'],
                                     export=dict_align['export'],
                                     chain1=self.chain1, chain2=self.chain2)
 
         else:
 
-            sqldb = align_along_axis(pdbfile, axis=dict_align['axis'],
+            sqldb = align_along_axis(load_pdb(pdbfile), axis=dict_align['axis'],
                                      export=dict_align['export'],
                                      **dict_align['selection'])
 
@@ -1692,7 +3424,7 @@ class DataGenerator(object):
         """
         # create the sqldb and extract positions
         if self.align is None:
-            sqldb = pdb2sql.pdb2sql(pdbfile)
+            sqldb = pdb2sql.pdb2sql(load_pdb(pdbfile))
         else:
             sqldb = self._get_aligned_sqldb(pdbfile, self.align)
 
@@ -1703,16 +3435,48 @@ class DataGenerator(object):
         xyz = sqldb.get('x,y,z')
         center = np.mean(xyz, 0)
 
-        # get the pdb-format data
-        data = sqldb.sql2pdb()
-        data = np.array(data).astype('|S78')
-        molgrp.create_dataset(name, data=data)
+        # store the rotated structure
+        self._write_structure(molgrp, name, sqldb)
 
         # close the db
         sqldb._close()
 
         return center
 
+    @staticmethod
+    def _add_virtual_aug(f5, molgrp, mol_name):
+        """Link the data of the original in a virtual augmented group.
+
+        Only the grid points and the rotation parameters stored in the
+        attributes belong to the augmented group. The complex, native,
+        features and targets are soft links to the original group and
+        are rotated when they are read (see deeprank.tools.augmentation).
+
+        Args:
+            f5 (h5py.File): hdf5 file
+            molgrp (h5py.Group): augmented group
+            mol_name (str): name of the original group
+        """
+        for name in ['complex', 'native', 'features', 'targets']:
+            if name in f5[mol_name]:
+                molgrp[name] = h5py.SoftLink(f5[mol_name].name + '/' + name)
+        molgrp.attrs['virtual'] = True
+
+    @staticmethod
+    def _get_mol_center(pdb):
+        """Get the center of a molecule, i.e. the origin of the rotations.
+
+        Args:
+            pdb (list(bytes) or str): pdb data or pdb filename
+
+        Returns:
+            np.array: center of the molecule
+        """
+        sqldb = pdb2sql.pdb2sql(pdb)
+        center = np.mean(sqldb.get('x,y,z'), 0)
+        sqldb._close()
+        return center
+
     # rotate th xyz-formatted feature in the database
 
     @staticmethod
@@ -0,0 +1,199 @@
+import hashlib
+import multiprocessing
+import os
+import uuid
+
+import h5py
+
+import deeprank
+
+# groups of the xyz and raw features in the cache entries
+ENTRY_GROUPS = ('features', 'features_raw')
+
+
+class FeatureCache(object):
+
+    def __init__(self, path, max_size=None):
+        """On-disk cache of the features computed for each structure.
+
+        An entry contains the datasets written by one feature module for
+        one molecule. Its key is a hash of the ATOM records of the
+        structure, the chain IDs, the module name, the module version tag
+        (attribute __version__ of the module, if any), the deeprank
+        version and the format of the raw features. A module whose
+        features depend on more than the structure, e.g. on the PSSM
+        files of the molecule, adds them with a module-level function
+        __cache_key__(featgrp) returning a string. Rebuilding a database
+        from the same decoys, under any name, with other grids or feature
+        subsets then reuses the features computed before.
+
+        When the cache gets larger than max_size, the least recently
+        used entries are removed until it is below 90% of max_size. The
+        statistics are shared with the worker processes created after
+        the cache.
+
+        Args:
+            path (str): directory of the cache, created if needed
+            max_size (int, optional): maximum size of the cache in bytes.
+                Defaults to None (unbounded).
+
+        Example:
+            >>> cache = FeatureCache('./feature_cache', max_size=10 * 2**30)
+            >>> database = DataGenerator(..., feature_cache=cache)
+            >>> database.create_database()
+            >>> print(cache.stats())
+        """
+
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+        # hits, misses, bytes read, bytes written, size of the cache
+        self._counts = multiprocessing.Array('q', 5)
+        if self.max_size is not None:
+            self._counts[4] = sum(e[1] for e in self._get_entries())
+
+    @staticmethod
+    def get_key(structure, featgrp, chain1, chain2, feat_module,
+                raw_format='text'):
+        """Get the key of the features of a module for a structure.
+
+        Args:
+            structure (StructureContext): structure of the molecule
+            featgrp (h5py.Group): group of the xyz features
+            chain1 (str): First chain ID
+            chain2 (str): Second chain ID
+            feat_module (module): feature module
+            raw_format (str, optional): format of the raw features,
+                'text', 'compound' or None. Defaults to 'text'.
+
+        Returns:
+            str: key of the cache entry
+        """
+        items = [structure.digest(), chain1, chain2, feat_module.__name__,
+                 str(getattr(feat_module, '__version__', '')),
+                 deeprank.__version__, str(raw_format)]
+
+        cache_key = getattr(feat_module, '__cache_key__', None)
+        if cache_key is not None:
+            items.append(cache_key(featgrp))
+        return hashlib.sha256('\0'.join(items).encode()).hexdigest()
+
+    def _get_filename(self, key):
+        """Get the file of a cache entry."""
+        return os.path.join(self.path, key[:2], key + '.hdf5')
+
+    def load(self, key, featgrp, featgrp_raw):
+        """Copy the features of a cache entry in the molecule groups.
+
+        Args:
+            key (str): key of the entry
+            featgrp (h5py.Group): group of the xyz features
+            featgrp_raw (h5py.Group): group of the raw features or None
+
+        Returns:
+            bool: True if the entry was found
+        """
+        fname = self._get_filename(key)
+        try:
+            f5 = h5py.File(fname, 'r')
+        except OSError:
+            with self._counts.get_lock():
+                self._counts[1] += 1
+            return False
+
+        with f5:
+            for name, grp in zip(ENTRY_GROUPS, [featgrp, featgrp_raw]):
+                if grp is None:
+                    continue
+                for dset in f5[name]:
+                    if dset in grp:
+                        del grp[dset]
+                    f5.copy(f5[name][dset], grp)
+
+        # the access time orders the entries for the eviction
+        os.utime(fname)
+        with self._counts.get_lock():
+            self._counts[0] += 1
+            self._counts[2] += os.path.getsize(fname)
+        return True
+
+    def store(self, key, featgrp, featgrp_raw=None):
+        """Store the features computed by a module.
+
+        The entry does not depend on the name of the molecule, the
+        groups are stored under the names of ENTRY_GROUPS.
+
+        Args:
+            key (str): key of the entry
+            featgrp (h5py.Group): group of the xyz features of the module
+            featgrp_raw (h5py.Group, optional): group of the raw features
+                of the module. Defaults to None.
+        """
+        with h5py.File(key + '.entry.hdf5', 'w', driver='core',
+                       backing_store=False) as f5:
+            for name, grp in zip(ENTRY_GROUPS, [featgrp, featgrp_raw]):
+                if grp is not None:
+                    grp.file.copy(grp, f5, name=name)
+            f5.flush()
+            image = f5.id.get_file_image()
+
+        # written under a temporary name so that the other processes
+        # never read a partial entry
+        fname = self._get_filename(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp = '%s.%s.tmp' % (fname, uuid.uuid4().hex)
+        with open(tmp, 'wb') as fout:
+            fout.write(image)
+        os.replace(tmp, fname)
+
+        with self._counts.get_lock():
+            self._counts[3] += len(image)
+            self._counts[4] += len(image)
+            full = self.max_size is not None and \
+                self._counts[4] > self.max_size
+        if full:
+            self._evict()
+
+    def _get_entries(self):
+        """Get the (access time, size, filename) of the cache entries."""
+        entries = []
+        for subdir in os.scandir(self.path):
+            if not subdir.is_dir():
+                continue
+            for entry in os.scandir(subdir.path):
+                if entry.name.endswith('.hdf5'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        """Remove the least recently used entries."""
+        entries = self._get_entries()
+        size = sum(e[1] for e in entries)
+        for _, esize, fname in sorted(entries):
+            if size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(fname)
+            except FileNotFoundError:
+                pass
+            size -= esize
+
+        with self._counts.get_lock():
+            self._counts[4] = size
+
+    def stats(self):
+        """Get the statistics of the cache.
+
+        Returns:
+            dict: number of hits and misses, bytes read from and written
+                to the cache, number of entries and size of the cache
+        """
+        entries = self._get_entries()
+        return {'hits': self._counts[0],
+                'misses': self._counts[1],
+                'bytes_read': self._counts[2],
+                'bytes_written': self._counts[3],
+                'entries': len(entries),
+                'size': sum(e[1] for e in entries)}
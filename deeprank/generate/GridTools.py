@@ -5,10 +5,12 @@ from time import time
 
 import numpy as np
 from scipy.signal import bspline
-import pdb2sql
 
 from deeprank.config import logger
 from deeprank.tools import sparse
+from deeprank.tools.augmentation import get_feature, rotate_sql
+from deeprank.tools.columnar import read_sql
+from deeprank.tools.splatting import FEATURE_BETA, GridSplatter
 
 try:
     from tqdm import tqdm
@@ -28,7 +30,8 @@ class GridTools(object):
                  feature=None, feature_mode='ind',
                  contact_distance=8.5,
                  cuda=False, gpu_block=None, cuda_func=None, cuda_atomic=None,
-                 prog_bar=False, time=False, try_sparse=True):
+                 prog_bar=False, time=False, try_sparse=True,
+                 defer_write=False, timer=None, mapping='exact'):
         """Map the feature of a complex on the grid.
 
         Args:
@@ -63,6 +66,15 @@ class GridTools(object):
                 individual grid (default False).
             try_sparse(bool, optional): Try to store the matrix in
                 sparse format (default True).
+            defer_write(bool, optional): keep the data in memory until
+                write_pending() is called instead of writing it in the
+                HDF5 file (default False).
+            timer(StageTimer, optional): timer of the sparse encoding
+                (default None).
+            mapping(str, optional): 'exact' to evaluate the kernels on
+                the grid points or 'fft' to convolve the grid with them,
+                faster for many atoms but approximate, see
+                deeprank.tools.splatting.GridSplatter (default 'exact').
         """
 
         # mol and hdf5 file
@@ -77,6 +89,11 @@ class GridTools(object):
         self.hdf5 = self.molgrp.file
         self.try_sparse = try_sparse
 
+        # writing of the data
+        self.defer_write = defer_write
+        self.pending_writes = []
+        self.timer = timer
+
         # parameter of the grid
         if number_of_points is not None:
             if not isinstance(number_of_points, list):
@@ -117,10 +134,13 @@ class GridTools(object):
         self.y = None
         self.z = None
 
-        # grids for calculation of atomic densities
-        self.xgrid = None
-        self.ygrid = None
-        self.zgrid = None
+        # meshgrid of the grid points, only built for the featgrid
+        # methods other than the fast gaussian
+        self._meshgrid = None
+
+        # mapping on the grid points
+        self.mapping = mapping
+        self.splatter = None
 
         # dictionaries of atomic densities
         self.atdens = {}
@@ -165,7 +185,7 @@ class GridTools(object):
         self.define_grid_points()
 
         # save the grid points
-        self.export_grid_points()
+        self._write(self.export_grid_points)
 
         # map the features
         self.add_all_features()
@@ -189,9 +209,9 @@ class GridTools(object):
         grid = self.hdf5.get(self.mol_basename + '/grid_points/')
         self.x, self.y, self.z = grid['x'][()], grid['y'][()], grid['z'][()]
 
-        # create the grid
-        self.ygrid, self.xgrid, self.zgrid = np.meshgrid(
-            self.y, self.x, self.z)
+        self._meshgrid = None
+        self.splatter = GridSplatter(self.x, self.y, self.z,
+                                     mode=self.mapping)
 
         # set the resolution/dimension
         self.npts = np.array([len(self.x), len(self.y), len(self.z)])
@@ -212,7 +232,10 @@ class GridTools(object):
     def read_pdb(self):
         """Create a sql databse for the pdb."""
 
-        self.sqldb = pdb2sql.interface(self.molgrp['complex'][()])
+        self.sqldb = read_sql(self.molgrp['complex'])
+
+        # rotate the complex of a virtual augmented group
+        rotate_sql(self.molgrp, self.sqldb)
 
     # get the contact atoms and interface center
     def get_contact_center(self):
@@ -249,7 +272,8 @@ class GridTools(object):
             # save to hdf5 if specfied
             t0 = time()
             logif('-- Save Features to HDF5', self.time)
-            self.hdf5_grid_data(dict_data, 'Feature_%s' % (self.feature_mode))
+            self._write(self.hdf5_grid_data, dict_data,
+                        'Feature_%s' % (self.feature_mode))
             logif('      Total %f ms' % ((time() - t0) * 1000), self.time)
 
     # add all the atomic densities to the data
@@ -266,8 +290,8 @@ class GridTools(object):
             # save to hdf5
             t0 = time()
             logif('-- Save Atomic Densities to HDF5', self.time)
-            self.hdf5_grid_data(self.atdens, 'AtomicDensities_%s' %
-                                (self.atomic_densities_mode))
+            self._write(self.hdf5_grid_data, self.atdens,
+                        'AtomicDensities_%s' % (self.atomic_densities_mode))
             logif('      Total %f ms' % ((time() - t0) * 1000), self.time)
 
     ################################################################
@@ -286,21 +310,32 @@ class GridTools(object):
         logif('-- Resolution of %1.2fx%1.2fx%1.2f Angs' %
               (self.res[0], self.res[1], self.res[2]), self.time)
 
-        halfdim = 0.5 * (self.npts * self.res)
-        center = self.center_contact
-
-        low_lim = center - halfdim
-        hgh_lim = low_lim + self.res * (np.array(self.npts) - 1)
-
-        self.x = np.linspace(low_lim[0], hgh_lim[0], self.npts[0])
-        self.y = np.linspace(low_lim[1], hgh_lim[1], self.npts[1])
-        self.z = np.linspace(low_lim[2], hgh_lim[2], self.npts[2])
-
-        # there is something fishy about the meshgrid 3d
-        # the axis are a bit screwy ....
-        # i dont quite get why the ordering is like that
-        self.ygrid, self.xgrid, self.zgrid = np.meshgrid(
-            self.y, self.x, self.z)
+        # the grid template is shared by the molecules
+        self.splatter = GridSplatter.from_center(
+            self.center_contact, self.npts, self.res, mode=self.mapping)
+        self.x, self.y, self.z = self.splatter.axes
+        self._meshgrid = None
+
+    def _get_meshgrid(self):
+        """Get the meshgrid of the grid points, built once."""
+        if self._meshgrid is None:
+            # there is something fishy about the meshgrid 3d
+            # the axis are a bit screwy ....
+            # i dont quite get why the ordering is like that
+            self._meshgrid = np.meshgrid(self.y, self.x, self.z)
+        return self._meshgrid
+
+    @property
+    def xgrid(self):
+        return self._get_meshgrid()[1]
+
+    @property
+    def ygrid(self):
+        return self._get_meshgrid()[0]
+
+    @property
+    def zgrid(self):
+        return self._get_meshgrid()[2]
 
     ################################################################
     # Atomic densities
@@ -391,17 +426,9 @@ class GridTools(object):
             # if we don't use CUDA
             else:
 
-                # init the grid
-                atdensA = np.zeros(self.npts)
-                atdensB = np.zeros(self.npts)
-
-                # run on the atoms
-                for pos in xyzA:
-                    atdensA += self.densgrid(pos, vdw_rad)
-
-                # run on the atoms
-                for pos in xyzB:
-                    atdensB += self.densgrid(pos, vdw_rad)
+                # map the atoms of each chain
+                atdensA = self.splatter.densities(xyzA, vdw_rad)
+                atdensB = self.splatter.densities(xyzB, vdw_rad)
 
             # create the final grid: A - B
             if mode == 'diff':
@@ -428,6 +455,8 @@ class GridTools(object):
 
         The formula is equation (1) of the Koes paper
         Protein-Ligand Scoring with Convolutional NN Arxiv:1612.02751v1
+        Only the grid points within 1.5 vdw radius of the atom are
+        computed, see deeprank.tools.splatting.
 
         Args:
             center (list(float)): position of the atoms
@@ -436,20 +465,7 @@ class GridTools(object):
         Returns:
             TYPE: np.array (mapped density)
         """
-
-        x0, y0, z0 = center
-        dd = np.sqrt((self.xgrid - x0)**2
-                     + (self.ygrid - y0)**2
-                     + (self.zgrid - z0)**2)
-
-        dgrid = np.zeros(self.npts)
-
-        index_shortd = dd < vdw_radius
-        index_longd = (dd >= vdw_radius) & (dd < 1.5 * vdw_radius)
-        dgrid[index_shortd] = np.exp(-2 * dd[index_shortd]**2 / vdw_radius**2)
-        dgrid[index_longd] = 4. / np.e**2 / vdw_radius**2 * dd[index_longd]**2 \
-            - 12. / np.e**2 / vdw_radius * dd[index_longd] + 9. / np.e**2
-        return dgrid
+        return self.splatter.densities([center], vdw_radius)
 
     ################################################################
     # Residue or Atomic features
@@ -498,6 +514,9 @@ class GridTools(object):
             z_gpu = gpuarray.to_gpu(self.z.astype(np.float32))
             grid_gpu = gpuarray.zeros(self.npts, np.float32)
 
+        # centers and values of the features mapped on each grid
+        centers, values = {}, {}
+
         # loop over all the features required
         for feature_name in featlist:
 
@@ -508,7 +527,7 @@ class GridTools(object):
             # read the data
             featgrp = self.molgrp['features']
             if feature_name in featgrp.keys():
-                data = featgrp[feature_name][:]
+                data = get_feature(self.molgrp, feature_name)
             else:
                 print('Error Feature not found \n\tPossible features: ' +
                       ' | '.join(featgrp.keys()))
@@ -549,20 +568,20 @@ class GridTools(object):
             # that will in fine holds all the data
             if nFeat == 1:
                 if self.feature_mode == 'ind':
-                    dict_data[feature_name + '_chain1'] = np.zeros(self.npts)
-                    dict_data[feature_name + '_chain2'] = np.zeros(self.npts)
+                    dict_data[feature_name + '_chain1'] = np.zeros(self.npts, np.float32)
+                    dict_data[feature_name + '_chain2'] = np.zeros(self.npts, np.float32)
                 else:
-                    dict_data[feature_name] = np.zeros(self.npts)
+                    dict_data[feature_name] = np.zeros(self.npts, np.float32)
             else: # do we need that ?!
                 for iF in range(nFeat):
                     if self.feature_mode == 'ind':
                         dict_data[feature_name + '_chain1_%03d' %
-                                  iF] = np.zeros(self.npts)
+                                  iF] = np.zeros(self.npts, np.float32)
                         dict_data[feature_name + '_chain2_%03d' %
-                                  iF] = np.zeros(self.npts)
+                                  iF] = np.zeros(self.npts, np.float32)
                     else:
                         dict_data[feature_name + '_%03d' %
-                                  iF] = np.zeros(self.npts)
+                                  iF] = np.zeros(self.npts, np.float32)
 
             # skip empty features
             if data.shape[0] == 0:
@@ -658,12 +677,15 @@ class GridTools(object):
                 # map this feature(s) on the grid(s)
                 if not self.cuda:
                     if nFeat == 1:
-                        dict_data[fname] += coeff * \
-                            self.featgrid(pos, feat_values)
+                        centers.setdefault(fname, []).append(pos)
+                        values.setdefault(fname, []).append(
+                            coeff * feat_values)
                     else:
                         for iF in range(nFeat):
-                            dict_data[fname + '_%03d' % iF] += coeff * \
-                                self.featgrid(pos, feat_values[iF])
+                            key = fname + '_%03d' % iF
+                            centers.setdefault(key, []).append(pos)
+                            values.setdefault(key, []).append(
+                                coeff * feat_values[iF])
 
                 # try to use cuda to speed it up
                 else:  # pragma: no cover
@@ -689,8 +711,39 @@ class GridTools(object):
             logif('     Process time %f ms' % (tprocess * 1000), self.time)
             logif('     Grid    time %f ms' % (tgrid * 1000), self.time)
 
+        # map the grids of all the features at once
+        t0 = time()
+        self._map_grouped_features(centers, values, dict_data)
+        logif('-- Map all features: Grid time %f ms' %
+              ((time() - t0) * 1000), self.time)
+
         return dict_data
 
+    def _map_grouped_features(self, centers, values, dict_data):
+        """Map the grids of the features at the same positions together.
+
+        The residue features, e.g. the 20 PSSM_* features, share the
+        positions of the residues: the kernel is computed once for each
+        position and grid point and multiplied by the values of all the
+        features.
+
+        Args:
+            centers (dict): positions of the values of each grid
+            values (dict): values of each grid
+            dict_data (dict): grids the features are added to
+        """
+        groups = {}
+        for key in centers:
+            xyz = np.array(centers[key], dtype=np.float64)
+            groups.setdefault(xyz.tobytes(), (xyz, []))[1].append(key)
+
+        for xyz, keys in groups.values():
+            self.splatter.features(
+                xyz,
+                np.stack([np.array(values[key], dtype=np.float64).reshape(-1)
+                          for key in keys], axis=1),
+                out=[dict_data[key] for key in keys])
+
     # compute the a given feature on the grid
     def featgrid(self, center, value, type_='fast_gaussian'):
         """Map an individual feature (atomic or residue) on the grid.
@@ -709,8 +762,7 @@ class GridTools(object):
 
         # shortcut for th center
         x0, y0, z0 = center
-        sigma = np.sqrt(1. / 2)
-        beta = 0.5 / (sigma**2)
+        beta = FEATURE_BETA
 
         # simple Gaussian
         if type_ == 'gaussian':
@@ -722,17 +774,7 @@ class GridTools(object):
 
         # fast gaussian
         elif type_ == 'fast_gaussian':
-
-            cutoff = 5. * beta
-
-            dd = np.sqrt((self.xgrid - x0)**2
-                         + (self.ygrid - y0)**2
-                         + (self.zgrid - z0)**2)
-            dgrid = np.zeros(self.npts)
-
-            dgrid[dd < cutoff] = value * np.exp(-beta * dd[dd < cutoff])
-
-            return dgrid
+            return self.splatter.features([center], value)
 
         # Bsline
         elif type_ == 'bspline':
@@ -806,6 +848,26 @@ class GridTools(object):
         elif not all(grd['center'][()] == self.center_contact):
             grd['center'][...] = self.center_contact
 
+    # write now or keep for later the data of the hdf5 file
+
+    def _write(self, func, *args):
+        """Write data in the hdf5 file or defer it if defer_write.
+
+        Args:
+            func (callable): method writing the data
+            *args: arguments of func
+        """
+        if self.defer_write:
+            self.pending_writes.append((func, args))
+        else:
+            func(*args)
+
+    def write_pending(self):
+        """Write the data kept in memory with defer_write."""
+        for func, args in self.pending_writes:
+            func(*args)
+        self.pending_writes = []
+
     # save the data in the hdf5 file
 
     def hdf5_grid_data(self, dict_data, data_name):
@@ -838,6 +900,9 @@ class GridTools(object):
                 spg.from_dense(value, beta=1E-2)
                 if self.time:
                     print('      Sparsing time %f ms' % ((time() - t0) * 1000))
+                if self.timer is not None:
+                    self.timer.add(self.mol_basename.lstrip('/'), 'sparse',
+                                   time() - t0)
 
                 # if we have a sparse matrix
                 if spg.sparse:
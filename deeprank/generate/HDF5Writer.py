@@ -0,0 +1,82 @@
+import queue
+import threading
+
+
+class HDF5Writer(object):
+
+    def __init__(self, queue_size=2):
+        """Write the data of the molecules in a background thread.
+
+        The writing jobs are executed one after the other in the order
+        they are submitted, while the calling thread computes the data
+        of the next molecules. The queue is bounded so that at most
+        queue_size computed molecules are waiting in memory.
+
+        The first exception raised by a job is raised again by
+        submit() or close(). The jobs submitted after it are skipped.
+
+        Args:
+            queue_size (int, optional): maximum number of jobs waiting
+                to be written. Defaults to 2.
+
+        Example:
+            >>> with HDF5Writer(queue_size=4) as writer:
+            >>>     for mol in mol_names:
+            >>>         data = compute(mol)
+            >>>         writer.submit(write, f5, mol, data)
+        """
+
+        if queue_size < 1:
+            raise ValueError(
+                f'queue_size must be a positive integer, got {queue_size}')
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.raised = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """Execute the jobs of the queue until None is received."""
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            func, args, kwargs = job
+            if self.error is None:
+                try:
+                    func(*args, **kwargs)
+                except BaseException as ex:
+                    self.error = ex
+
+    def _check_error(self):
+        """Raise the exception of a failed job."""
+        if self.error is not None and not self.raised:
+            self.raised = True
+            raise self.error
+
+    def submit(self, func, *args, **kwargs):
+        """Add a writing job to the queue.
+
+        Blocks while the queue is full.
+
+        Args:
+            func (callable): function writing the data
+            *args: positional arguments of func
+            **kwargs: keyword arguments of func
+        """
+        self._check_error()
+        self.queue.put((func, args, kwargs))
+
+    def close(self):
+        """Wait until all the jobs are written and stop the thread."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
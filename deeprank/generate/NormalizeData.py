@@ -5,6 +5,7 @@ import h5py
 import numpy as np
 
 from deeprank.tools import sparse
+from deeprank.tools.augmentation import get_source, is_virtual
 
 
 class NormalizeData(object):
@@ -94,6 +95,12 @@ class NormalizeData(object):
             # get the mapped features group
             data_group = f5.get(mol + '/mapped_features/')
 
+            # virtual augmented groups that are not mapped
+            # have the statistics of their source
+            if data_group is None and is_virtual(f5[mol]):
+                data_group = f5.get(
+                    get_source(f5[mol]) + '/mapped_features/')
+
             # loop over all the feature types
             for feat_types, feat_names in data_group.items():
 
@@ -0,0 +1,140 @@
+import json
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+
+import numpy as np
+
+
+class StageTimer(object):
+
+    def __init__(self):
+        """Record the time spent by each molecule in each stage.
+
+        The stages of the generation are 'ingest' (storage of the pdbs),
+        'feature:<module>', 'target:<module>', 'grid_center',
+        'augmentation', 'write' (copy of a molecule computed by a
+        worker), 'mapping', 'sparse' (sparse encoding of the grids,
+        included in 'mapping' or 'grid_write') and 'grid_write' (grids
+        written by the writer thread). The time of a stage repeated for
+        a molecule, e.g. for each augmented copy, is summed.
+
+        Example:
+            >>> timer = StageTimer()
+            >>> with timer.time('1AK4_100w', 'ingest'):
+            >>>     read_pdb()
+            >>> print(timer.table())
+        """
+        self.records = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        """The copies sent to the worker processes start empty."""
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    @contextmanager
+    def time(self, mol, stage):
+        """Time a stage of a molecule.
+
+        Args:
+            mol (str): name of the molecule
+            stage (str): name of the stage
+        """
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(mol, stage, perf_counter() - t0)
+
+    def add(self, mol, stage, seconds):
+        """Add the time of a stage of a molecule.
+
+        Args:
+            mol (str): name of the molecule
+            stage (str): name of the stage
+            seconds (float): time spent in the stage
+        """
+        with self.lock:
+            record = self.records.setdefault(mol, OrderedDict())
+            record[stage] = record.get(stage, 0.) + seconds
+
+    def get(self, mol):
+        """Get the times of the stages of a molecule.
+
+        Args:
+            mol (str): name of the molecule
+
+        Returns:
+            dict: {stage: seconds}
+        """
+        with self.lock:
+            return dict(self.records.get(mol, {}))
+
+    def pop(self, mol):
+        """Remove and return the times of the stages of a molecule."""
+        with self.lock:
+            return dict(self.records.pop(mol, {}))
+
+    def update(self, mol, times):
+        """Add the times of the stages of a molecule.
+
+        Args:
+            mol (str): name of the molecule
+            times (dict): {stage: seconds}, e.g. recorded by a worker
+        """
+        for stage, seconds in times.items():
+            self.add(mol, stage, seconds)
+
+    def summary(self):
+        """Get the statistics of the stages over the molecules.
+
+        Returns:
+            OrderedDict: {stage: {'count', 'total', 'mean', 'p50', 'p95'}}
+                in the order in which the stages were first recorded
+        """
+        with self.lock:
+            times = OrderedDict()
+            for record in self.records.values():
+                for stage, seconds in record.items():
+                    times.setdefault(stage, []).append(seconds)
+
+        summary = OrderedDict()
+        for stage, values in times.items():
+            summary[stage] = {'count': len(values),
+                              'total': float(np.sum(values)),
+                              'mean': float(np.mean(values)),
+                              'p50': float(np.percentile(values, 50)),
+                              'p95': float(np.percentile(values, 95))}
+        return summary
+
+    def table(self):
+        """Format the summary as a table, times in seconds.
+
+        Returns:
+            str: one line per stage, by decreasing total time
+        """
+        summary = self.summary()
+        lines = ['{:30s} {:>8s} {:>10s} {:>10s} {:>10s}'.format(
+            'stage', 'count', 'p50', 'p95', 'total')]
+        for stage, s in sorted(summary.items(),
+                               key=lambda x: -x[1]['total']):
+            lines.append('{:30s} {:8d} {:10.4f} {:10.4f} {:10.2f}'.format(
+                stage, s['count'], s['p50'], s['p95'], s['total']))
+        return '\n'.join(lines)
+
+    def save(self, fname):
+        """Save the times of the molecules and the summary in a json file.
+
+        Args:
+            fname (str): json file
+        """
+        with self.lock:
+            records = {mol: dict(record)
+                       for mol, record in self.records.items()}
+        with open(fname, 'w') as f:
+            json.dump({'summary': self.summary(), 'molecules': records},
+                      f, indent=2)
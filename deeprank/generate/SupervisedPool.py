@@ -0,0 +1,307 @@
+import multiprocessing
+import time
+import traceback
+import weakref
+from collections import deque
+from multiprocessing.connection import wait
+from multiprocessing.reduction import ForkingPickler
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+def _run_task(conn, func, arg, initializer, initargs, max_memory):
+    """Execute a task in a supervised process and send its result.
+
+    Args:
+        conn (Connection): pipe to the supervisor
+        func (callable): function of the task
+        arg: argument of func
+        initializer (callable): function called first or None
+        initargs (tuple): arguments of initializer
+        max_memory (int): maximum address space in bytes or None
+    """
+    if max_memory is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+        message = ('result', func(arg))
+    except BaseException:
+        message = ('error', traceback.format_exc())
+    conn.send(message)
+    conn.close()
+
+
+class _Job(object):
+
+    def __init__(self, task_id, process, conn):
+        """Task running in a supervised process."""
+        self.task_id = task_id
+        self.process = process
+        self.conn = conn
+        self.start = time.monotonic()
+
+
+def _start_job(context, task_id, func, arg, initializer, initargs,
+               max_memory):
+    """Start the process of a task."""
+    conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_run_task, daemon=True,
+        args=(child_conn, func, arg, initializer, initargs, max_memory))
+    process.start()
+    child_conn.close()
+    return _Job(task_id, process, conn)
+
+
+def _get_job_message(job, timeout):
+    """Get the pickled message of a task if its process is over.
+
+    Returns:
+        bytes: pickled status and value of the task or None
+    """
+    data = None
+    if job.conn.poll():
+        try:
+            # relayed to the pool without being unpickled
+            data = job.conn.recv_bytes()
+        except (EOFError, OSError):
+            pass
+    elif job.process.is_alive():
+        if timeout is None or time.monotonic() - job.start <= timeout:
+            return None
+        job.process.kill()
+        job.process.join()
+        job.conn.close()
+        return ForkingPickler.dumps(
+            ('error', f'timeout after {timeout} seconds'))
+
+    job.process.join()
+    job.conn.close()
+    if data is None:
+        return ForkingPickler.dumps(
+            ('error', f'process crashed with exit code '
+             f'{job.process.exitcode}'))
+    return data
+
+
+def _supervise(conn, processes, initializer, initargs, timeout,
+               max_memory, context):
+    """Start and supervise the processes of the tasks.
+
+    The tasks are received from the pool with the function to execute,
+    their results are sent back with their ID as soon as they are over.
+    The supervisor stops when the pool sends None or is closed.
+
+    Args:
+        conn (Connection): duplex pipe to the pool
+        processes (int): maximum number of tasks running at once
+        initializer (callable): function called by each process or None
+        initargs (tuple): arguments of initializer
+        timeout (float): maximum wall-clock time of a task or None
+        max_memory (int): maximum address space of a task or None
+        context (multiprocessing context): context of the processes
+    """
+    func = None
+    waiting = deque()
+    running = []
+    try:
+        while True:
+
+            # start the next tasks in the free slots
+            while waiting and len(running) < processes:
+                task_id, arg = waiting.popleft()
+                running.append(_start_job(
+                    context, task_id, func, arg, initializer, initargs,
+                    max_memory))
+
+            # wait for a task, a process to send its result, stop or
+            # time out
+            wait_time = None
+            if timeout is not None and running:
+                wait_time = max(min(job.start for job in running) +
+                                timeout - time.monotonic(), 0)
+            ready = wait([conn] + [job.conn for job in running] +
+                         [job.process.sentinel for job in running],
+                         wait_time)
+
+            if conn in ready:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    message = None
+                if message is None:
+                    return
+                kind, value = message
+                if kind == 'func':
+                    func = value
+                else:
+                    waiting.append(value)
+
+            for job in list(running):
+                data = _get_job_message(job, timeout)
+                if data is not None:
+                    running.remove(job)
+                    conn.send(job.task_id)
+                    conn.send_bytes(data)
+    finally:
+        for job in running:
+            job.process.kill()
+            job.process.join()
+            job.conn.close()
+        conn.close()
+
+
+def _stop_supervisor(conn, process):
+    """Stop the supervisor process of a pool."""
+    try:
+        conn.send(None)
+    except (OSError, ValueError):
+        pass
+    conn.close()
+    process.join(5)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+class SupervisedPool(object):
+
+    def __init__(self, processes=1, initializer=None, initargs=(),
+                 timeout=None, max_memory=None, on_error=None):
+        """Execute each task in its own process, with limited resources.
+
+        A task that raises an exception, crashes its process, exceeds
+        the wall-clock timeout or the memory cap does not stop the other
+        tasks: its result is given by on_error. Memory errors usually
+        surface as exceptions of the task, or as a crash when raised
+        outside of Python.
+
+        The processes of the tasks are forked by a supervisor process,
+        itself forked when the pool is created. They don't inherit the
+        files opened after the creation of the pool, e.g. the HDF5 file
+        written with the results. The pool is best created before any
+        HDF5 file is opened, so that the supervisor does not inherit the
+        state of the HDF5 library either. The arguments of the initializer are
+        not pickled, the function and the arguments of the tasks are.
+
+        Args:
+            processes (int, optional): maximum number of tasks running
+                at once. Defaults to 1.
+            initializer (callable, optional): function called by each
+                process before its task. Defaults to None.
+            initargs (tuple, optional): arguments of initializer
+            timeout (float, optional): maximum wall-clock time of a task
+                in seconds. Defaults to None (unlimited).
+            max_memory (int, optional): maximum address space of a task
+                in bytes (Unix only). Defaults to None (unlimited).
+            on_error (callable, optional): function returning the result
+                of a failed task from its argument and the reason of the
+                failure. Defaults to None, i.e. raise a RuntimeError.
+
+        Example:
+            >>> pool = SupervisedPool(4, timeout=600, max_memory=8 * 2**30,
+            >>>                       on_error=lambda arg, reason: None)
+            >>> for result in pool.imap(compute, pdbs):
+            >>>     write(result)
+        """
+
+        if processes < 1:
+            raise ValueError(
+                f'processes must be a positive integer, got {processes}')
+
+        self.processes = processes
+        self.on_error = on_error
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:  # pragma: no cover
+            context = multiprocessing.get_context()
+
+        # the supervisor starts processes so it can not be a daemon,
+        # it is stopped when the pool is terminated or garbage collected
+        self.conn, child_conn = context.Pipe()
+        self.supervisor = context.Process(
+            target=_supervise,
+            args=(child_conn, processes, initializer, initargs, timeout,
+                  max_memory, context))
+        self.supervisor.start()
+        child_conn.close()
+        self._finalizer = weakref.finalize(
+            self, _stop_supervisor, self.conn, self.supervisor)
+
+        # ID of the next task, unique over the calls of imap
+        self.task_id = 0
+
+    def _get_result(self, arg, status, value):
+        """Get the result of a task from its status."""
+        if status == 'result':
+            return value
+        if self.on_error is not None:
+            return self.on_error(arg, value)
+        raise RuntimeError(value)
+
+    def imap(self, func, iterable):
+        """Execute the tasks and yield their results in order.
+
+        Args:
+            func (callable): function of the tasks
+            iterable (iterable): arguments of the tasks
+
+        Yields:
+            results of the tasks or of on_error for the failed ones
+        """
+        if not self._finalizer.alive:
+            raise ValueError('Pool not running')
+
+        self.conn.send(('func', func))
+
+        tasks = iter(iterable)
+        exhausted = False
+        first = next_id = self.task_id
+        args, messages = {}, {}
+        while True:
+
+            # send the next tasks, the number of completed results
+            # waiting for a slow task is bounded
+            while not exhausted and \
+                    self.task_id - next_id < 4 * self.processes:
+                try:
+                    arg = next(tasks)
+                except StopIteration:
+                    exhausted = True
+                    break
+                args[self.task_id] = arg
+                self.conn.send(('task', (self.task_id, arg)))
+                self.task_id += 1
+
+            if next_id == self.task_id:
+                return
+
+            if next_id in messages:
+                status, value = ForkingPickler.loads(messages.pop(next_id))
+                yield self._get_result(args.pop(next_id), status, value)
+                next_id += 1
+                continue
+
+            try:
+                task_id = self.conn.recv()
+                data = self.conn.recv_bytes()
+            except (EOFError, OSError):
+                raise RuntimeError(
+                    f'supervisor process stopped with exit code '
+                    f'{self.supervisor.exitcode}')
+
+            # results of the tasks of a previous call are dropped
+            if first <= task_id:
+                messages[task_id] = data
+
+    def terminate(self):
+        """Stop the supervisor and the running tasks."""
+        self._finalizer()
+
+    def join(self):
+        """Compatibility with multiprocessing.Pool, nothing to wait for."""
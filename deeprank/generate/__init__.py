@@ -1,3 +1,7 @@
 from .DataGenerator import DataGenerator
 from .GridTools import GridTools
 from .NormalizeData import MinMaxParam, NormalizeData, NormParam
+from .HDF5Writer import HDF5Writer
+from .FeatureCache import FeatureCache
+from .SupervisedPool import SupervisedPool
+from .StageTimer import StageTimer
@@ -3,7 +3,6 @@ import os
 import pickle
 import re
 import sys
-from functools import partial
 import warnings
 
 import h5py
@@ -15,6 +14,9 @@ from deeprank import config
 from deeprank.config import logger
 from deeprank.generate import MinMaxParam, NormalizeData, NormParam
 from deeprank.tools import sparse
+from deeprank.tools.augmentation import get_feature, rotate_sql
+from deeprank.tools.columnar import read_sql
+from deeprank.tools.splatting import GridSplatter, get_grid_template
 
 # import torch.utils.data as data_utils
 # The class used to subclass data_utils.Dataset
@@ -64,6 +66,8 @@ class DataSet():
                 The dict contains:
                     -  'number_of_points", the shape of grid
                     -  'resolution', the resolution of grid, unit in A
+                    -  'mapping', 'exact' (default) or 'fft', see
+                       deeprank.tools.splatting.GridSplatter
                 Example:
                     {'number_of_points': [10, 10, 10], 'resolution': [3, 3, 3]}
 
@@ -1286,7 +1290,10 @@ class DataSet():
         return np.array(new_feat).astype(outtype)
 
     def get_grid(self, mol_data):
-        """Get meshed grids and number of pointgs
+        """Get the coordinates of the grid points and number of points.
+
+        The coordinates are the center of the molecule plus the grid
+        template shared by all the molecules, the meshgrid is never built.
 
         Args:
             mol_data(h5 group): HDF5 moleucle group
@@ -1295,7 +1302,7 @@ class DataSet():
             ValueError: Grid points not found in mol_data.
 
         Returns:
-            tuple, tuple: meshgrid, npts
+            tuple, tuple: coordinates along x,y,z, npts
         """
 
         if self.grid_info is None:
@@ -1314,26 +1321,29 @@ class DataSet():
         else:
 
             center = mol_data['grid_points/center'][()]
-            npts = np.array(self.grid_info['number_of_points'])
-            res = np.array(self.grid_info['resolution'])
-
-            halfdim = 0.5 * (npts * res)
-
-            low_lim = center - halfdim
-            hgh_lim = low_lim + res * (npts - 1)
+            template = get_grid_template(
+                tuple(int(n) for n in self.grid_info['number_of_points']),
+                tuple(float(r) for r in self.grid_info['resolution']))
+            x, y, z = [c + axis for c, axis in zip(center, template)]
 
-            x = np.linspace(low_lim[0], hgh_lim[0], npts[0])
-            y = np.linspace(low_lim[1], hgh_lim[1], npts[1])
-            z = np.linspace(low_lim[2], hgh_lim[2], npts[2])
-
-        # there is stil something strange
-        # with the ordering of the grid
-        # also noted in GridTools define_grid_points()
-        y, x, z = np.meshgrid(y, x, z)
         grid = (x, y, z)
         npts = (len(x), len(y), len(z))
         return grid, npts
 
+    def _get_splatter(self, grid):
+        """Get the mapping engine of a grid.
+
+        Args:
+            grid(tuple): coordinates along x,y,z
+
+        Returns:
+            GridSplatter: engine of the mapping mode of grid_info
+        """
+        mode = 'exact'
+        if self.grid_info is not None:
+            mode = self.grid_info.get('mapping', 'exact')
+        return GridSplatter(*grid, mode=mode)
+
     def map_atomic_densities(
             self, feat_names, mol_data, grid, npts, angle, axis):
         """Map atomic densities.
@@ -1341,7 +1351,7 @@ class DataSet():
         Args:
             feat_names(dict): Element type and vdw radius
             mol_data(h5 group): HDF5 molecule group
-            grid(tuple): mesh grid of x,y,z
+            grid(tuple): coordinates along x,y,z
             npts(tuple): number of points on axis x,y,z
             angle(float): rotation angle
             axis(list): rotation axis
@@ -1350,12 +1360,15 @@ class DataSet():
             list: atomic densities of each atom type on each chain
         """
 
-        sql = pdb2sql.interface(mol_data['complex'][()])
+        sql = read_sql(mol_data['complex'])
+        rotate_sql(mol_data, sql)
         index = sql.get_contact_atoms(chain1=self.chain1, chain2=self.chain2)
 
         if angle is not None:
             center = [np.mean(g) for g in grid]
 
+        splatter = self._get_splatter(grid)
+
         densities = []
         for elementtype, vdw_rad in feat_names.items():
 
@@ -1375,17 +1388,9 @@ class DataSet():
                     xyzB = pdb2sql.transform.rot_xyz_around_axis(
                         xyzB, axis, angle, center)
 
-            # init the grid
-            atdensA = np.zeros(npts)
-            atdensB = np.zeros(npts)
-
-            # run on the atoms
-            for pos in xyzA:
-                atdensA += self._densgrid(pos, vdw_rad, grid, npts)
-
-            # run on the atoms
-            for pos in xyzB:
-                atdensB += self._densgrid(pos, vdw_rad, grid, npts)
+            # map the atoms of each chain
+            atdensA = splatter.densities(xyzA, vdw_rad)
+            atdensB = splatter.densities(xyzB, vdw_rad)
 
             densities += [atdensA, atdensB]
 
@@ -1407,39 +1412,38 @@ class DataSet():
         Returns:
             TYPE: np.array (mapped density)
         """
-
-        x0, y0, z0 = center
-        dd = np.sqrt((grid[0] - x0)**2 +
-                     (grid[1] - y0)**2 + (grid[2] - z0)**2)
-        dgrid = np.zeros(npts)
-
-        dgrid[dd < vdw_radius] = np.exp(
-            -2 * dd[dd < vdw_radius]**2 / vdw_radius**2)
-
-        dd_tmp = dd[(dd >= vdw_radius) & (dd < 1.5 * vdw_radius)]
-        dgrid[(dd >= vdw_radius) & (dd < 1.5 * vdw_radius)] = (
-            4. / np.e**2 / vdw_radius**2 * dd_tmp**2) - (
-                12. / np.e**2 / vdw_radius * dd_tmp) + 9. / np.e**2
-
-        return dgrid
+        return GridSplatter(*grid).densities(
+            [center], vdw_radius)
 
     def map_feature(self, feat_names, mol_data, grid, npts, angle, axis):
+        """Map features.
+
+        Args:
+            feat_names(list(str)): names of the features
+            mol_data(h5 group): HDF5 molecule group
+            grid(tuple): coordinates along x,y,z
+            npts(tuple): number of points on axis x,y,z
+            angle(float): rotation angle
+            axis(list): rotation axis
 
-        __vectorize__ = False
+        Returns:
+            list: features of each chain
+        """
 
         if angle is not None:
             center = [np.mean(g) for g in grid]
 
-        if __vectorize__:
-            pfunc = partial(self._featgrid, grid=grid, npts=npts)
-            vmap = np.vectorize(pfunc, signature='(n),()->(p,p,p)')
+        splatter = self._get_splatter(grid)
+
+        # positions, values and grids of the features of each chain
+        groups = {}
 
         feat = []
         for name in feat_names:
 
-            tmp_feat_ser = [np.zeros(npts), np.zeros(npts)]
-            tmp_feat_vect = [np.zeros(npts), np.zeros(npts)]
-            data = np.array(mol_data['features/' + name][()])
+            tmp_feat = [np.zeros(npts, np.float32),
+                        np.zeros(npts, np.float32)]
+            data = np.array(get_feature(mol_data, name))
 
             if data.shape[0]==0:
                 logger.warning(f'No {name} retrieved at the protein/protein interface')
@@ -1453,27 +1457,17 @@ class DataSet():
                     pos = pdb2sql.transform.rot_xyz_around_axis(
                         pos, axis, angle, center)
 
-                if __vectorize__ or __vectorize__ == 'both':
-
-                    for chainID in [0, 1]:
-                        tmp_feat_vect[chainID] = np.sum(
-                            vmap(pos[chain == chainID, :],
-                                 feat_value[chain == chainID]),
-                            0)
+                for chainID in [0, 1]:
+                    xyz = np.ascontiguousarray(pos[chain == chainID, :])
+                    group = groups.setdefault(xyz.tobytes(), (xyz, [], []))
+                    group[1].append(feat_value[chain == chainID])
+                    group[2].append(tmp_feat[chainID])
 
-                if not __vectorize__ or __vectorize__ == 'both':
+            feat += tmp_feat
 
-                    for chainID, xyz, val in zip(chain, pos, feat_value):
-                        tmp_feat_ser[int(chainID)] += \
-                                                      self._featgrid(xyz, val, grid, npts)
-
-                if __vectorize__ == 'both':
-                    assert np.allclose(tmp_feat_ser, tmp_feat_vect)
-
-            if __vectorize__:
-                feat += tmp_feat_vect
-            else:
-                feat += tmp_feat_ser
+        # map the features at the same positions together, e.g. PSSM_*
+        for xyz, values, grids in groups.values():
+            splatter.features(xyz, np.stack(values, axis=1), out=grids)
 
         return feat
 
@@ -1492,22 +1486,4 @@ class DataSet():
         Raises:
             ValueError: Description
         """
-
-        # shortcut for th center
-        x0, y0, z0 = center
-
-        sigma = np.sqrt(1. / 2)
-        beta = 0.5 / (sigma**2)
-        cutoff = 5. * beta
-
-        dd = np.sqrt((grid[0] - x0)**2 +
-                     (grid[1] - y0)**2 + (grid[2] - z0)**2)
-
-        dd[dd < cutoff] = value * np.exp(-beta * dd[dd < cutoff])
-        dd[dd > cutoff] = 0
-
-        #dgrid = np.zeros(npts)
-        #dgrid[dd<cutoff] = value*np.exp(-beta*dd[dd<cutoff])
-        # print(np.allclose(dgrid,dd))
-
-        return dd
+        return GridSplatter(*grid).features([center], value)
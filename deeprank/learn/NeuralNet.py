@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 import matplotlib.ticker as mtick
 import numpy as np
 import warnings
+from functools import partial
 
 import torch
 import torch.cuda
@@ -20,11 +21,17 @@ from torchsummary import summary
 
 from deeprank.config import logger
 from deeprank.learn import DataSet, classMetrics, rankingMetrics
+from deeprank.tools import cpu_kernel
 from torch.autograd import Variable
 
 matplotlib.use('agg')
 
 
+def _init_loader_worker(num_threads, worker_id):
+    """Set the threads of the mapping kernels in a DataLoader worker."""
+    cpu_kernel.set_num_threads(num_threads)
+
+
 class NeuralNet():
 
     def __init__(self, data_set, model,
@@ -638,6 +645,13 @@ class NeuralNet():
                 if _test_:
                     self.classmetrics[i]['test'] = []
 
+        # the workers mapping the grids on the fly share the cores
+        worker_init_fn = None
+        if num_workers > 0:
+            worker_init_fn = partial(
+                _init_loader_worker,
+                max(1, cpu_kernel.get_num_threads() // num_workers))
+
         #  create the loaders
         train_loader = data_utils.DataLoader(
             self.data_set,
@@ -645,6 +659,7 @@ class NeuralNet():
             sampler=train_sampler,
             pin_memory=pin,
             num_workers=num_workers,
+            worker_init_fn=worker_init_fn,
             shuffle=False,
             drop_last=True)
         if _valid_:
@@ -654,6 +669,7 @@ class NeuralNet():
                 sampler=valid_sampler,
                 pin_memory=pin,
                 num_workers=num_workers,
+                worker_init_fn=worker_init_fn,
                 shuffle=False,
                 drop_last=True)
         if _test_:
@@ -663,6 +679,7 @@ class NeuralNet():
                 sampler=test_sampler,
                 pin_memory=pin,
                 num_workers=num_workers,
+                worker_init_fn=worker_init_fn,
                 shuffle=False,
                 drop_last=True)
 
@@ -4,6 +4,8 @@ import warnings
 import numpy as np
 from pdb2sql import StructureSimilarity
 
+from deeprank.tools.columnar import read_pdb_data
+
 
 def __compute_target__(decoy, targrp, tarname, save_file=False):
     """Calcuate CAPRI metric IRMSD, LRMSD or FNAT.
@@ -67,7 +69,7 @@ def __compute_target__(decoy, targrp, tarname, save_file=False):
             raise ValueError(
                 f"'native' not exist for {molname}. "
                 f"You must provide reference pdb for computing targets")
-        elif molgrp['native'][()].shape is None:
+        elif read_pdb_data(molgrp['native']).shape is None:
             raise ValueError(
                 f"'native' dataset is empty for {molname}. "
                 f"You must provide reference pdb for computing targets")
@@ -75,8 +77,8 @@ def __compute_target__(decoy, targrp, tarname, save_file=False):
         molname = molname.split('_')[0]
 
         # init the class
-        decoy = molgrp['complex'][()]
-        ref = molgrp['native'][()]
+        decoy = read_pdb_data(molgrp['complex'])
+        ref = read_pdb_data(molgrp['native'])
         sim = StructureSimilarity(decoy, ref)
 
         # comppute the izone/lzone/ref_pairs
@@ -1,3 +1,4 @@
 
 from .sasa import SASA
 from .sparse import *
+from .structure import StructureContext
@@ -0,0 +1,208 @@
+import gzip
+import io
+import os
+import re
+import tarfile
+import threading
+import zipfile
+
+# extensions of the archives of pdb files accepted as sources
+ARCHIVES = ('.tar', '.tar.gz', '.tgz', '.zip')
+
+# extensions of the pdb files, in a directory or in an archive
+PDB_EXTENSIONS = ('.pdb', '.pdb.gz')
+
+# the path of a member is the path of its archive joined with its name
+_MEMBER = re.compile(r'^(.*?(?:\.tar|\.tar\.gz|\.tgz|\.zip))/(.+)$')
+
+# archives opened by each process, the forked processes open their own
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def is_archive(path):
+    """Check if a path is an archive of pdb files.
+
+    Args:
+        path (str): path of the source
+
+    Returns:
+        bool: True for a .tar, .tar.gz, .tgz or .zip file
+    """
+    return path.endswith(ARCHIVES) and os.path.isfile(path)
+
+
+def pdb_name(path):
+    """Get the name of the molecule of a pdb file.
+
+    Args:
+        path (str): pdb file, compressed pdb file or member of an archive
+
+    Returns:
+        str: file name without the .pdb or .pdb.gz extension
+
+    Example:
+        >>> pdb_name('./decoys.tar.gz/1AK4_100w.pdb')
+        '1AK4_100w'
+    """
+    name = os.path.basename(path)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+def split_member(path):
+    """Split the path of a member of an archive.
+
+    Args:
+        path (str): path of a pdb file or of a member of an archive
+
+    Returns:
+        tuple(str): archive and name of the member in the archive,
+            or None and the path if it is not in an archive
+    """
+    match = _MEMBER.match(path)
+    if match is not None and os.path.isfile(match.group(1)):
+        return match.group(1), match.group(2)
+    return None, path
+
+
+def list_archive(archive):
+    """List the pdb files of an archive.
+
+    Only the index of the archive is read, the members are read when
+    the molecules are created. The index of a compressed tar archive
+    is only known once it is decompressed.
+
+    Args:
+        archive (str): .tar, .tar.gz, .tgz or .zip file
+
+    Returns:
+        list(str): paths of the pdb members, in the order of the archive
+
+    Example:
+        >>> list_archive('./decoys.tar.gz')
+        ['./decoys.tar.gz/1AK4_100w.pdb', './decoys.tar.gz/1AK4_101w.pdb']
+    """
+    return [os.path.join(archive, name)
+            for name in _get_archive(archive).names()
+            if name.endswith(PDB_EXTENSIONS)]
+
+
+def open_pdb(path):
+    """Open a pdb file as text.
+
+    The members of the archives are streamed in memory without being
+    extracted.
+
+    Args:
+        path (str): pdb file, .pdb.gz file or member of an archive
+
+    Returns:
+        file object: text content of the pdb file
+    """
+    archive, name = split_member(path)
+    if archive is None:
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt')
+        return open(path, 'r')
+
+    data = _get_archive(archive).read(name)
+    if name.endswith('.gz'):
+        data = gzip.decompress(data)
+    return io.StringIO(data.decode())
+
+
+def load_pdb(path):
+    """Get a pdb file in a form read by pdb2sql.
+
+    Args:
+        path (str): pdb file, .pdb.gz file or member of an archive,
+            the pdb data already read are returned as they are
+
+    Returns:
+        str or list(str): path of a plain pdb file or lines of the others
+    """
+    if not isinstance(path, str) or \
+            (not path.endswith('.gz') and split_member(path)[0] is None):
+        return path
+    with open_pdb(path) as f:
+        return f.readlines()
+
+
+def _get_archive(path):
+    """Get the archive opened by the current process."""
+    key = (os.getpid(), path)
+    with _archives_lock:
+        if key not in _archives:
+            _archives[key] = _Archive(path)
+        return _archives[key]
+
+
+class _Archive(object):
+
+    def __init__(self, path):
+        """Archive of pdb files, read by one thread at a time.
+
+        The members of a tar archive are indexed as the archive is read,
+        so that reading them in the order of the archive decompresses
+        it only once, even if it was not listed by this process.
+
+        Args:
+            path (str): .tar, .tar.gz, .tgz or .zip file
+        """
+        self.lock = threading.Lock()
+        self.zip = None
+        self.tar = None
+        if zipfile.is_zipfile(path):
+            self.zip = zipfile.ZipFile(path)
+        else:
+            self.tar = tarfile.open(path, 'r:*')
+            self.members = {}
+            self.complete = False
+
+    def _next(self):
+        """Index the next file of the tar archive."""
+        member = self.tar.next()
+        while member is not None and not member.isfile():
+            member = self.tar.next()
+        if member is None:
+            self.complete = True
+        else:
+            self.members[member.name] = member
+        return member
+
+    def names(self):
+        """Get the names of the files of the archive."""
+        with self.lock:
+            if self.zip is not None:
+                return [info.filename for info in self.zip.infolist()
+                        if not info.is_dir()]
+            while not self.complete:
+                self._next()
+            return list(self.members)
+
+    def read(self, name):
+        """Read a member of the archive.
+
+        Args:
+            name (str): name of the member in the archive
+
+        Returns:
+            bytes: content of the member
+
+        Raises:
+            KeyError: if the member is not in the archive
+        """
+        with self.lock:
+            if self.zip is not None:
+                return self.zip.read(name)
+
+            member = self.members.get(name)
+            while member is None and not self.complete:
+                member = self._next()
+                if member is not None and member.name != name:
+                    member = None
+            if member is None:
+                raise KeyError(f'{name} not found in {self.tar.name}')
+            return self.tar.extractfile(member).read()
@@ -0,0 +1,82 @@
+import numpy as np
+import pdb2sql
+
+
+def is_virtual(molgrp):
+    """Check if a molecule group is a virtual rotated copy.
+
+    A virtual group only stores the rotation parameters (attrs axis,
+    angle and center) and links to the complex, native, features and
+    targets of its source group. The coordinates are rotated when the
+    data is read.
+
+    Args:
+        molgrp (h5py.Group): molecule group
+
+    Returns:
+        bool: True if the group is virtual
+    """
+    return bool(molgrp.attrs.get('virtual', False))
+
+
+def rotate_xyz(molgrp, xyz):
+    """Rotate positions with the rotation of a virtual group.
+
+    Args:
+        molgrp (h5py.Group): molecule group
+        xyz (np.array): positions read through the links of the group
+
+    Returns:
+        np.array: rotated positions, or xyz if the group is not virtual
+    """
+    if not is_virtual(molgrp) or len(xyz) == 0:
+        return xyz
+    return pdb2sql.transform.rot_xyz_around_axis(
+        np.array(xyz), molgrp.attrs['axis'], molgrp.attrs['angle'],
+        molgrp.attrs['center'])
+
+
+def rotate_sql(molgrp, sqldb):
+    """Rotate in place the database created from the complex of a group.
+
+    Args:
+        molgrp (h5py.Group): molecule group
+        sqldb (pdb2sql.pdb2sql): database of molgrp['complex']
+
+    Returns:
+        pdb2sql.pdb2sql: the database
+    """
+    if is_virtual(molgrp):
+        sqldb.update('x,y,z', rotate_xyz(molgrp, sqldb.get('x,y,z')))
+    return sqldb
+
+
+def get_feature(molgrp, name):
+    """Read a xyz feature of a molecule group.
+
+    Args:
+        molgrp (h5py.Group): molecule group
+        name (str): feature name
+
+    Returns:
+        np.array: feature data (chain x y z values)
+
+    Example:
+        >>> data = get_feature(f5['1AK4_100w_r001'], 'bsa')
+    """
+    data = molgrp['features/' + name][()]
+    if is_virtual(molgrp) and data.shape[0] != 0:
+        data[:, 1:4] = rotate_xyz(molgrp, data[:, 1:4])
+    return data
+
+
+def get_source(molgrp):
+    """Get the name of the original group of a virtual group.
+
+    Args:
+        molgrp (h5py.Group): virtual molecule group
+
+    Returns:
+        str: name of the group linked by molgrp['complex']
+    """
+    return molgrp.get('complex', getlink=True).path.rsplit('/', 1)[0]
@@ -0,0 +1,248 @@
+import bisect
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+# first wildcard of a glob pattern
+_MAGIC = re.compile(r'[*?[]')
+
+
+def has_wildcards(pattern):
+    """Check if a name is a glob pattern, i.e. contains *, ? or [."""
+    return _MAGIC.search(pattern) is not None
+
+
+class NameIndex(object):
+
+    def __init__(self, names):
+        """Sorted file names searched by prefix or glob pattern.
+
+        Args:
+            names (iterable(str)): file names
+        """
+        self.names = sorted(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def startswith(self, prefix):
+        """Get the names starting with a prefix.
+
+        Args:
+            prefix (str): prefix of the names
+
+        Returns:
+            list(str): sorted names
+        """
+        start = bisect.bisect_left(self.names, prefix)
+        end = start
+        while end < len(self.names) and \
+                self.names[end].startswith(prefix):
+            end += 1
+        return self.names[start:end]
+
+    def glob(self, pattern):
+        """Get the names matching a glob pattern, e.g. '1AK4_*w.pdb'.
+
+        The names are first narrowed to the ones starting with the
+        characters of the pattern before its first wildcard.
+
+        Args:
+            pattern (str): glob pattern (case sensitive)
+
+        Returns:
+            list(str): sorted names
+        """
+        match = _MAGIC.search(pattern)
+        if match is None:
+            i = bisect.bisect_left(self.names, pattern)
+            found = i < len(self.names) and self.names[i] == pattern
+            return [pattern] if found else []
+        return [name for name in self.startswith(pattern[:match.start()])
+                if fnmatch.fnmatchcase(name, pattern)]
+
+
+class FileIndex(object):
+
+    def __init__(self, files):
+        """Index of file paths by file name.
+
+        The compressed pdb files are indexed without the .gz extension,
+        e.g. '1AK4_100w.pdb.gz' as '1AK4_100w.pdb'.
+
+        Args:
+            files (iterable(str)): file paths
+
+        Example:
+            >>> index = FileIndex(['./decoys/1AK4_100w.pdb'])
+            >>> index['1AK4_100w.pdb']
+            ['./decoys/1AK4_100w.pdb']
+            >>> index.glob('1AK4_*w.pdb')
+            ['./decoys/1AK4_100w.pdb']
+        """
+        self.files = list(files)
+        self.paths = {}
+        for f in self.files:
+            name = os.path.basename(f)
+            if name.endswith('.pdb.gz'):
+                name = name[:-3]
+            self.paths.setdefault(name, []).append(f)
+        self.names = NameIndex(self.paths)
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def __getitem__(self, name):
+        return list(self.paths[name])
+
+    def _get_paths(self, names):
+        return [f for name in names for f in self.paths[name]]
+
+    def startswith(self, prefix):
+        """Get the paths of the files whose name starts with a prefix."""
+        return self._get_paths(self.names.startswith(prefix))
+
+    def glob(self, pattern):
+        """Get the paths of the files whose name matches a glob pattern."""
+        return self._get_paths(self.names.glob(pattern))
+
+
+class SourceCatalog(object):
+
+    def __init__(self, path=None):
+        """Catalog of the files of the source directories.
+
+        Each directory is listed once with os.scandir and its file names
+        are indexed for the prefix and glob searches. A listing is valid
+        as long as the modification time of its directory is unchanged,
+        i.e. no file was added, removed or renamed in it. The listings
+        are also saved in the directory path, if given, to be reused by
+        the next runs.
+
+        Args:
+            path (str, optional): directory where the listings are saved,
+                created if needed. Defaults to None (in memory only).
+
+        Example:
+            >>> catalog = SourceCatalog('./source_catalog')
+            >>> catalog.startswith('./1AK4/pssm_new/', '1AK4.')
+            ['1AK4.C.pssm', '1AK4.D.pssm']
+            >>> database = DataGenerator(..., source_catalog=catalog)
+        """
+        self.path = path
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+
+        # {directory: (modification time, NameIndex)}
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+        # number of directories listed by this process
+        self.scans = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def list(self, directory):
+        """Get the names of the files of a directory.
+
+        Args:
+            directory (str): directory
+
+        Returns:
+            list(str): sorted file names
+        """
+        return list(self._get_index(directory).names)
+
+    def startswith(self, directory, prefix):
+        """Get the names of the files of a directory starting with a prefix.
+
+        Args:
+            directory (str): directory
+            prefix (str): prefix of the file names
+
+        Returns:
+            list(str): sorted file names
+        """
+        return self._get_index(directory).startswith(prefix)
+
+    def glob(self, directory, pattern):
+        """Get the names of the files of a directory matching a pattern.
+
+        Args:
+            directory (str): directory
+            pattern (str): glob pattern of the file names
+
+        Returns:
+            list(str): sorted file names
+        """
+        return self._get_index(directory).glob(pattern)
+
+    def _get_index(self, directory):
+        """Get the index of a directory, listed if it changed."""
+        directory = os.path.abspath(directory)
+        mtime = os.stat(directory).st_mtime_ns
+
+        with self.lock:
+            mtime_index = self.indexes.get(directory)
+        if mtime_index is not None and mtime_index[0] == mtime:
+            return mtime_index[1]
+
+        names = self._load(directory, mtime)
+        if names is None:
+            with os.scandir(directory) as entries:
+                names = [e.name for e in entries if e.is_file()]
+            self._save(directory, mtime, names)
+            self.scans += 1
+
+        index = NameIndex(names)
+        with self.lock:
+            self.indexes[directory] = (mtime, index)
+        return index
+
+    def _get_filename(self, directory):
+        """Get the file of the saved listing of a directory."""
+        key = hashlib.sha256(directory.encode()).hexdigest()
+        return os.path.join(self.path, key + '.json')
+
+    def _load(self, directory, mtime):
+        """Load the saved listing of a directory if still valid.
+
+        Returns:
+            list(str): file names or None
+        """
+        if self.path is None:
+            return None
+        try:
+            with open(self._get_filename(directory)) as f:
+                listing = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if listing.get('directory') != directory or \
+                listing.get('mtime_ns') != mtime:
+            return None
+        return listing['names']
+
+    def _save(self, directory, mtime, names):
+        """Save the listing of a directory.
+
+        The listing is written in a temporary file renamed once complete
+        so that the other processes never read a partial listing.
+        """
+        if self.path is None:
+            return
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'directory': directory, 'mtime_ns': mtime,
+                       'names': names}, f)
+        os.replace(tmp, self._get_filename(directory))
@@ -0,0 +1,187 @@
+import h5py
+import numpy as np
+import pdb2sql
+
+# columns of the pdb2sql database
+COLUMNS = ['serial', 'name', 'altLoc', 'resName', 'chainID', 'resSeq',
+           'iCode', 'x', 'y', 'z', 'occ', 'temp', 'element', 'model']
+
+# text columns stored as integer codes of a list of labels
+CATEGORICAL = ['name', 'altLoc', 'resName', 'chainID', 'iCode', 'element']
+
+
+def is_columnar(obj):
+    """Check if a structure is stored in the columnar format.
+
+    Args:
+        obj (h5py.Group or h5py.Dataset): structure, e.g. molgrp['complex']
+
+    Returns:
+        bool: True for a columnar group, False for pdb lines
+    """
+    return isinstance(obj, h5py.Group) and \
+        obj.attrs.get('format', '') == 'columnar'
+
+
+def sql_to_columns(sqldb):
+    """Extract the columns of a structure.
+
+    Args:
+        sqldb (pdb2sql.pdb2sql): database of the structure
+
+    Returns:
+        dict: array of each column of COLUMNS and number of models
+    """
+    data = sqldb.get(','.join(COLUMNS))
+    columns = {name: np.array([d[i] for d in data])
+               for i, name in enumerate(COLUMNS)}
+    columns['nmodel'] = sqldb._nModel
+
+    # same precision as the pdb lines
+    for name, fmt in [('x', '.3f'), ('y', '.3f'), ('z', '.3f'),
+                      ('occ', '.2f'), ('temp', '.2f')]:
+        columns[name] = np.array(
+            [float(format(v, fmt)) for v in columns[name]])
+    return columns
+
+
+def write_columns(grp, name, columns):
+    """Store a structure in the columnar format.
+
+    The coordinates are stored as a float32 array xyz, the text columns
+    as integer codes with their labels in the attribute 'labels' and
+    the numbers as int32/float32 arrays.
+
+    Args:
+        grp (h5py.Group): group where to store the structure
+        name (str): name of the structure, e.g. 'complex'
+        columns (dict): columns of the structure (see sql_to_columns)
+
+    Example:
+        >>> sqldb = pdb2sql.pdb2sql('1AK4_100w.pdb')
+        >>> write_columns(molgrp, 'complex', sql_to_columns(sqldb))
+    """
+    strgrp = grp.create_group(name)
+    strgrp.attrs['format'] = 'columnar'
+    strgrp.attrs['nmodel'] = columns['nmodel']
+
+    xyz = np.stack([columns['x'], columns['y'], columns['z']], -1)
+    strgrp.create_dataset('xyz', data=xyz.astype(np.float32))
+
+    for col in CATEGORICAL:
+        labels, codes = np.unique(columns[col].astype(str),
+                                  return_inverse=True)
+        dtype = np.uint8 if len(labels) <= 256 else np.uint16
+        dset = strgrp.create_dataset(col, data=codes.astype(dtype))
+        dset.attrs['labels'] = labels.astype('S')
+
+    for col in ['serial', 'resSeq', 'model']:
+        strgrp.create_dataset(col, data=columns[col].astype(np.int32))
+    for col in ['occ', 'temp']:
+        strgrp.create_dataset(col, data=columns[col].astype(np.float32))
+
+
+def read_columns(strgrp):
+    """Read the columns of a structure stored in the columnar format.
+
+    The float32 values are rounded to the precision of the pdb format,
+    so that they are identical to the values parsed by pdb2sql.
+
+    Args:
+        strgrp (h5py.Group): columnar structure
+
+    Returns:
+        dict: array of each column of COLUMNS and number of models
+    """
+    columns = {'nmodel': int(strgrp.attrs['nmodel'])}
+    xyz = np.round(strgrp['xyz'][()].astype(np.float64), 3)
+    columns['x'], columns['y'], columns['z'] = xyz.T
+
+    for col in CATEGORICAL:
+        labels = strgrp[col].attrs['labels'].astype(str)
+        columns[col] = labels[strgrp[col][()]]
+
+    for col in ['serial', 'resSeq', 'model']:
+        columns[col] = strgrp[col][()]
+    for col in ['occ', 'temp']:
+        columns[col] = np.round(strgrp[col][()].astype(np.float64), 2)
+
+    return columns
+
+
+def read_structure(obj):
+    """Read a structure in a format accepted by StructureContext.
+
+    Args:
+        obj (h5py.Group or h5py.Dataset): structure, e.g. molgrp['complex']
+
+    Returns:
+        dict or np.array: columns of a columnar structure or pdb lines
+    """
+    if is_columnar(obj):
+        return read_columns(obj)
+    return obj[()]
+
+
+def read_sql(obj):
+    """Create the pdb2sql interface of a structure.
+
+    Args:
+        obj (h5py.Group or h5py.Dataset): structure, e.g. molgrp['complex']
+
+    Returns:
+        ColumnarInterface: database of the structure
+    """
+    return ColumnarInterface(read_structure(obj))
+
+
+def read_pdb_data(obj):
+    """Read a structure as pdb lines.
+
+    Args:
+        obj (h5py.Group or h5py.Dataset): structure, e.g. molgrp['complex']
+
+    Returns:
+        np.array: pdb lines of the structure
+    """
+    if not is_columnar(obj):
+        return obj[()]
+    sqldb = read_sql(obj)
+    data = np.array(sqldb.sql2pdb()).astype('|S78')
+    sqldb._close()
+    return data
+
+
+class ColumnarInterface(pdb2sql.interface):
+
+    def __init__(self, pdb, **kwargs):
+        """pdb2sql interface created from the columns of a structure.
+
+        The columns are inserted in the database without writing and
+        parsing pdb lines. Other inputs are handled by pdb2sql.interface.
+
+        Args:
+            pdb (dict, str, list, ndarray): columns of the structure
+                (see read_columns), pdb file or data
+
+        Example:
+            >>> sqldb = ColumnarInterface(read_columns(molgrp['complex']))
+            >>> xyz = sqldb.get('x,y,z', chainID='A')
+        """
+        super().__init__(pdb, **kwargs)
+
+    def _create_table(self, pdbfile, tablename='ATOM'):
+        """Create the table of the atoms from the columns."""
+
+        if not isinstance(pdbfile, dict):
+            return super()._create_table(pdbfile, tablename=tablename)
+
+        header = ', '.join(f'{name} {ctype}'
+                           for name, ctype in self.col.items())
+        self.c.execute(f'CREATE TABLE {tablename} ({header})')
+
+        self._nModel = pdbfile['nmodel']
+        rows = zip(*[pdbfile[name].tolist() for name in self.col])
+        qm = ','.join('?' * len(self.col))
+        self.c.executemany(
+            f'INSERT INTO {tablename} VALUES ({qm})', rows)
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+
+import h5py
+
+# compressors accepted by compact_hdf5, besides 'keep' and None
+COMPRESSIONS = ['gzip', 'lzf']
+
+
+def compact_hdf5(fname, compression='keep', compression_opts=None,
+                 block_size=2**26):
+    """Reclaim the space left by the data removed from a hdf5 file.
+
+    The objects still linked in the file are copied in a new file,
+    dataset by dataset and block by block so that the memory used does
+    not depend on the size of the datasets. The new file replaces the
+    original one once complete: an interrupted compaction leaves the
+    original file untouched.
+
+    Hard links (e.g. the natives shared by several molecules), soft
+    links (e.g. the virtual augmented molecules) and external links
+    are preserved.
+
+    Args:
+        fname (str): hdf5 file
+        compression (str, optional): 'keep' the compression of each
+            dataset, re-encode all the datasets with 'gzip' or 'lzf'
+            (faster), or None to store them uncompressed.
+            Defaults to 'keep'.
+        compression_opts (int, optional): level of the gzip compression
+        block_size (int, optional): maximum number of bytes of a
+            dataset copied at once. Defaults to 64 MB.
+
+    Returns:
+        int: number of bytes reclaimed
+
+    Example:
+        >>> reclaimed = compact_hdf5('1ak4.hdf5', compression='lzf')
+    """
+    if compression not in COMPRESSIONS + ['keep', None]:
+        raise ValueError(
+            f'Compression {compression} not supported, '
+            f'options are {COMPRESSIONS} or keep/None')
+
+    size = os.path.getsize(fname)
+
+    # the temporary file is in the same directory so that the
+    # files are swapped atomically by os.replace
+    dirname = os.path.dirname(os.path.abspath(fname))
+    fd, tmp = tempfile.mkstemp(
+        prefix='.' + os.path.basename(fname) + '.', suffix='.tmp',
+        dir=dirname)
+    os.close(fd)
+
+    try:
+        with h5py.File(fname, 'r') as fin, h5py.File(tmp, 'w') as fout:
+            copier = _Copier(compression, compression_opts, block_size)
+            copier.copy_group(fin, fout)
+        shutil.copymode(fname, tmp)
+        os.replace(tmp, fname)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    return size - os.path.getsize(fname)
+
+
+class _Copier(object):
+
+    def __init__(self, compression, compression_opts, block_size):
+        """Copy the content of a hdf5 file in another one.
+
+        Args:
+            compression (str): 'keep', 'gzip', 'lzf' or None
+            compression_opts (int): level of the gzip compression
+            block_size (int): maximum number of bytes copied at once
+        """
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.block_size = block_size
+
+        # path of the copy of each object, to copy the hard links
+        self.copied = {}
+
+    @staticmethod
+    def copy_attrs(src, dest):
+        """Copy the attributes of an object with their types."""
+        for name, value in src.attrs.items():
+            dtype = src.attrs.get_id(name).dtype
+            dest.attrs.create(name, value, dtype=dtype)
+
+    def copy_group(self, src, dest):
+        """Copy the attributes and links of a group.
+
+        Args:
+            src (h5py.Group): group to copy
+            dest (h5py.Group): empty destination group
+        """
+        self.copy_attrs(src, dest)
+        for name in src:
+            link = src.get(name, getlink=True)
+
+            if isinstance(link, h5py.SoftLink):
+                dest[name] = h5py.SoftLink(link.path)
+                continue
+            if isinstance(link, h5py.ExternalLink):
+                dest[name] = h5py.ExternalLink(link.filename, link.path)
+                continue
+
+            obj = src[name]
+            path = self.copied.get(obj.id)
+            if path is not None:
+                dest[name] = dest.file[path]
+            elif isinstance(obj, h5py.Group):
+                self.copy_group(obj, dest.create_group(name))
+            elif isinstance(obj, h5py.Dataset):
+                self.copy_dataset(obj, dest, name)
+            else:
+                src.file.copy(obj, dest, name)
+            self.copied[obj.id] = dest[name].name
+
+    def copy_dataset(self, dset, dest, name):
+        """Copy a dataset block by block.
+
+        Args:
+            dset (h5py.Dataset): dataset to copy
+            dest (h5py.Group): destination group
+            name (str): name of the copy
+        """
+        if dset.shape is None:
+            out = dest.create_dataset(name, data=h5py.Empty(dset.dtype))
+            self.copy_attrs(dset, out)
+            return
+
+        kwargs = {}
+        if dset.shape:
+            if self.compression == 'keep':
+                kwargs = {'chunks': dset.chunks,
+                          'compression': dset.compression,
+                          'compression_opts': dset.compression_opts,
+                          'shuffle': dset.shuffle,
+                          'fletcher32': dset.fletcher32,
+                          'scaleoffset': dset.scaleoffset}
+            elif self.compression is not None:
+                kwargs = {'compression': self.compression,
+                          'shuffle': dset.shuffle}
+                if self.compression == 'gzip':
+                    kwargs['compression_opts'] = self.compression_opts
+            if dset.maxshape != dset.shape:
+                kwargs['maxshape'] = dset.maxshape
+
+        out = dest.create_dataset(name, shape=dset.shape, dtype=dset.dtype,
+                                  **kwargs)
+        self.copy_attrs(dset, out)
+
+        if not dset.shape:
+            out[()] = dset[()]
+            return
+
+        # number of rows copied at once
+        row_size = max(dset.dtype.itemsize, 1)
+        for n in dset.shape[1:]:
+            row_size *= n
+        nrows = max(self.block_size // max(row_size, 1), 1)
+        for start in range(0, dset.shape[0], nrows):
+            out[start:start + nrows] = dset[start:start + nrows]
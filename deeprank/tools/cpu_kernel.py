@@ -0,0 +1,238 @@
+import ctypes
+import hashlib
+import importlib.machinery
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from deeprank.config import logger
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+# C source of the kernels, built as the extension _kernel_map_cpu by
+# setup.py or compiled the first time they are used
+SOURCE = os.path.join(_HERE, 'kernel_map_cpu.c')
+EXTENSION = '_kernel_map_cpu'
+
+_FLAGS = ['-O3', '-fPIC', '-shared', '-pthread']
+
+_lib = None
+_lib_loaded = False
+_lib_lock = threading.Lock()
+
+_num_threads = None
+
+_double_p = ctypes.POINTER(ctypes.c_double)
+_float_p = ctypes.POINTER(ctypes.c_float)
+_ARGTYPES = {
+    'gaussian': [ctypes.c_int, _double_p, _double_p, ctypes.c_int,
+                 ctypes.c_double, ctypes.c_double],
+    'atomic_densities': [ctypes.c_int, _double_p, ctypes.c_double],
+}
+_GRID_ARGTYPES = [_double_p, ctypes.c_int, _double_p, ctypes.c_int,
+                  _double_p, ctypes.c_int, ctypes.c_double, ctypes.c_double,
+                  _float_p, ctypes.c_int]
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def set_num_threads(num_threads):
+    """Set the number of threads of the kernels in this process.
+
+    Each process has its own number of threads, e.g. set by each worker
+    of a torch DataLoader so that the workers share the cores.
+
+    Args:
+        num_threads (int): number of threads, None for the default, i.e.
+            the DEEPRANK_NUM_THREADS environment variable or all the
+            cores available
+    """
+    global _num_threads
+    if num_threads is not None and num_threads < 1:
+        raise ValueError(
+            f'num_threads must be a positive integer, got {num_threads}')
+    _num_threads = num_threads
+
+
+def get_num_threads():
+    """Get the number of threads of the kernels in this process."""
+    if _num_threads is not None:
+        return _num_threads
+    env = os.environ.get('DEEPRANK_NUM_THREADS')
+    if env:
+        return max(1, int(env))
+    return _cpu_count()
+
+
+def _find_extension():
+    """Find the kernels built with the package.
+
+    Returns:
+        str: path of the shared library or None
+    """
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        lib = os.path.join(_HERE, EXTENSION + suffix)
+        if os.path.isfile(lib):
+            return lib
+    return None
+
+
+def _check_private(path, directory):
+    """Check that a path is owned by the user and not writable by others.
+
+    Raises:
+        OSError: the path is a link, is owned by another user, or can be
+            modified by another user
+    """
+    st = os.lstat(path)
+    kind = stat.S_ISDIR if directory else stat.S_ISREG
+    if not kind(st.st_mode):
+        raise OSError(f'{path} is not a regular '
+                      f'{"directory" if directory else "file"}')
+    if st.st_uid != os.getuid():
+        raise OSError(f'{path} is not owned by the current user')
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise OSError(f'{path} is writable by other users')
+
+
+def _get_cache_dir():
+    """Get the private directory of the compiled kernels of the user.
+
+    The directory is ~/.cache/deeprank (or $XDG_CACHE_HOME/deeprank),
+    else a directory of the user in the temporary directory. It is
+    created with mode 0700 and only used if the user owns it and the
+    other users can not write in it.
+
+    Raises:
+        OSError: no private directory
+
+    Returns:
+        str: path of the directory
+    """
+    cache = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    candidates = [os.path.join(cache, 'deeprank'),
+                  os.path.join(tempfile.gettempdir(),
+                               f'deeprank_kernels_{os.getuid()}')]
+    errors = []
+    for directory in candidates:
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            _check_private(directory, directory=True)
+            return directory
+        except OSError as e:
+            errors.append(str(e))
+    raise OSError('no private cache directory: ' + '; '.join(errors))
+
+
+def _compile():
+    """Compile the kernels in the cache directory, once per source.
+
+    Returns:
+        str: path of the shared library
+    """
+    with open(SOURCE, 'rb') as f:
+        key = hashlib.sha256(f.read() + ' '.join(_FLAGS).encode())
+    directory = _get_cache_dir()
+    lib = os.path.join(directory,
+                       f'kernel_map_cpu_{key.hexdigest()[:16]}.so')
+    if os.path.lexists(lib):
+        _check_private(lib, directory=False)
+        return lib
+
+    # compiled in a temporary file renamed once complete so that
+    # the other processes never load a partial library
+    fd, tmp = tempfile.mkstemp(suffix='.so', dir=directory)
+    os.close(fd)
+    try:
+        cc = os.environ.get('CC', 'cc')
+        subprocess.run([cc] + _FLAGS + [SOURCE, '-o', tmp, '-lm'],
+                       check=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE)
+        os.chmod(tmp, 0o700)
+        os.replace(tmp, lib)
+    finally:
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+    return lib
+
+
+def get_kernels():
+    """Get the compiled kernels.
+
+    The kernels built with the package are used, otherwise they are
+    compiled in the cache directory of the user (see _get_cache_dir).
+    The kernels are disabled with DEEPRANK_CPU_KERNEL=0.
+
+    Returns:
+        ctypes.CDLL: library of the kernels, None if it can not be
+            compiled, e.g. without C compiler
+    """
+    global _lib, _lib_loaded
+    with _lib_lock:
+        if _lib_loaded:
+            return _lib
+        _lib_loaded = True
+        if os.environ.get('DEEPRANK_CPU_KERNEL', '1') == '0' or \
+                sys.platform == 'win32':
+            return None
+        try:
+            lib = ctypes.CDLL(_find_extension() or _compile())
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(f'CPU kernel not compiled, mapping with numpy: {e}')
+            return None
+        for name, argtypes in _ARGTYPES.items():
+            func = getattr(lib, name)
+            func.argtypes = argtypes + _GRID_ARGTYPES
+            func.restype = None
+        _lib = lib
+        return _lib
+
+
+def _pointer(array, ctype):
+    return array.ctypes.data_as(ctypes.POINTER(ctype))
+
+
+def map_on_grid(name, axes, res, centers, params, grids):
+    """Map all the centers of the channels with a compiled kernel.
+
+    The GIL is released during the mapping.
+
+    Args:
+        name (str): 'gaussian' or 'atomic_densities'
+        axes (list(np.array)): coordinates of the grid points along x,
+            y and z
+        res (np.array): resolution of the grid along x, y and z
+        centers (np.array): positions of the centers, shape (n, 3)
+        params (list): values of the channels at the centers, shape
+            (n, m), beta and cutoff for 'gaussian', vdw radius for
+            'atomic_densities' (one channel)
+        grids (np.array): C-contiguous float32 grids of shape
+            (m, nx, ny, nz) the kernels are added to
+    """
+    lib = get_kernels()
+
+    xyz = np.ascontiguousarray(centers, dtype=np.float64)
+    args = [len(xyz), _pointer(xyz, ctypes.c_double)]
+    if name == 'gaussian':
+        values = np.ascontiguousarray(params[0], dtype=np.float64)
+        args += [_pointer(values, ctypes.c_double), values.shape[1]]
+        params = params[1:]
+    args += list(params)
+    axes = [np.ascontiguousarray(a, dtype=np.float64) for a in axes]
+    for a in axes:
+        args += [_pointer(a, ctypes.c_double), len(a)]
+    args += [res[1], res[2], _pointer(grids, ctypes.c_float),
+             get_num_threads()]
+
+    getattr(lib, name)(*args)
@@ -0,0 +1,171 @@
+#include <math.h>
+#include <pthread.h>
+
+/*
+CPU counterpart of deeprank/generate/kernel_map.c
+
+Each call maps all the centers of one or several channels on the grid.
+The grid is split in slabs along x, one per thread, so that each grid
+point is only written by one thread. Each center only visits the grid
+points within the cutoff of its kernel, and the weight of the kernel
+is computed once for all the channels.
+
+The grid point [i, j, k] of the channel c is at (x[i], y[j], z[k]) and
+is stored at out[((c * nx + i) * ny + j) * nz + k]. The value of the
+center a in the channel c is values[a * nchan + c].
+*/
+
+#define GAUSSIAN 0
+#define ATOMIC_DENSITIES 1
+
+#define MAX_THREADS 256
+
+typedef struct {
+    int kernel;
+    double param;
+    double cutoff;
+    int natom;
+    const double *xyz;
+    const double *values;
+    int nchan;
+    const double *x;
+    const double *y;
+    const double *z;
+    int nx, ny, nz;
+    double resy, resz;
+    float *out;
+    int start, end;
+} task_t;
+
+static double kernel_value(int kernel, double param, double d)
+{
+    if (kernel == GAUSSIAN)
+        return exp(-param * d);
+
+    /*
+    the formula is equation (1) of the Koes paper
+    Protein-Ligand Scoring with Convolutional NN Arxiv:1612.02751v1
+    */
+    double e2 = exp(2.0);
+    if (d < param)
+        return exp(-2. * d * d / (param * param));
+    return 4. * d * d / (e2 * param * param) - 12. * d / (e2 * param) + 9. / e2;
+}
+
+/* indexes of the points of an axis between low and high */
+static void axis_range(const double *axis, int n, double res,
+                       double low, double high, int *first, int *last)
+{
+    *first = (int)floor((low - axis[0]) / res);
+    *last = (int)ceil((high - axis[0]) / res);
+    if (*first < 0)
+        *first = 0;
+    if (*last > n - 1)
+        *last = n - 1;
+}
+
+static void *map_slabs(void *arg)
+{
+    const task_t *t = (const task_t *)arg;
+    double cutoff2 = t->cutoff * t->cutoff;
+    long size = (long)t->nx * t->ny * t->nz;
+
+    for (int i = t->start; i < t->end; i++) {
+        for (int a = 0; a < t->natom; a++) {
+
+            double x0 = t->xyz[3 * a];
+            double y0 = t->xyz[3 * a + 1];
+            double z0 = t->xyz[3 * a + 2];
+            const double *value = t->values == NULL ? NULL :
+                t->values + (long)a * t->nchan;
+
+            double dx = t->x[i] - x0;
+            double rx2 = cutoff2 - dx * dx;
+            if (rx2 <= 0)
+                continue;
+
+            int jfirst, jlast;
+            double rx = sqrt(rx2);
+            axis_range(t->y, t->ny, t->resy, y0 - rx, y0 + rx, &jfirst, &jlast);
+
+            for (int j = jfirst; j <= jlast; j++) {
+                double dy = t->y[j] - y0;
+                double ry2 = rx2 - dy * dy;
+                if (ry2 <= 0)
+                    continue;
+
+                int kfirst, klast;
+                double ry = sqrt(ry2);
+                axis_range(t->z, t->nz, t->resz, z0 - ry, z0 + ry,
+                           &kfirst, &klast);
+
+                float *row = t->out + ((long)i * t->ny + j) * t->nz;
+                for (int k = kfirst; k <= klast; k++) {
+                    double dz = t->z[k] - z0;
+                    double d = sqrt(dx * dx + dy * dy + dz * dz);
+                    if (d >= t->cutoff)
+                        continue;
+                    double w = kernel_value(t->kernel, t->param, d);
+                    if (value == NULL)
+                        row[k] += (float)w;
+                    else
+                        for (int c = 0; c < t->nchan; c++)
+                            row[c * size + k] += (float)(w * value[c]);
+                }
+            }
+        }
+    }
+    return NULL;
+}
+
+static void map_grid(task_t *task, int nthreads)
+{
+    pthread_t threads[MAX_THREADS];
+    task_t tasks[MAX_THREADS];
+    int started[MAX_THREADS];
+
+    if (nthreads > task->nx)
+        nthreads = task->nx;
+    if (nthreads > MAX_THREADS)
+        nthreads = MAX_THREADS;
+    if (nthreads < 1)
+        nthreads = 1;
+
+    for (int n = 0; n < nthreads; n++) {
+        tasks[n] = *task;
+        tasks[n].start = (int)((long)task->nx * n / nthreads);
+        tasks[n].end = (int)((long)task->nx * (n + 1) / nthreads);
+
+        /* the slab is mapped by the calling thread if no thread starts */
+        started[n] = n > 0 &&
+            pthread_create(&threads[n], NULL, map_slabs, &tasks[n]) == 0;
+        if (n > 0 && !started[n])
+            map_slabs(&tasks[n]);
+    }
+    map_slabs(&tasks[0]);
+
+    for (int n = 1; n < nthreads; n++)
+        if (started[n])
+            pthread_join(threads[n], NULL);
+}
+
+void gaussian(int natom, const double *xyz, const double *values,
+              int nchan, double beta, double cutoff,
+              const double *x, int nx, const double *y, int ny,
+              const double *z, int nz, double resy, double resz,
+              float *out, int nthreads)
+{
+    task_t task = {GAUSSIAN, beta, cutoff, natom, xyz, values, nchan,
+                   x, y, z, nx, ny, nz, resy, resz, out, 0, nx};
+    map_grid(&task, nthreads);
+}
+
+void atomic_densities(int natom, const double *xyz, double vdw_radius,
+                      const double *x, int nx, const double *y, int ny,
+                      const double *z, int nz, double resy, double resz,
+                      float *out, int nthreads)
+{
+    task_t task = {ATOMIC_DENSITIES, vdw_radius, 1.5 * vdw_radius, natom,
+                   xyz, NULL, 1, x, y, z, nx, ny, nz, resy, resz, out, 0, nx};
+    map_grid(&task, nthreads);
+}
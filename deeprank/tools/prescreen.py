@@ -0,0 +1,89 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from deeprank.tools.archives import open_pdb
+
+
+def get_chain_id(line):
+    """Get the chain ID of an ATOM line the same way as pdb2sql.
+
+    The segID (columns 73-76) is used if the chain ID is blank.
+
+    Args:
+        line (str): ATOM line padded to 80 characters
+
+    Raises:
+        ValueError: no chain ID nor segID
+
+    Returns:
+        str: chain ID
+    """
+    chain = line[21:22].strip() or line[72:76].strip()
+    if not chain:
+        raise ValueError(f'chainID not found:\n{line}')
+    return chain
+
+
+def read_chain_xyz(pdbfile, chains):
+    """Read the positions of the atoms of some chains of a pdb file.
+
+    Only the chain ID and the coordinates of the ATOM lines are parsed,
+    the short lines are padded as pdb2sql does.
+
+    Args:
+        pdbfile (str): pdb file, .pdb.gz file or member of an archive
+        chains (list(str)): chain IDs
+
+    Raises:
+        ValueError: ATOM line that can not be parsed
+
+    Returns:
+        dict: {chain ID: np.array of the positions (natom x 3)}
+    """
+    xyz = {c: [] for c in chains}
+    with open_pdb(pdbfile) as fi:
+        for line in fi:
+            if not line.startswith('ATOM'):
+                continue
+            line = line.rstrip('\r\n').ljust(80)
+            chain = get_chain_id(line)
+            if chain in xyz:
+                xyz[chain].append(
+                    (float(line[30:38]), float(line[38:46]),
+                     float(line[46:54])))
+    return {c: np.array(pos, dtype=float).reshape(-1, 3)
+            for c, pos in xyz.items()}
+
+
+def count_contact_atoms(pdbfile, chain1, chain2, cutoff=8.5):
+    """Count the atoms of each chain close to the other chain.
+
+    A cheap estimate of the size of the interface, computed with a
+    k-d tree before parsing the structure with pdb2sql.
+
+    Args:
+        pdbfile (str): pdb file
+        chain1 (str): first chain ID
+        chain2 (str): second chain ID
+        cutoff (float): distance cutoff. Defaults to 8.5.
+
+    Raises:
+        ValueError: ATOM line that can not be parsed
+
+    Returns:
+        tuple(int): number of contact atoms of chain1 and of chain2
+
+    Example:
+        >>> n1, n2 = count_contact_atoms('1AK4_100w.pdb', 'C', 'D')
+    """
+    xyz = read_chain_xyz(pdbfile, [chain1, chain2])
+    xyz1, xyz2 = xyz[chain1], xyz[chain2]
+    if len(xyz1) == 0 or len(xyz2) == 0:
+        return 0, 0
+
+    # the distance to the nearest atom of the other chain
+    # is infinite beyond the cutoff
+    dist1, _ = cKDTree(xyz2).query(xyz1, distance_upper_bound=cutoff)
+    dist2, _ = cKDTree(xyz1).query(xyz2, distance_upper_bound=cutoff)
+    return (int(np.count_nonzero(dist1 <= cutoff)),
+            int(np.count_nonzero(dist2 <= cutoff)))
@@ -0,0 +1,385 @@
+from functools import lru_cache, partial
+
+import numpy as np
+from scipy.signal import fftconvolve
+from scipy.sparse import coo_matrix
+
+from deeprank.tools import cpu_kernel
+
+# engines mapping the kernels on the grid
+MAPPING_MODES = ('exact', 'fft')
+
+# fast gaussian of the features: value * exp(-beta * d) up to 5 * beta
+FEATURE_SIGMA = np.sqrt(1. / 2)
+FEATURE_BETA = 0.5 / (FEATURE_SIGMA**2)
+FEATURE_CUTOFF = 5. * FEATURE_BETA
+
+# number of (center, grid point) pairs evaluated at once
+_CHUNK_SIZE = 2**20
+
+
+def feature_kernel(dd, beta=FEATURE_BETA):
+    """Fast gaussian of a feature at distances below FEATURE_CUTOFF.
+
+    Args:
+        dd (np.array): distances to the center
+        beta (float, optional): decay of the gaussian
+
+    Returns:
+        np.array: weights of the feature value
+    """
+    return np.exp(-beta * dd)
+
+
+def density_kernel(dd, vdw_radius):
+    """Atomic density at distances below 1.5 vdw radius.
+
+    The formula is equation (1) of the Koes paper
+    Protein-Ligand Scoring with Convolutional NN Arxiv:1612.02751v1
+
+    Args:
+        dd (np.array): distances to the atom
+        vdw_radius (float): vdw radius of the atom
+
+    Returns:
+        np.array: atomic densities
+    """
+    return np.where(
+        dd < vdw_radius,
+        np.exp(-2 * dd**2 / vdw_radius**2),
+        4. / np.e**2 / vdw_radius**2 * dd**2
+        - 12. / np.e**2 / vdw_radius * dd + 9. / np.e**2)
+
+
+@lru_cache(maxsize=32)
+def get_offsets(res, cutoff):
+    """Get the offsets of the grid points around a center.
+
+    The offsets are relative to the grid point nearest to the center and
+    include all the points that can be within the cutoff of the center,
+    i.e. within the cutoff plus half a cell diagonal of that point.
+
+    Args:
+        res (tuple(float)): resolution of the grid along x, y and z
+        cutoff (float): cutoff distance of the kernel
+
+    Returns:
+        np.array: integer offsets along x, y and z, shape (n, 3)
+    """
+    res = np.array(res)
+    radius = cutoff + 0.5 * np.sqrt(np.sum(res**2))
+    ranges = [np.arange(-n, n + 1)
+              for n in np.ceil(radius / res).astype(int)]
+    offsets = np.stack(np.meshgrid(*ranges, indexing='ij'),
+                       -1).reshape(-1, 3)
+    keep = np.sum((offsets * res)**2, 1) <= radius**2
+    offsets = offsets[keep]
+    offsets.setflags(write=False)
+    return offsets
+
+
+@lru_cache(maxsize=32)
+def get_grid_template(npts, res):
+    """Get the coordinates of the grid points relative to its center.
+
+    The grids of the molecules only differ by their center, the
+    coordinates of their points are the center plus the template.
+
+    Args:
+        npts (tuple(int)): number of points along x, y and z
+        res (tuple(float)): resolution of the grid along x, y and z
+
+    Returns:
+        tuple(np.array): coordinates along x, y and z
+    """
+    axes = []
+    for n, r in zip(npts, res):
+        low = -0.5 * n * r
+        axis = np.linspace(low, low + r * (n - 1), n)
+        axis.setflags(write=False)
+        axes.append(axis)
+    return tuple(axes)
+
+
+@lru_cache(maxsize=32)
+def _get_density_kernel(vdw_radius):
+    """Get the density kernel of a vdw radius, the same for each call."""
+    return partial(density_kernel, vdw_radius=vdw_radius)
+
+
+@lru_cache(maxsize=32)
+def _get_stencil(res, cutoff, kernel):
+    """Get the kernel sampled on the grid points within the cutoff.
+
+    Args:
+        res (tuple(float)): resolution of the grid along x, y and z
+        cutoff (float): cutoff distance of the kernel
+        kernel (callable): kernel
+
+    Returns:
+        np.array: weights of the points around the center
+    """
+    pad = np.ceil(cutoff / np.array(res)).astype(int)
+    axes = [np.arange(-p, p + 1) * r for p, r in zip(pad, res)]
+    xyz = np.meshgrid(*axes, indexing='ij')
+    dd = np.sqrt(sum(a**2 for a in xyz))
+    stencil = np.where(dd < cutoff, kernel(dd), 0.)
+    stencil.setflags(write=False)
+    return stencil
+
+
+class GridSplatter(object):
+
+    def __init__(self, x, y, z, mode='exact', compiled=True):
+        """Map features and atomic densities on a regular grid.
+
+        The kernels are zero beyond their cutoff. In the 'exact' mode,
+        each center only touches the sub-box of the grid points within
+        the cutoff, found with the precomputed integer offsets of
+        get_offsets. The cost is proportional to the number of centers.
+        The features and densities are then mapped by the multi-threaded
+        kernels of deeprank.tools.cpu_kernel when they can be compiled.
+
+        In the 'fft' mode, the values of the centers are first deposited
+        on their 8 nearest grid points (cloud-in-cell) and the grid is
+        then convolved once with the kernel by FFT, whatever the number
+        of centers. The deposit smooths the kernels over one grid cell,
+        the error is largest at the grid points nearest to the centers.
+        Compared to the 'exact' mode, the maximum error is ~6% of the
+        peak of a feature at a resolution of 1 or 0.5 A, and ~20% (1 A)
+        or ~9% (0.5 A) of the peak of a carbon density (vdw 1.7 A). The
+        'fft' mode is faster above a few hundred centers per grid.
+
+        The grid points are ordered as the meshgrid of GridTools, i.e.
+        the point [i, j, k] is at (x[i], y[j], z[k]).
+
+        Args:
+            x (np.array): coordinates of the grid points along x
+            y (np.array): coordinates of the grid points along y
+            z (np.array): coordinates of the grid points along z
+            mode (str, optional): 'exact' or 'fft'. Defaults to 'exact'.
+            compiled (bool, optional): use the compiled kernels in the
+                'exact' mode if available. Defaults to True.
+
+        Raises:
+            ValueError: if the mode is not recognized
+
+        Example:
+            >>> splatter = GridSplatter(x, y, z)
+            >>> grid = splatter.features(xyz, values)
+            >>> grid += splatter.densities(xyz_C, 1.7)
+        """
+        if mode not in MAPPING_MODES:
+            raise ValueError(
+                f'mapping mode must be one of {MAPPING_MODES}, got {mode}')
+        self.mode = mode
+        self.compiled = compiled
+
+        self.axes = [np.asarray(a, dtype=np.float64) for a in (x, y, z)]
+        self.npts = np.array([len(a) for a in self.axes])
+        self.origin = np.array([a[0] for a in self.axes])
+        self.res = np.array([a[1] - a[0] if len(a) > 1 else 1.
+                             for a in self.axes])
+
+        # key of the cached stencils, insensitive to the round-off
+        # errors of the coordinates
+        self.res_key = tuple(float(r) for r in np.round(self.res, 9))
+
+    @classmethod
+    def from_center(cls, center, npts, res, **kwargs):
+        """Create the splatter of a grid from the cached grid template.
+
+        Args:
+            center (np.array): center of the grid
+            npts (list(int)): number of points along x, y and z
+            res (list(float)): resolution of the grid along x, y and z
+            **kwargs: mode and compiled, see GridSplatter
+
+        Example:
+            >>> splatter = GridSplatter.from_center(
+            >>>     center, [30, 30, 30], [1., 1., 1.])
+        """
+        template = get_grid_template(tuple(int(n) for n in npts),
+                                     tuple(float(r) for r in res))
+        return cls(*[c + axis for c, axis in zip(center, template)],
+                   **kwargs)
+
+    def _use_kernels(self):
+        """Check if the compiled kernels map the grid."""
+        return self.mode == 'exact' and self.compiled and \
+            cpu_kernel.get_kernels() is not None
+
+    def splat(self, centers, values, kernel, cutoff, out=None):
+        """Add kernels centered on points to a grid.
+
+        The values of several channels at the same centers are mapped
+        at once: the weights of the kernel are computed once per center
+        and grid point, and multiplied by the values of all channels.
+
+        Args:
+            centers (np.array): positions of the centers, shape (n, 3)
+            values (np.array or float): values of the centers, shape (n,)
+                or (n, m) for m channels
+            kernel (callable): weight of a value at distances below
+                the cutoff
+            cutoff (float): cutoff distance of the kernel
+            out (np.array, optional): grid to add the kernels to, or
+                grids of shape (m, npts) or list of m grids for several
+                channels. Defaults to None, i.e. new float32 grids.
+
+        Returns:
+            np.array: grid of shape npts or grids of shape (m, npts)
+        """
+        return self._map(centers, values, out, kernel, cutoff)
+
+    def _map(self, centers, values, out, kernel, cutoff, compiled=None):
+        """Map the channels with the engine of the mode.
+
+        Args:
+            compiled (tuple, optional): name and parameters of the
+                compiled kernel, see cpu_kernel.map_on_grid
+        """
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        values = np.asarray(values, dtype=np.float64)
+        single = values.ndim < 2
+        if single:
+            values = np.broadcast_to(values, (len(centers),))[:, None]
+
+        grids = self._get_grids(out, values.shape[1], single)
+        if len(centers) > 0:
+            if self.mode == 'fft':
+                grids += self._convolve(centers, values, kernel, cutoff)
+            elif compiled is not None and self._use_kernels():
+                name, params = compiled
+                if name == 'gaussian':
+                    params = [values] + params
+                cpu_kernel.map_on_grid(name, self.axes, self.res, centers,
+                                       params, grids)
+            else:
+                self._add_kernels(centers, values, kernel, cutoff, grids)
+
+        if out is None:
+            return grids[0] if single else grids
+        if grids is not out and grids.base is not out:
+            for grid, o in zip(grids, [out] if single else out):
+                o += grid
+        return out
+
+    def _get_grids(self, out, nchannel, single):
+        """Get the float32 grids written by the engines.
+
+        Returns:
+            np.array: out if it can be written in place, else new grids
+                of shape (nchannel, npts)
+        """
+        if isinstance(out, np.ndarray) and out.dtype == np.float32 and \
+                out.flags['C_CONTIGUOUS']:
+            if single and out.shape == tuple(self.npts):
+                return out[None]
+            if not single and out.shape == (nchannel,) + tuple(self.npts):
+                return out
+        return np.zeros((nchannel,) + tuple(self.npts), np.float32)
+
+    def _add_kernels(self, centers, values, kernel, cutoff, grids):
+        """Add the kernels on the sub-boxes within the cutoff."""
+        offsets = get_offsets(self.res_key, float(cutoff))
+        size = int(np.prod(self.npts))
+        flat_grids = grids.reshape(len(grids), size)
+        chunk = max(1, _CHUNK_SIZE // len(offsets))
+
+        for start in range(0, len(centers), chunk):
+            xyz = centers[start:start + chunk]
+
+            # indexes of the grid points around the centers
+            nearest = np.rint((xyz - self.origin) / self.res).astype(int)
+            index = nearest[:, None, :] + offsets[None, :, :]
+            inside = np.all((index >= 0) & (index < self.npts), axis=2)
+            icenter, ipoint = np.nonzero(inside)
+            index = index[icenter, ipoint]
+
+            # distances of these points to their center
+            dd = np.sqrt(sum((self.axes[i][index[:, i]] - xyz[icenter, i])**2
+                             for i in range(3)))
+            close = dd < cutoff
+            if not np.any(close):
+                continue
+            icenter, index, dd = icenter[close], index[close], dd[close]
+
+            # weights x values of all the channels
+            weights = coo_matrix(
+                (kernel(dd), (np.ravel_multi_index(index.T, self.npts),
+                              icenter)), shape=(size, len(xyz)))
+            flat_grids += (weights @ values[start:start + chunk]).T
+
+    def _convolve(self, centers, values, kernel, cutoff):
+        """Deposit the values on the grid and convolve with the kernel.
+
+        The values are deposited on the grid extended by the cutoff, so
+        that the centers outside of the grid contribute to its border.
+
+        Returns:
+            np.array: grids of shape (m, npts)
+        """
+        stencil = _get_stencil(self.res_key, float(cutoff), kernel)
+        pad = np.array(stencil.shape) // 2
+        shape = self.npts + 2 * pad
+
+        # cloud-in-cell weights of the 8 grid points around each center
+        frac = (centers - self.origin) / self.res + pad
+        low = np.floor(frac).astype(int)
+        frac -= low
+        index, icenter, weights = [], [], []
+        for corner in np.ndindex(2, 2, 2):
+            corner_index = low + corner
+            inside = np.all((corner_index >= 0) & (corner_index < shape),
+                            axis=1)
+            index.append(np.ravel_multi_index(corner_index[inside].T, shape))
+            icenter.append(np.nonzero(inside)[0])
+            weights.append(np.prod(
+                np.where(corner, frac, 1 - frac), axis=1)[inside])
+        deposit = coo_matrix(
+            (np.concatenate(weights),
+             (np.concatenate(index), np.concatenate(icenter))),
+            shape=(int(np.prod(shape)), len(centers))) @ values
+        deposit = deposit.T.reshape((-1,) + tuple(shape))
+
+        grids = fftconvolve(deposit, stencil[None], mode='valid',
+                            axes=(1, 2, 3))
+
+        # remove the round-off errors of the FFT away from the centers
+        noise = 1E-9 * np.abs(deposit).sum(axis=(1, 2, 3)) * \
+            np.abs(stencil).max()
+        grids[np.abs(grids) < noise[:, None, None, None]] = 0
+        return grids
+
+    def features(self, centers, values, out=None):
+        """Map feature values with the fast gaussian.
+
+        Args:
+            centers (np.array): positions of the features, shape (n, 3)
+            values (np.array or float): values of the features, shape
+                (n,) or (n, m) for m features at the same positions
+            out (np.array, optional): grid(s) to add the features to
+
+        Returns:
+            np.array: grid of shape npts or grids of shape (m, npts)
+        """
+        return self._map(centers, values, out, feature_kernel,
+                         FEATURE_CUTOFF,
+                         ('gaussian', [FEATURE_BETA, FEATURE_CUTOFF]))
+
+    def densities(self, centers, vdw_radius, out=None):
+        """Map atomic densities.
+
+        Args:
+            centers (np.array): positions of the atoms, shape (n, 3)
+            vdw_radius (float): vdw radius of the atoms
+            out (np.array, optional): grid to add the densities to
+
+        Returns:
+            np.array: grid of shape npts
+        """
+        return self._map(centers, 1., out,
+                         _get_density_kernel(float(vdw_radius)),
+                         1.5 * vdw_radius,
+                         ('atomic_densities', [float(vdw_radius)]))
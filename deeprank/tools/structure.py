@@ -0,0 +1,329 @@
+import hashlib
+import os
+import warnings
+
+import numpy as np
+
+from .columnar import COLUMNS, ColumnarInterface
+
+
+class StructureContext(object):
+
+    def __init__(self, pdb_data, chain1='A', chain2='B'):
+        """Structure of a molecule shared by the feature and target
+        calculators.
+
+        The pdb data is parsed in a single pdb2sql interface the first
+        time it is needed. All the calculators of the molecule then query
+        the same database instead of parsing the pdb again.
+
+        The interface contacts are memoized per (chain1, chain2, cutoff,
+        kind) and options of pdb2sql. Contacts at a given cutoff are
+        derived from the atom pairs already computed at a larger cutoff
+        when possible.
+
+        A structure stored in the columnar format is inserted in the
+        database without parsing pdb lines. Its pdb data is only
+        created if a calculator asks for it.
+
+        Args:
+            pdb_data (list(bytes) or str or dict): pdb data, pdb filename
+                or columns of the structure (see tools.columnar)
+            chain1 (str, optional): First chain ID. Defaults to 'A'
+            chain2 (str, optional): Second chain ID. Defaults to 'B'
+
+        Example:
+            >>> structure = StructureContext(molgrp['complex'][()], 'C', 'D')
+            >>> xyz = structure.sql.get('x,y,z', chainID='C')
+            >>> res = structure.get_contact_residues(cutoff=5.5)
+            >>> structure.close()
+        """
+
+        self._source = pdb_data
+        self._pdb_data = None
+        self._digest = None
+        self.chain1 = chain1
+        self.chain2 = chain2
+        self._sql = None
+        self._contacts = {}
+        self._residue_info = {}
+
+    @property
+    def pdb_data(self):
+        """list(bytes) or str: pdb data or pdb filename."""
+        if not isinstance(self._source, dict):
+            return self._source
+        if self._pdb_data is None:
+            self._pdb_data = self.sql.sql2pdb()
+        return self._pdb_data
+
+    @property
+    def sql(self):
+        """pdb2sql.interface: database of the structure."""
+        if self._sql is None:
+            self._sql = ColumnarInterface(self._source)
+        return self._sql
+
+    def digest(self):
+        """Get a hash of the ATOM records of the structure.
+
+        The records are hashed as they are given, without creating the
+        database of the structure.
+
+        Returns:
+            str: sha256 of the ATOM records
+        """
+        if self._digest is not None:
+            return self._digest
+
+        sha = hashlib.sha256()
+        if isinstance(self._source, dict):
+            for name in COLUMNS:
+                sha.update(np.ascontiguousarray(self._source[name]).tobytes())
+        else:
+            data = self._source
+            if isinstance(data, str):
+                if os.path.isfile(data):
+                    with open(data, 'r') as fi:
+                        data = fi.readlines()
+                else:
+                    data = data.split('\n')
+            for line in data:
+                if isinstance(line, str):
+                    line = line.encode()
+                if line.startswith(b'ATOM'):
+                    sha.update(line.rstrip() + b'\n')
+
+        self._digest = sha.hexdigest()
+        return self._digest
+
+    def close(self):
+        """Close the database of the structure."""
+        if self._sql is not None:
+            self._sql._close()
+            self._sql = None
+        self._contacts = {}
+        self._residue_info = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ####################################################################
+    #
+    #   INTERFACE CONTACTS
+    #
+    ####################################################################
+
+    def get_contact_atom_pairs(self, cutoff=8.5, chain1=None, chain2=None):
+        """Get the atom pairs of the interface with their distance.
+
+        Args:
+            cutoff (float): distance cutoff. Defaults to 8.5.
+            chain1 (str, optional): first chain ID. Defaults to self.chain1
+            chain2 (str, optional): second chain ID. Defaults to self.chain2
+
+        Returns:
+            tuple(np.array): rowIDs of the atoms of chain1, rowIDs of the
+                atoms of chain2 and distances of the pairs, sorted by
+                rowID of chain1 then chain2.
+        """
+        chain1 = chain1 or self.chain1
+        chain2 = chain2 or self.chain2
+
+        key = (chain1, chain2, cutoff, 'atom_pairs')
+        if key in self._contacts:
+            return self._contacts[key]
+
+        # derive the pairs from the smallest larger cutoff available
+        cached = [k[2] for k in self._contacts
+                  if k[:2] == (chain1, chain2) and k[3] == 'atom_pairs'
+                  and k[2] > cutoff]
+        if cached:
+            index1, index2, dist = self._contacts[
+                (chain1, chain2, min(cached), 'atom_pairs')]
+            mask = dist <= cutoff
+            pairs = (index1[mask], index2[mask], dist[mask])
+        else:
+            pairs = self._compute_contact_atom_pairs(cutoff, chain1, chain2)
+
+        self._contacts[key] = pairs
+        return pairs
+
+    def _compute_contact_atom_pairs(self, cutoff, chain1, chain2):
+        """Compute the atom pairs closer than the cutoff."""
+
+        chains = self.sql.get_chains()
+        for c in [chain1, chain2]:
+            if c not in chains:
+                raise ValueError(
+                    'chain %s not found in the structure' % c)
+
+        xyz1 = np.array(self.sql.get('x,y,z', chainID=chain1))
+        xyz2 = np.array(self.sql.get('x,y,z', chainID=chain2))
+        rowid1 = np.array(self.sql.get('rowID', chainID=chain1))
+        rowid2 = np.array(self.sql.get('rowID', chainID=chain2))
+
+        # distances computed by blocks of atoms to limit the memory
+        index1, index2, dist = [], [], []
+        nblock = 256
+        for istart in range(0, len(xyz1), nblock):
+            d = np.sqrt(np.sum(
+                (xyz2[np.newaxis, :, :] -
+                 xyz1[istart:istart + nblock, np.newaxis, :])**2, -1))
+            i, j = np.where(d <= cutoff)
+            index1.append(rowid1[istart + i])
+            index2.append(rowid2[j])
+            dist.append(d[i, j])
+
+        if len(index1) == 0:
+            return (np.array([], dtype=int), np.array([], dtype=int),
+                    np.array([], dtype=float))
+        return (np.concatenate(index1), np.concatenate(index2),
+                np.concatenate(dist))
+
+    def get_contact_atoms(self, cutoff=8.5, chain1=None, chain2=None,
+                          return_contact_pairs=False, allchains=False,
+                          extend_to_residue=False, only_backbone_atoms=False,
+                          excludeH=False):
+        """Get rowIDs of contact atoms.
+
+        Same output as pdb2sql.interface.get_contact_atoms. The contacts
+        with the options allchains, extend_to_residue, only_backbone_atoms
+        or excludeH are computed by pdb2sql and memoized separately.
+
+        Args:
+            cutoff (float): distance cutoff. Defaults to 8.5.
+            chain1 (str, optional): first chain ID. Defaults to self.chain1
+            chain2 (str, optional): second chain ID. Defaults to self.chain2
+            return_contact_pairs (bool): if return atomic contact pairs
+                or not. Defaults to False.
+            allchains (bool): contacts between all the chains.
+                Defaults to False.
+            extend_to_residue (bool): get all the atoms of the contact
+                residues. Defaults to False.
+            only_backbone_atoms (bool): only use the backbone atoms.
+                Defaults to False.
+            excludeH (bool): exclude the hydrogen atoms. Defaults to False.
+
+        Returns:
+            dict: rowID of contact atoms or rowID of contact atom pairs
+        """
+        chain1 = chain1 or self.chain1
+        chain2 = chain2 or self.chain2
+
+        kind = 'atom_pair_dict' if return_contact_pairs else 'atoms'
+        options = (allchains, extend_to_residue, only_backbone_atoms,
+                   excludeH)
+        key = (chain1, chain2, cutoff, kind)
+        if any(options):
+            key += options
+        if key in self._contacts:
+            return self._contacts[key]
+
+        if any(options):
+            contacts = self.sql.get_contact_atoms(
+                cutoff=cutoff, allchains=allchains, chain1=chain1,
+                chain2=chain2, extend_to_residue=extend_to_residue,
+                only_backbone_atoms=only_backbone_atoms,
+                excludeH=excludeH,
+                return_contact_pairs=return_contact_pairs)
+            self._contacts[key] = contacts
+            return contacts
+
+        index1, index2, _ = self.get_contact_atom_pairs(
+            cutoff, chain1, chain2)
+        if len(index1) == 0:
+            warnings.warn('No contact atoms detected in pdb2sql')
+
+        if return_contact_pairs:
+            contacts = {}
+            for i, j in zip(index1.tolist(), index2.tolist()):
+                contacts.setdefault(i, []).append(j)
+        else:
+            contacts = {chain1: sorted(set(index1.tolist())),
+                        chain2: sorted(set(index2.tolist()))}
+
+        self._contacts[key] = contacts
+        return contacts
+
+    def get_contact_residues(self, cutoff=8.5, chain1=None, chain2=None,
+                             return_contact_pairs=False, allchains=False,
+                             excludeH=False, only_backbone_atoms=False):
+        """Get contact residues represented with (chain,resSeq, resname).
+
+        Same output as pdb2sql.interface.get_contact_residues. The
+        contacts with the options allchains, excludeH or
+        only_backbone_atoms are computed by pdb2sql and memoized
+        separately.
+
+        Args:
+            cutoff (float): distance cutoff. Defaults to 8.5.
+            chain1 (str, optional): first chain ID. Defaults to self.chain1
+            chain2 (str, optional): second chain ID. Defaults to self.chain2
+            return_contact_pairs (bool): if return residue contact pairs
+                or not. Defaults to False.
+            allchains (bool): contacts between all the chains.
+                Defaults to False.
+            excludeH (bool): exclude the hydrogen atoms. Defaults to False.
+            only_backbone_atoms (bool): only use the backbone atoms.
+                Defaults to False.
+
+        Returns:
+            dict: (chain,resSeq,resName) of contact residues or
+                contact residue pairs.
+        """
+        chain1 = chain1 or self.chain1
+        chain2 = chain2 or self.chain2
+
+        kind = 'residue_pairs' if return_contact_pairs else 'residues'
+        options = (allchains, excludeH, only_backbone_atoms)
+        key = (chain1, chain2, cutoff, kind)
+        if any(options):
+            key += options
+        if key in self._contacts:
+            return self._contacts[key]
+
+        if any(options):
+            contacts = self.sql.get_contact_residues(
+                cutoff=cutoff, allchains=allchains, chain1=chain1,
+                chain2=chain2, excludeH=excludeH,
+                only_backbone_atoms=only_backbone_atoms,
+                return_contact_pairs=return_contact_pairs)
+            self._contacts[key] = contacts
+            return contacts
+
+        resinfo = self._get_residue_info(chain1, chain2)
+
+        if return_contact_pairs:
+            atom_pairs = self.get_contact_atoms(
+                cutoff, chain1, chain2, return_contact_pairs=True)
+            contacts = {}
+            for iat1, atoms2 in atom_pairs.items():
+                res = contacts.setdefault(resinfo[iat1], set())
+                res.update(resinfo[iat2] for iat2 in atoms2)
+            for res in contacts:
+                contacts[res] = sorted(contacts[res])
+        else:
+            atoms = self.get_contact_atoms(cutoff, chain1, chain2)
+            contacts = {chain: sorted(set(resinfo[i] for i in atoms[chain]))
+                        for chain in atoms}
+
+        self._contacts[key] = contacts
+        return contacts
+
+    def _get_residue_info(self, chain1, chain2):
+        """Get the (chain,resSeq,resName) of the atoms of the chains.
+
+        Returns:
+            dict: {rowID: (chainID, resSeq, resName)}
+        """
+        for chain in [chain1, chain2]:
+            if chain not in self._residue_info:
+                data = self.sql.get('rowID,chainID,resSeq,resName',
+                                    chainID=chain)
+                self._residue_info[chain] = {
+                    d[0]: tuple(d[1:]) for d in data}
+        return {**self._residue_info[chain1], **self._residue_info[chain2]}
@@ -1,10 +1,11 @@
 #!/usr/bin/env python
-import os
-
 import h5py
 
+from deeprank.tools.compaction import COMPRESSIONS, compact_hdf5
+
 
-def clean_dataset(fname, feature=True, pdb=True, points=True, grid=False):
+def clean_dataset(fname, feature=True, pdb=True, points=True, grid=False,
+                  compression='keep'):
 
     # name of the hdf5 file
     f5 = h5py.File(fname, 'a')
@@ -28,8 +29,7 @@ def clean_dataset(fname, feature=True, pdb=True, points=True, grid=False):
 
     f5.close()
 
-    os.system('h5repack %s _tmp.h5py' % fname)
-    os.system('mv _tmp.h5py %s' % fname)
+    return compact_hdf5(fname, compression=compression)
 
 
 if __name__ == '__main__':
@@ -58,10 +58,18 @@ if __name__ == '__main__':
         '--rm_grid',
         action='store_true',
         help='remove the mapped feaures on the grids')
+    parser.add_argument(
+        '--compression',
+        default='keep',
+        choices=['keep', 'none'] + COMPRESSIONS,
+        help='compression of the compacted file')
     args = parser.parse_args()
 
-    clean_dataset(args.hdf5,
-                  feature=not args.keep_feature,
-                  pdb=not args.keep_pdb,
-                  points=not args.keep_pts,
-                  grid=args.rm_grid)
+    reclaimed = clean_dataset(
+        args.hdf5,
+        feature=not args.keep_feature,
+        pdb=not args.keep_pdb,
+        points=not args.keep_pts,
+        grid=args.rm_grid,
+        compression=None if args.compression == 'none' else args.compression)
+    print(f'Reclaimed {reclaimed} bytes')
@@ -8,6 +8,7 @@ import numpy as np
 import pdb2sql
 
 from deeprank.tools import sparse
+from deeprank.tools.columnar import read_pdb_data
 
 
 def visualize3Ddata(hdf5=None, mol_name=None, out=None):
@@ -55,7 +56,7 @@ def visualize3Ddata(hdf5=None, mol_name=None, out=None):
         raise LookupError('Molecule %s not found in %s' % (mol_name, hdf5))
 
     # create the pdb file
-    sqldb = pdb2sql.pdb2sql(molgrp['complex'][:])
+    sqldb = pdb2sql.pdb2sql(read_pdb_data(molgrp['complex']))
     sqldb.exportpdb(outdir + '/complex.pdb')
     sqldb._close()
 
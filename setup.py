@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
 
-from setuptools import setup, find_packages
+from setuptools import Extension, setup, find_packages
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -13,6 +14,19 @@ with open(os.path.join(here, 'deeprank', '__version__.py')) as f:
 with open('README.md') as readme_file:
     readme = readme_file.read()
 
+# CPU kernels of the grid mapping, loaded with ctypes by
+# deeprank/tools/cpu_kernel.py, which compiles them at runtime
+# if they are not built here
+ext_modules = []
+if sys.platform != 'win32':
+    ext_modules.append(Extension(
+        'deeprank.tools._kernel_map_cpu',
+        sources=['deeprank/tools/kernel_map_cpu.c'],
+        extra_compile_args=['-O3', '-pthread'],
+        extra_link_args=['-pthread'],
+        libraries=['m'],
+        optional=True))
+
 setup(
     name='deeprank',
     version=version['__version__'],
@@ -27,6 +41,7 @@ setup(
         'Issue tracker': 'https://github.com/DeepRank/deeprank/issues'
     },
     packages=find_packages(),
+    ext_modules=ext_modules,
     include_package_data=True,
     license="Apache Software License 2.0",
     keywords='deeprank',
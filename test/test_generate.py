@@ -1,8 +1,23 @@
+import gzip
+import importlib
+import json
 import os
+import tarfile
+import tempfile
 import unittest
-from time import time
+import zipfile
+from time import sleep, time
 import shutil
+
+import h5py
+import numpy as np
+import pdb2sql
+
+from deeprank import config
 from deeprank.generate import *
+from deeprank.tools import StructureContext
+from deeprank.tools.augmentation import get_feature, is_virtual
+from deeprank.tools.columnar import is_columnar, read_sql
 
 
 """
@@ -22,6 +37,26 @@ class TestGenerateData(unittest.TestCase):
     # pdb files will not be saved in the hdf5 file
     pdb_native = ['./1AK4/native/']
 
+    def test_0_select_pdb(self):
+        """Select the conformations and natives from the file index."""
+
+        database = DataGenerator(
+            chain1='C',
+            chain2='D',
+            pdb_source=self.pdb_source[0],
+            pdb_native=self.pdb_native,
+            pdb_select=['1AK4_cm-it0_745', '1AK4_ti5-itw_312w.pdb', 'itw'])
+
+        names = [os.path.basename(f) for f in database.pdb_path]
+        assert names[:2] == ['1AK4_cm-it0_745.pdb', '1AK4_ti5-itw_312w.pdb']
+        assert sorted(names[2:]) == sorted([
+            '1AK4_cm-itw_238w.pdb',
+            '1AK4_ti5-itw_212w.pdb',
+            '1AK4_ti5-itw_312w.pdb'])
+
+        ref = database._get_native(database.pdb_path[0], '1AK4_cm-it0_745')
+        assert os.path.basename(ref) == '1AK4.pdb'
+
     def test_1_generate(self):
         """Generate the database."""
 
@@ -129,6 +164,634 @@ class TestGenerateData(unittest.TestCase):
         print('{:25s}'.format('Create new database') + database.hdf5)
         database.create_database(prog_bar=True)
 
+    def test_1_generate_parallel(self):
+        """Generate the database with a local process pool."""
+
+        h5files = ['./1ak4_serial.hdf5', './1ak4_parallel.hdf5']
+        for h5, n_workers in zip(h5files, [None, 2]):
+            if os.path.isfile(h5):
+                os.remove(h5)
+
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pssm_source='./1AK4/pssm_new/',
+                data_augmentation=1,
+                compute_targets=['deeprank.targets.dockQ'],
+                compute_features=[
+                    'deeprank.features.AtomicFeature',
+                    'deeprank.features.FullPSSM',
+                    'deeprank.features.BSA'],
+                hdf5=h5)
+            database.create_database(random_seed=2019, n_workers=n_workers)
+
+        # the parallel run must give the same data as the serial one
+        assert_same_hdf5(*h5files)
+
+        # the native of the case is stored once
+        for h5 in h5files:
+            with h5py.File(h5, 'r') as f5:
+                natives = [f5[mol + '/native'] for mol in f5]
+                assert all(n == natives[0] for n in natives[1:])
+
+    def test_1_generate_resume(self):
+        """Resume the generation of an interrupted database."""
+
+        h5 = './1ak4_resume.hdf5'
+        h5ref = './1ak4_resume_ref.hdf5'
+        for f in [h5, h5ref, h5 + '.journal']:
+            if os.path.isfile(f):
+                os.remove(f)
+
+        def create_database():
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pssm_source='./1AK4/pssm_new/',
+                data_augmentation=1,
+                compute_targets=['deeprank.targets.dockQ'],
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5)
+            database.create_database(random_seed=2019, resume=True)
+
+        create_database()
+        shutil.copy(h5, h5ref)
+
+        # forget the last molecules as if the run had been interrupted
+        with open(h5 + '.journal') as f:
+            journal = f.readlines()
+        with open(h5 + '.journal', 'w') as f:
+            f.writelines(journal[:-2])
+
+        create_database()
+        assert_same_hdf5(h5, h5ref)
+
+        # the resumed molecules link the native already stored
+        with h5py.File(h5, 'r') as f5:
+            natives = [f5[mol + '/native'] for mol in f5]
+            assert all(n == natives[0] for n in natives[1:])
+
+    def test_1_generate_async_write(self):
+        """Generate and map the database with a background writer."""
+
+        h5files = ['./1ak4_sync.hdf5', './1ak4_async.hdf5']
+        for h5, queue_size in zip(h5files, [None, 2]):
+            if os.path.isfile(h5):
+                os.remove(h5)
+
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pssm_source='./1AK4/pssm_new/',
+                data_augmentation=1,
+                compute_targets=['deeprank.targets.dockQ'],
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5)
+            database.create_database(random_seed=2019,
+                                     write_queue_size=queue_size)
+
+            grid_info = {
+                'number_of_points': [10, 10, 10],
+                'resolution': [3., 3., 3.],
+                'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52, 'S': 1.8},
+            }
+            database.map_features(grid_info, prog_bar=False,
+                                  write_queue_size=queue_size)
+
+        # the background writer must give the same data as the serial run
+        assert_same_hdf5(*h5files)
+
+    def test_1_generate_fft_mapping(self):
+        """Map the features by FFT convolution of the grids."""
+
+        h5files = ['./1ak4_exact.hdf5', './1ak4_fft.hdf5']
+        database = DataGenerator(
+            chain1='C',
+            chain2='D',
+            pdb_source=self.pdb_source[0],
+            pssm_source='./1AK4/pssm_new/',
+            compute_features=['deeprank.features.AtomicFeature',
+                              'deeprank.features.BSA'],
+            hdf5=h5files[0])
+        database.create_database(prog_bar=False)
+        shutil.copy(*h5files)
+
+        for h5, mapping in zip(h5files, ['exact', 'fft']):
+            grid_info = {
+                'number_of_points': [20, 20, 20],
+                'resolution': [1., 1., 1.],
+                'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52, 'S': 1.8},
+                'mapping': mapping,
+            }
+            database.hdf5 = h5
+            database.map_features(grid_info, try_sparse=False, prog_bar=False)
+
+        # the grids are close to the exact ones, the density of an atom
+        # peaks at 1
+        with h5py.File(h5files[0], 'r') as f1, h5py.File(h5files[1], 'r') as f2:
+            for mol in f1:
+                grp1 = f1[mol + '/mapped_features']
+                grp2 = f2[mol + '/mapped_features']
+                for feat_type in grp1:
+                    for name in grp1[feat_type]:
+                        exact = grp1[feat_type][name]['value'][()]
+                        fft = grp2[feat_type][name]['value'][()]
+                        peak = np.abs(exact).max()
+                        if feat_type == 'AtomicDensities_ind':
+                            peak = max(peak, 1.)
+                        assert np.abs(fft - exact).max() <= 0.3 * peak, name
+                        assert np.count_nonzero(fft) < fft.size, name
+
+        grid_info['mapping'] = 'spline'
+        with self.assertRaises(ValueError):
+            database.map_features(grid_info, prog_bar=False)
+
+        for h5 in h5files:
+            os.remove(h5)
+
+    def test_1_generate_virtual_aug(self):
+        """Store the augmented molecules as rotations of the originals."""
+
+        h5files = ['./1ak4_aug.hdf5', './1ak4_virtual_aug.hdf5']
+        for h5, virtual in zip(h5files, [False, True]):
+            if os.path.isfile(h5):
+                os.remove(h5)
+
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+                pssm_source='./1AK4/pssm_new/',
+                data_augmentation=2,
+                virtual_augmentation=virtual,
+                compute_targets=['deeprank.targets.dockQ'],
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5)
+            database.create_database(random_seed=2019)
+
+            grid_info = {
+                'number_of_points': [10, 10, 10],
+                'resolution': [3., 3., 3.],
+                'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52},
+            }
+            database.map_features(grid_info, try_sparse=False,
+                                  prog_bar=False)
+
+        assert os.path.getsize(h5files[1]) < os.path.getsize(h5files[0])
+
+        # the virtual groups give the data of the materialized ones
+        with h5py.File(h5files[0], 'r') as f5, \
+                h5py.File(h5files[1], 'r') as f5v:
+            assert sorted(f5) == sorted(f5v)
+            for mol in f5:
+                assert is_virtual(f5v[mol]) == (mol[-5:-3] == '_r')
+                assert np.allclose(get_feature(f5v[mol], 'bsa'),
+                                   f5[mol + '/features/bsa'][()], atol=1E-2)
+                assert np.allclose(f5v[mol + '/grid_points/center'][()],
+                                   f5[mol + '/grid_points/center'][()],
+                                   atol=1E-2)
+                assert np.allclose(
+                    f5v[mol + '/targets/DOCKQ'][()],
+                    f5[mol + '/targets/DOCKQ'][()])
+                for name in ['C', 'N', 'O']:
+                    grp = 'mapped_features/AtomicDensities_ind/%s_chain1' % name
+                    assert np.allclose(f5v[mol][grp]['value'][()],
+                                       f5[mol][grp]['value'][()],
+                                       atol=1E-2)
+
+    def test_1_generate_columnar(self):
+        """Store the complexes as columns instead of pdb lines."""
+
+        h5files = ['./1ak4_pdb_format.hdf5', './1ak4_columnar.hdf5']
+        for h5, structure_format in zip(h5files, ['pdb', 'columnar']):
+            if os.path.isfile(h5):
+                os.remove(h5)
+
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+                pssm_source='./1AK4/pssm_new/',
+                data_augmentation=1,
+                compute_targets=['deeprank.targets.dockQ'],
+                compute_features=['deeprank.features.AtomicFeature',
+                                  'deeprank.features.BSA'],
+                hdf5=h5,
+                structure_format=structure_format)
+            database.create_database(random_seed=2019)
+
+            grid_info = {
+                'number_of_points': [10, 10, 10],
+                'resolution': [3., 3., 3.],
+                'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52},
+            }
+            database.map_features(grid_info, prog_bar=False)
+
+        # only the storage of the structures differs
+        with h5py.File(h5files[0], 'r') as f5, \
+                h5py.File(h5files[1], 'r') as f5c:
+            for mol in f5:
+                assert is_columnar(f5c[mol + '/complex'])
+                assert np.array_equal(
+                    pdb2sql.pdb2sql(f5[mol + '/complex'][()]).get('*'),
+                    read_sql(f5c[mol + '/complex']).get('*'))
+                for grp in ['features', 'targets']:
+                    for name in f5[mol][grp]:
+                        assert np.allclose(f5[mol][grp][name][()],
+                                           f5c[mol][grp][name][()]), name
+                assert np.allclose(f5[mol + '/grid_points/center'][()],
+                                   f5c[mol + '/grid_points/center'][()])
+
+    def test_1_generate_feature_cache(self):
+        """Reuse the features computed for a previous database."""
+
+        cache_dir = './feature_cache'
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+
+        h5files = ['./1ak4_nocache.hdf5', './1ak4_cache_miss.hdf5',
+                   './1ak4_cache_hit.hdf5']
+        cache = FeatureCache(cache_dir)
+        for h5, feature_cache, n_workers in zip(
+                h5files, [None, cache, cache], [None, None, 2]):
+            if os.path.isfile(h5):
+                os.remove(h5)
+
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+                pssm_source='./1AK4/pssm_new/',
+                compute_features=['deeprank.features.FullPSSM',
+                                  'deeprank.features.BSA'],
+                hdf5=h5,
+                feature_cache=feature_cache)
+            database.create_database(n_workers=n_workers)
+
+        # the second database only reads the cache
+        stats = cache.stats()
+        assert stats['misses'] == 4
+        assert stats['hits'] == 4
+        assert stats['entries'] == 4
+        for h5 in h5files[1:]:
+            assert_same_hdf5(h5files[0], h5)
+
+        # the keys do not depend on the name of the molecule, except
+        # through the PSSM files
+        pdb = os.path.join(self.pdb_source[0], '1AK4_cm-it0_745.pdb')
+        config.PATH_PSSM_SOURCE = './1AK4/pssm_new/'
+        with h5py.File('entry.hdf5', 'w', driver='core',
+                       backing_store=False) as f5, \
+                StructureContext(pdb, 'C', 'D') as structure:
+            grps = [f5.create_group(mol + '/features')
+                    for mol in ['1AK4_cm-it0_745', 'renamed',
+                                '1AK4_ranair-it0_5257']]
+            for name, same in [('BSA', [True, True]),
+                               ('FullPSSM', [False, True])]:
+                module = importlib.import_module('deeprank.features.' + name)
+                keys = [FeatureCache.get_key(structure, grp, 'C', 'D', module)
+                        for grp in grps]
+                assert [keys[0] == k for k in keys[1:]] == same
+
+            # the least recently used entries are evicted
+            cache = FeatureCache(cache_dir, max_size=stats['size'] // 2)
+            cache.store('0' * 64, grps[0])
+        assert cache.stats()['size'] <= stats['size'] // 2
+        shutil.rmtree(cache_dir)
+
+    def test_1_generate_raw_format(self):
+        """Store the human readable features as compound datasets."""
+
+        cache_dir = './feature_cache_raw'
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+
+        h5files = {'text': './1ak4_raw_text.hdf5',
+                   'compound': './1ak4_raw_compound.hdf5',
+                   None: './1ak4_raw_none.hdf5'}
+        cache = FeatureCache(cache_dir)
+        for raw_format, h5 in h5files.items():
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=['1AK4_cm-it0_745'],
+                pssm_source='./1AK4/pssm_new/',
+                compute_features=['deeprank.features.FullPSSM',
+                                  'deeprank.features.BSA'],
+                hdf5=h5,
+                feature_cache=cache,
+                raw_format=raw_format)
+            database.create_database()
+
+        # each format has its own cache entries
+        assert cache.stats()['misses'] == 6
+        shutil.rmtree(cache_dir)
+
+        with h5py.File(h5files['text'], 'r') as f5text, \
+                h5py.File(h5files['compound'], 'r') as f5comp, \
+                h5py.File(h5files[None], 'r') as f5none:
+            mol = '1AK4_cm-it0_745'
+            assert 'features_raw' not in f5none[mol]
+            assert f5comp[mol + '/features_raw'].attrs['format'] == 'compound'
+            for name in ['features/bsa', 'features/PSSM_ALA']:
+                assert np.array_equal(f5text[mol][name][()],
+                                      f5comp[mol][name][()])
+                assert np.array_equal(f5text[mol][name][()],
+                                      f5none[mol][name][()])
+
+            text = f5text[mol + '/features_raw/bsa_raw'][()]
+            comp = f5comp[mol + '/features_raw/bsa_raw'][()]
+            assert comp.dtype.names == \
+                ('chainID', 'resSeq', 'resName', 'values')
+            assert len(text) == len(comp)
+            for line, row in zip(text, comp):
+                fields = line.split()
+                assert fields[:3] == [row['chainID'],
+                                      str(row['resSeq']).encode(),
+                                      row['resName']]
+                assert np.allclose(float(fields[3]), row['values'])
+
+    def test_1_generate_prescreen(self):
+        """Screen the interface of the molecules before computing them."""
+
+        h5 = './1ak4_prescreen.hdf5'
+        select = ['1AK4_cm-it0_745', '1AK4_ranair-it0_5257']
+        for prescreen, expected in [('reject', []), ('flag', select)]:
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=select,
+                pssm_source='./1AK4/pssm_new/',
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5)
+            database.create_database(prescreen=prescreen,
+                                     min_contact_atoms=10**6)
+            assert sorted(database.prescreen_error) == select
+            with h5py.File(h5, 'r') as f5:
+                assert sorted(f5) == expected
+
+    def test_1_generate_supervised(self):
+        """Compute each molecule in a supervised process."""
+
+        h5files = ['./1ak4_supervised_ref.hdf5', './1ak4_supervised.hdf5']
+        for h5, timeout in [(h5files[0], None), (h5files[1], 600),
+                            (h5files[1], 1e-3)]:
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+                pssm_source='./1AK4/pssm_new/',
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5)
+            database.create_database(n_workers=2, timeout=timeout)
+
+            # the molecules that timed out are removed
+            if timeout == 600:
+                assert_same_hdf5(h5files[0], h5)
+            elif timeout is not None:
+                assert sorted(database.feature_error) == \
+                    ['1AK4_cm-it0_745', '1AK4_ranair-it0_5257']
+                with h5py.File(h5, 'r') as f5:
+                    assert len(f5) == 0
+
+    @staticmethod
+    def test_1_supervised_pool():
+        """Isolate the tasks that fail in a supervised pool."""
+
+        # address space of the current process
+        with open('/proc/self/statm') as f:
+            vsize = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+        pool = SupervisedPool(2, timeout=5, max_memory=vsize + 2**30,
+                              on_error=lambda arg, reason: reason)
+        tasks = ['ok', 'sleep', 'crash', 'raise', 'memory', 'ok']
+        results = list(pool.imap(_supervised_task, tasks))
+        assert results[0] == results[-1] == 'ok'
+        assert 'timeout' in results[1]
+        assert 'exit code 3' in results[2]
+        assert 'ValueError' in results[3]
+        assert 'MemoryError' in results[4]
+
+        # the files opened after the creation of the pool are not
+        # inherited by the tasks
+        h5 = './1ak4_supervised_pool.hdf5'
+        with h5py.File(h5, 'w'):
+            files = list(pool.imap(_supervised_task, ['files']))[0]
+        os.remove(h5)
+        assert os.path.realpath(h5) not in files
+        pool.terminate()
+        assert not pool.supervisor.is_alive()
+
+    def test_1_generate_archive(self):
+        """Read the pdbs from archives and compressed files."""
+
+        decoys = ['1AK4_cm-it0_745', '1AK4_ranair-it0_5257',
+                  '1AK4_cm-itw_238w', '1AK4_ti5-itw_212w']
+        tmpdir = tempfile.mkdtemp(dir='.')
+        src = os.path.join(self.pdb_source[0], '{}.pdb')
+
+        # tar.gz with an unselected decoy, zip and directory of pdb.gz
+        tar = os.path.join(tmpdir, 'decoys.tar.gz')
+        with tarfile.open(tar, 'w:gz') as f:
+            for name in decoys[:2] + ['1AK4_ti5-itw_312w']:
+                f.add(src.format(name), arcname='decoys/' + name + '.pdb')
+        zipped = os.path.join(tmpdir, 'decoys.zip')
+        with zipfile.ZipFile(zipped, 'w') as f:
+            f.write(src.format(decoys[2]), arcname=decoys[2] + '.pdb')
+        gzdir = os.path.join(tmpdir, 'gz')
+        os.mkdir(gzdir)
+        gz = os.path.join(gzdir, decoys[3] + '.pdb.gz')
+        with open(src.format(decoys[3]), 'rb') as fi, \
+                gzip.open(gz, 'wb') as fo:
+            fo.write(fi.read())
+        native = os.path.join(tmpdir, 'native.zip')
+        with zipfile.ZipFile(native, 'w') as f:
+            f.write(os.path.join(self.pdb_native[0], '1AK4.pdb'),
+                    arcname='1AK4.pdb')
+
+        h5files = ['./1ak4_archive_ref.hdf5', './1ak4_archive.hdf5']
+        sources = [(self.pdb_source[0], self.pdb_native, None),
+                   ([tar, zipped, gzdir], [native], 2)]
+        try:
+            for h5, (pdb_source, pdb_native, n_workers) in \
+                    zip(h5files, sources):
+                database = DataGenerator(
+                    chain1='C',
+                    chain2='D',
+                    pdb_source=pdb_source,
+                    pdb_native=pdb_native,
+                    pdb_select=decoys,
+                    pssm_source='./1AK4/pssm_new/',
+                    data_augmentation=1,
+                    compute_targets=['deeprank.targets.binary_class'],
+                    compute_features=['deeprank.features.BSA'],
+                    hdf5=h5)
+                database.create_database(random_seed=2019,
+                                         n_workers=n_workers,
+                                         prescreen='flag')
+                assert len(database.pdb_path) == 4
+        finally:
+            shutil.rmtree(tmpdir)
+
+        assert_same_hdf5(h5files[0], h5files[1])
+
+    def test_1_select_pdbs(self):
+        """Select the pdbs by name, prefix or pattern."""
+
+        for select, names in [
+                (['1AK4_cm-it0_745', '1AK4_ti5-itw_212w.pdb'],
+                 ['1AK4_cm-it0_745', '1AK4_ti5-itw_212w']),
+                (['1AK4_*w'], ['1AK4_cm-itw_238w', '1AK4_ti5-itw_212w',
+                               '1AK4_ti5-itw_312w']),
+                (['1AK4_ti5'], ['1AK4_ti5-itw_212w', '1AK4_ti5-itw_312w']),
+                (['it0'], ['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'])]:
+            database = DataGenerator(chain1='C', chain2='D',
+                                     pdb_source=self.pdb_source,
+                                     pdb_native=self.pdb_native,
+                                     pdb_select=select)
+            assert [os.path.splitext(os.path.basename(f))[0]
+                    for f in database.pdb_path] == names
+
+    def test_1_generate_timing(self):
+        """Record the time spent in each stage of the generation."""
+
+        h5 = './1ak4_timing.hdf5'
+        for timing, n_workers in [('attrs', 2), ('json', None)]:
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+                pssm_source='./1AK4/pssm_new/',
+                data_augmentation=1,
+                compute_targets=['deeprank.targets.binary_class'],
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5,
+                timing=timing)
+            database.create_database(random_seed=2019, n_workers=n_workers)
+
+            grid_info = {
+                'number_of_points': [10, 10, 10],
+                'resolution': [3., 3., 3.],
+                'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52},
+            }
+            database.map_features(grid_info, write_queue_size=2)
+
+            summary = database.timer.summary()
+            for stage in ['ingest', 'feature:BSA', 'target:binary_class',
+                          'grid_center', 'augmentation', 'mapping',
+                          'sparse', 'grid_write']:
+                assert summary[stage]['count'] > 0, stage
+            assert summary['mapping']['count'] == 4
+            assert summary['ingest']['count'] == 2
+
+            if timing == 'attrs':
+                # the times of the workers are sent with the molecules
+                assert summary['write']['count'] == 2
+                with h5py.File(h5, 'r') as f5:
+                    times = json.loads(
+                        f5['1AK4_cm-it0_745'].attrs['timing'])
+                    assert 'feature:BSA' in times and 'mapping' in times
+                    assert 'timing' in f5.attrs
+
+        with open(h5 + '.timing.json') as f:
+            assert 'feature:BSA' in json.load(f)['summary']
+        os.remove(h5 + '.timing.json')
+
+    def test_1_estimate_cost(self):
+        """Estimate the cost of a database from a dry run."""
+
+        h5 = './1ak4_estimate.hdf5'
+        database = DataGenerator(
+            chain1='C',
+            chain2='D',
+            pdb_source=self.pdb_source[0],
+            pdb_native=self.pdb_native,
+            pssm_source='./1AK4/pssm_new/',
+            data_augmentation=1,
+            compute_targets=['deeprank.targets.binary_class'],
+            compute_features=['deeprank.features.BSA'],
+            hdf5=h5)
+
+        grid_info = {
+            'number_of_points': [10, 10, 10],
+            'resolution': [3., 3., 3.],
+            'atomic_densities': {'C': 1.7, 'N': 1.55, 'O': 1.52},
+        }
+        files = set(os.listdir('.'))
+        cost = database.estimate_cost(grid_info, n_samples=2,
+                                      random_seed=2019, n_workers=2)
+
+        # no file is left and the generator is not modified
+        assert set(os.listdir('.')) == files
+        assert database.timer is None and not database.feature_error
+
+        n_molecules = len(database.pdb_path)
+        assert cost['n_molecules'] == n_molecules
+        assert cost['n_samples'] == 2
+        assert not cost['errors']
+        assert np.isclose(cost['wall_time'],
+                          cost['wall_time_per_molecule'] * n_molecules)
+        assert cost['hdf5_size'] > cost['hdf5_size_per_molecule'] > 0
+        assert cost['peak_memory'] > 0
+        for stage in ['ingest', 'feature:BSA', 'augmentation', 'mapping']:
+            assert cost['stages'][stage] > 0, stage
+
+    def test_1_merge_hdf5(self):
+        """Gather the files of several MPI ranks in a single file."""
+
+        h5 = './1ak4_merged.hdf5'
+        h5ref = './1ak4_merged_ref.hdf5'
+        shards = ['./000_1ak4_merged.hdf5', './001_1ak4_merged.hdf5']
+        selections = [None, ['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+                      ['itw']]
+        for h5file, select in zip([h5ref] + shards, selections):
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pdb_source=self.pdb_source[0],
+                pdb_native=self.pdb_native,
+                pdb_select=select,
+                pssm_source='./1AK4/pssm_new/',
+                compute_features=['deeprank.features.BSA'],
+                hdf5=h5file)
+            database.create_database()
+
+        # the links point to the molecules of the shards
+        DataGenerator._merge_hdf5(h5, shards, 'link')
+        with h5py.File(h5, 'r') as f5, h5py.File(h5ref, 'r') as f5ref:
+            assert sorted(f5) == sorted(f5ref)
+            for mol in f5ref:
+                assert np.array_equal(f5[mol + '/features/bsa'][()],
+                                      f5ref[mol + '/features/bsa'][()])
+
+        # the copy replaces the shards
+        DataGenerator._merge_hdf5(h5, shards, 'copy')
+        assert not any(os.path.isfile(f) for f in shards)
+        assert_same_hdf5(h5, h5ref)
+        with h5py.File(h5, 'r') as f5:
+            natives = [f5[mol + '/native'] for mol in f5]
+            assert all(n == natives[0] for n in natives[1:])
+
     def test_2_add_target(self):
         """Add a target (e.g., class labels) to the database."""
 
@@ -151,6 +814,53 @@ class TestGenerateData(unittest.TestCase):
             database = DataGenerator(chain1='C', chain2='D', hdf5=h5)
             database.add_unique_target({'XX': 1.0})
 
+    def test_4_update_parallel(self):
+        """Add the missing features/targets and realign in parallel."""
+
+        h5 = './1ak4_update.hdf5'
+        database = DataGenerator(
+            chain1='C',
+            chain2='D',
+            pdb_source=self.pdb_source[0],
+            pdb_native=self.pdb_native,
+            pdb_select=['1AK4_cm-it0_745', '1AK4_ranair-it0_5257'],
+            pssm_source='./1AK4/pssm_new/',
+            data_augmentation=1,
+            compute_features=['deeprank.features.BSA'],
+            hdf5=h5)
+        database.create_database(random_seed=2019)
+
+        h5files = ['./1ak4_update_serial.hdf5', './1ak4_update_0.hdf5',
+                   './1ak4_update_1.hdf5']
+        for h5file in h5files:
+            shutil.copy(h5, h5file)
+
+        # the parallel run updates the list of files at once
+        features = ['deeprank.features.BSA', 'deeprank.features.FullPSSM']
+        for hdf5, n_workers in [(h5files[0], None), (h5files[1:], 2)]:
+            database = DataGenerator(
+                chain1='C',
+                chain2='D',
+                pssm_source='./1AK4/pssm_new/',
+                compute_features=features,
+                compute_targets=['deeprank.targets.binary_class'],
+                hdf5=hdf5)
+            database.add_feature(n_workers=n_workers)
+            database.add_target(n_workers=n_workers)
+            database.realign_complexes(align={'axis': 'z'},
+                                       n_workers=n_workers)
+
+        for h5file in h5files[1:]:
+            assert_same_hdf5(h5files[0], h5file)
+
+        with h5py.File(h5files[0], 'r') as f5:
+            assert list(f5.attrs['features']) == features
+            for mol in f5:
+                assert 'BIN_CLASS' in f5[mol + '/targets']
+                assert 'PSSM_ALA' in f5[mol + '/features']
+            molgrp = f5['1AK4_cm-it0_745']
+            assert list(molgrp['features'].attrs['modules']) == features
+
     def test_4_add_feature(self):
         """Add a feature to the database."""
 
@@ -289,13 +999,76 @@ class TestGenerateData(unittest.TestCase):
             prog_bar=False,
         )
 
+def _supervised_task(task):
+    """Task of test_1_supervised_pool."""
+    if task == 'sleep':
+        sleep(60)
+    elif task == 'crash':
+        os._exit(3)
+    elif task == 'raise':
+        raise ValueError(task)
+    elif task == 'memory':
+        np.ones(2**28)
+    elif task == 'files':
+        return [os.path.realpath(os.path.join('/proc/self/fd', fd))
+                for fd in os.listdir('/proc/self/fd')]
+    return task
+
+
+def assert_same_hdf5(fname1, fname2):
+    """Check that two hdf5 files contain the same data and attributes."""
+
+    def read(fname):
+        content = {}
+
+        # walk the links, the objects shared by several groups
+        # are only visited once by visititems
+        def walk(grp, path):
+            for key, obj in grp.items():
+                data = obj[()] if isinstance(obj, h5py.Dataset) else None
+                content[path + key] = (data, dict(obj.attrs))
+                if isinstance(obj, h5py.Group):
+                    walk(obj, path + key + '/')
+
+        with h5py.File(fname, 'r') as f5:
+            walk(f5, '')
+        return content
+
+    content1, content2 = read(fname1), read(fname2)
+    assert sorted(content1) == sorted(content2)
+    for name, (data1, attrs1) in content1.items():
+        data2, attrs2 = content2[name]
+        if data1 is not None:
+            assert np.array_equal(data1, data2), name
+        assert sorted(attrs1) == sorted(attrs2), name
+        for key in attrs1:
+            assert np.array_equal(attrs1[key], attrs2[key]), name
+
+
 if __name__ == "__main__":
 
     # unittest.main()
     inst = TestGenerateData()
     inst.test_1_generate()
     inst.test_1_generate_mapfly()
+    inst.test_1_generate_parallel()
+    inst.test_1_generate_resume()
+    inst.test_1_generate_async_write()
+    inst.test_1_generate_fft_mapping()
+    inst.test_1_generate_virtual_aug()
+    inst.test_1_generate_columnar()
+    inst.test_1_generate_feature_cache()
+    inst.test_1_generate_raw_format()
+    inst.test_1_generate_prescreen()
+    inst.test_1_generate_supervised()
+    inst.test_1_supervised_pool()
+    inst.test_1_generate_archive()
+    inst.test_1_select_pdbs()
+    inst.test_1_generate_timing()
+    inst.test_1_estimate_cost()
+    inst.test_1_merge_hdf5()
     inst.test_3_add_unique_target()
+    inst.test_4_update_parallel()
     inst.test_4_add_feature()
     inst.test_5_align()
     inst.test_6_align_interface()
@@ -1,6 +1,25 @@
+import os
+import shutil
+import tarfile
+import tempfile
 import unittest
+import zipfile
 
-from deeprank.tools import SASA
+import h5py
+import numpy as np
+import pdb2sql
+
+from deeprank.tools import SASA, StructureContext
+from deeprank.tools.archives import (is_archive, list_archive, load_pdb,
+                                     open_pdb, pdb_name, split_member)
+from deeprank.tools.columnar import (is_columnar, read_pdb_data, read_sql,
+                                     read_structure, sql_to_columns,
+                                     write_columns)
+from deeprank.tools.catalog import FileIndex, SourceCatalog
+from deeprank.tools import cpu_kernel
+from deeprank.tools.compaction import compact_hdf5
+from deeprank.tools.prescreen import count_contact_atoms
+from deeprank.tools.splatting import GridSplatter, get_grid_template
 
 
 class TestTools(unittest.TestCase):
@@ -17,6 +36,359 @@ class TestTools(unittest.TestCase):
         sasa.get_residue_center(chain1='C', chain2='D')
         sasa.neighbor_count(chain1='C', chain2='D')
 
+    def test_structure_context(self):
+        """Test the structure shared by the features."""
+
+        pdb = './1AK4/decoys/1AK4_cm-it0_745.pdb'
+        with StructureContext(pdb, chain1='C', chain2='D') as structure:
+            sql = structure.sql
+            # the pdb is parsed only once
+            assert structure.sql is sql
+            xyz = sql.get('x,y,z', chainID='C')
+            assert len(xyz) > 0
+        assert structure._sql is None
+
+    @staticmethod
+    def test_structure_contacts():
+        """Test the contacts memoized by the structure."""
+
+        pdb = './1AK4/decoys/1AK4_cm-it0_745.pdb'
+        sql = pdb2sql.interface(pdb)
+        structure = StructureContext(pdb, chain1='C', chain2='D')
+
+        # the 5.5 contacts are derived from the 8.5 atom pairs
+        for cutoff in [8.5, 5.5]:
+            for pairs in [False, True]:
+                assert structure.get_contact_atoms(
+                    cutoff=cutoff, return_contact_pairs=pairs) == \
+                    sql.get_contact_atoms(
+                        cutoff=cutoff, chain1='C', chain2='D',
+                        return_contact_pairs=pairs)
+                assert structure.get_contact_residues(
+                    cutoff=cutoff, return_contact_pairs=pairs) == \
+                    sql.get_contact_residues(
+                        cutoff=cutoff, chain1='C', chain2='D',
+                        return_contact_pairs=pairs)
+
+        res = structure.get_contact_residues(cutoff=5.5)
+        assert structure.get_contact_residues(cutoff=5.5) is res
+
+        # options of pdb2sql, memoized separately
+        for options in [{'excludeH': True}, {'only_backbone_atoms': True},
+                        {'allchains': True}]:
+            assert structure.get_contact_residues(cutoff=5.5, **options) == \
+                sql.get_contact_residues(cutoff=5.5, chain1='C',
+                                         chain2='D', **options)
+        options = {'extend_to_residue': True, 'excludeH': True}
+        atoms = structure.get_contact_atoms(**options)
+        assert atoms == sql.get_contact_atoms(chain1='C', chain2='D',
+                                              **options)
+        assert structure.get_contact_atoms(**options) is atoms
+        assert structure.get_contact_residues(cutoff=5.5) is res
+
+        sql._close()
+        structure.close()
+
+    def test_prescreen(self):
+        """Test the contact atoms counted from the coordinates."""
+
+        pdb = './1AK4/decoys/1AK4_cm-it0_745.pdb'
+        with StructureContext(pdb, chain1='C', chain2='D') as structure:
+            for cutoff in [8.5, 5.5]:
+                contacts = structure.get_contact_atoms(cutoff=cutoff)
+                assert count_contact_atoms(pdb, 'C', 'D', cutoff) == \
+                    (len(contacts['C']), len(contacts['D']))
+        assert count_contact_atoms(pdb, 'C', 'X') == (0, 0)
+
+        # blank chain IDs read from the segIDs as pdb2sql does
+        with open(pdb) as f:
+            lines = [line[:21] + ' ' + line[22:]
+                     if line.startswith('ATOM') else line for line in f]
+        fd, tmp = tempfile.mkstemp(suffix='.pdb', dir='.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.writelines(lines)
+            assert count_contact_atoms(tmp, 'C', 'D') == \
+                count_contact_atoms(pdb, 'C', 'D')
+
+            # truncated line
+            with open(tmp, 'a') as f:
+                f.write('ATOM      1  N\n')
+            with self.assertRaises(ValueError):
+                count_contact_atoms(tmp, 'C', 'D')
+        finally:
+            os.remove(tmp)
+
+    @staticmethod
+    def test_archives():
+        """Test the pdb files read from the archives."""
+
+        names = ['1AK4_cm-it0_745', '1AK4_ranair-it0_5257',
+                 '1AK4_cm-itw_238w']
+        pdbs = ['./1AK4/decoys/' + name + '.pdb' for name in names]
+        contents = []
+        for pdb in pdbs:
+            with open(pdb) as f:
+                contents.append(f.read())
+
+        tmpdir = tempfile.mkdtemp(dir='.')
+        try:
+            tar = os.path.join(tmpdir, 'decoys.tar.gz')
+            with tarfile.open(tar, 'w:gz') as f:
+                f.add('./1AK4/decoys/', arcname='decoys', recursive=False)
+                for pdb in pdbs:
+                    f.add(pdb, arcname='decoys/' + os.path.basename(pdb))
+            zipped = os.path.join(tmpdir, 'decoys.zip')
+            with zipfile.ZipFile(zipped, 'w') as f:
+                f.write(pdbs[0], arcname=names[0] + '.pdb')
+                f.writestr('README', 'not a pdb')
+
+            members = list_archive(tar)
+            assert is_archive(tar) and not is_archive(pdbs[0])
+            assert [pdb_name(m) for m in members] == names
+            assert split_member(members[1]) == \
+                (tar, 'decoys/' + names[1] + '.pdb')
+            assert split_member(pdbs[1]) == (None, pdbs[1])
+
+            # the members are read in any order by each process
+            for i in [2, 0, 1]:
+                with open_pdb(members[i]) as f:
+                    assert f.read() == contents[i]
+            assert load_pdb(members[0]) == contents[0].splitlines(True)
+            assert load_pdb(pdbs[0]) == pdbs[0]
+
+            members = list_archive(zipped)
+            assert members == [os.path.join(zipped, names[0] + '.pdb')]
+            with open_pdb(members[0]) as f:
+                assert f.read() == contents[0]
+        finally:
+            shutil.rmtree(tmpdir)
+
+    @staticmethod
+    def test_catalog():
+        """Test the catalog of the source directories."""
+
+        tmpdir = tempfile.mkdtemp(dir='.')
+        try:
+            src = os.path.join(tmpdir, 'pssm')
+            os.mkdir(src)
+            os.mkdir(os.path.join(src, '1AK4.dir'))
+            for name in ['1AK4.C.pssm', '1AK4.D.pssm', '1AK4_10w.C.pssm',
+                         '2OUL.A.pssm']:
+                open(os.path.join(src, name), 'w').close()
+
+            path = os.path.join(tmpdir, 'catalog')
+            catalog = SourceCatalog(path)
+            assert catalog.list(src) == ['1AK4.C.pssm', '1AK4.D.pssm',
+                                         '1AK4_10w.C.pssm', '2OUL.A.pssm']
+            assert catalog.startswith(src, '1AK4.') == \
+                ['1AK4.C.pssm', '1AK4.D.pssm']
+            assert catalog.startswith(src, '1AK4_10w') == ['1AK4_10w.C.pssm']
+            assert catalog.startswith(src, '3HFL') == []
+            assert catalog.glob(src, '*.C.pssm') == \
+                ['1AK4.C.pssm', '1AK4_10w.C.pssm']
+            assert catalog.glob(src, '1AK4.[CD].pssm') == \
+                ['1AK4.C.pssm', '1AK4.D.pssm']
+            assert catalog.glob(src, '2OUL.A.pssm') == ['2OUL.A.pssm']
+            assert catalog.scans == 1
+
+            # the listing is reused by the next catalogs
+            catalog = SourceCatalog(path)
+            assert len(catalog.list(src)) == 4 and catalog.scans == 0
+
+            # until the directory is modified
+            open(os.path.join(src, '2OUL.B.pssm'), 'w').close()
+            st = os.stat(src)
+            os.utime(src, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            assert catalog.startswith(src, '2OUL') == \
+                ['2OUL.A.pssm', '2OUL.B.pssm']
+            assert catalog.scans == 1
+        finally:
+            shutil.rmtree(tmpdir)
+
+        index = FileIndex(['./a/1AK4_1w.pdb', './b/1AK4_2w.pdb.gz',
+                           './b/1AK4.pdb', './c/1AK4_1w.pdb'])
+        assert index['1AK4_1w.pdb'] == ['./a/1AK4_1w.pdb', './c/1AK4_1w.pdb']
+        assert '1AK4_2w.pdb' in index
+        assert index.startswith('1AK4_') == \
+            ['./a/1AK4_1w.pdb', './c/1AK4_1w.pdb', './b/1AK4_2w.pdb.gz']
+        assert index.glob('1AK4_[2-9]w.pdb') == ['./b/1AK4_2w.pdb.gz']
+
+    @staticmethod
+    def test_columnar():
+        """Test the columnar storage of the structures."""
+
+        pdb = './1AK4/decoys/1AK4_cm-it0_745.pdb'
+        sql = pdb2sql.pdb2sql(pdb)
+
+        with h5py.File('columnar.hdf5', 'w', driver='core',
+                       backing_store=False) as f5:
+            write_columns(f5, 'complex', sql_to_columns(sql))
+            assert is_columnar(f5['complex'])
+
+            # same database with or without the pdb lines
+            columnar_sql = read_sql(f5['complex'])
+            assert columnar_sql.get('*') == sql.get('*')
+            assert pdb2sql.pdb2sql(
+                read_pdb_data(f5['complex'])).get('*') == sql.get('*')
+
+            # the structure only creates the pdb lines when asked
+            structure = StructureContext(read_structure(f5['complex']),
+                                         chain1='C', chain2='D')
+            assert structure.sql.get('*') == sql.get('*')
+            assert structure.pdb_data == sql.sql2pdb()
+            structure.close()
+
+        columnar_sql._close()
+        sql._close()
+
+    @staticmethod
+    def test_compaction():
+        """Test the compaction of a hdf5 file."""
+
+        fname = 'compaction.hdf5'
+        with h5py.File(fname, 'w') as f5:
+            f5.create_dataset('removed', data=np.random.rand(10**6))
+            f5.attrs['features'] = ['deeprank.features.BSA']
+            f5.create_dataset('mol/complex', data=np.arange(10**6),
+                              compression='gzip')
+            f5['mol_r001/complex'] = h5py.SoftLink('/mol/complex')
+            f5.create_dataset('mol/native', data=np.ones((100, 3)))
+            f5['mol_r001/native'] = f5['mol/native']
+            f5['mol/native'].attrs['labels'] = np.array([b'CA', b'N'])
+        with h5py.File(fname, 'a') as f5:
+            del f5['removed']
+
+        size = os.path.getsize(fname)
+        assert compact_hdf5(fname, block_size=1000) > 8 * 10**6
+        assert compact_hdf5(fname, compression='lzf') != 0
+        assert os.path.getsize(fname) < size
+
+        with h5py.File(fname, 'r') as f5:
+            assert sorted(f5) == ['mol', 'mol_r001']
+            assert list(f5.attrs['features']) == ['deeprank.features.BSA']
+            assert f5['mol/complex'].compression == 'lzf'
+            assert np.array_equal(f5['mol/complex'][()], np.arange(10**6))
+            assert np.array_equal(f5['mol_r001/complex'][()],
+                                  np.arange(10**6))
+            link = f5['mol_r001'].get('complex', getlink=True)
+            assert isinstance(link, h5py.SoftLink)
+            assert f5['mol_r001/native'] == f5['mol/native']
+            assert list(f5['mol/native'].attrs['labels']) == [b'CA', b'N']
+        os.remove(fname)
+
+    def test_cpu_kernel_cache(self):
+        """Test the private directory of the compiled kernels."""
+
+        tmpdir = tempfile.mkdtemp(dir='.')
+        xdg = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = tmpdir
+        try:
+            directory = cpu_kernel._get_cache_dir()
+            assert directory == os.path.join(tmpdir, 'deeprank')
+            assert os.stat(directory).st_mode & 0o777 == 0o700
+
+            # files and directories writable by other users are refused
+            lib = os.path.join(directory, 'kernel.so')
+            open(lib, 'w').close()
+            os.chmod(lib, 0o700)
+            cpu_kernel._check_private(lib, directory=False)
+            os.chmod(lib, 0o722)
+            with self.assertRaises(OSError):
+                cpu_kernel._check_private(lib, directory=False)
+            os.chmod(directory, 0o777)
+            with self.assertRaises(OSError):
+                cpu_kernel._check_private(directory, directory=True)
+            os.symlink(lib, lib + '.link')
+            with self.assertRaises(OSError):
+                cpu_kernel._check_private(lib + '.link', directory=False)
+        finally:
+            if xdg is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = xdg
+            shutil.rmtree(tmpdir)
+
+    @staticmethod
+    def test_splatting():
+        """Test the mapping on the sub-boxes of the grid."""
+
+        rng = np.random.RandomState(0)
+        x = np.linspace(-14.5, 14.5, 30)
+        y = np.linspace(-7., 7., 15)
+        z = np.linspace(-9.75, 9.75, 40)
+        ygrid, xgrid, zgrid = np.meshgrid(y, x, z)
+
+        # centers inside, on the border and outside of the grid
+        xyz = rng.uniform(-20, 20, (50, 3))
+        values = rng.randn(50)
+
+        feat = np.zeros(xgrid.shape)
+        dens = np.zeros(xgrid.shape)
+        vdw = 1.7
+        for pos, val in zip(xyz, values):
+            dd = np.sqrt((xgrid - pos[0])**2 + (ygrid - pos[1])**2 +
+                         (zgrid - pos[2])**2)
+            feat[dd < 5] += val * np.exp(-dd[dd < 5])
+            short, far = dd < vdw, (dd >= vdw) & (dd < 1.5 * vdw)
+            dens[short] += np.exp(-2 * dd[short]**2 / vdw**2)
+            dens[far] += 4. / np.e**2 / vdw**2 * dd[far]**2 \
+                - 12. / np.e**2 / vdw * dd[far] + 9. / np.e**2
+
+        splatter = GridSplatter(x, y, z)
+        grid = splatter.features(xyz, values)
+        assert grid.dtype == np.float32
+        assert np.allclose(grid, feat, atol=1E-5)
+        assert np.allclose(splatter.densities(xyz, vdw), dens, atol=1E-5)
+
+        # accumulated in a given grid
+        out = np.ones(xgrid.shape, np.float32)
+        splatter.features(xyz[:10], values[:10], out=out)
+        splatter.features(xyz[10:], values[10:], out=out)
+        assert np.allclose(out, feat + 1, atol=1E-5)
+        assert not np.any(splatter.features(np.zeros((0, 3)), []))
+
+        # compiled kernels with several threads and numpy
+        for num_threads in [1, 3]:
+            cpu_kernel.set_num_threads(num_threads)
+            assert cpu_kernel.get_num_threads() == num_threads
+            grid = GridSplatter(x, y, z).features(xyz, values)
+            assert np.allclose(grid, feat, atol=1E-5)
+        cpu_kernel.set_num_threads(None)
+        splatter = GridSplatter(x, y, z, compiled=False)
+        assert np.allclose(splatter.features(xyz, values), feat, atol=1E-5)
+        assert np.allclose(splatter.densities(xyz, vdw), dens, atol=1E-5)
+
+        # several channels at the same positions
+        channels = np.stack([values, 2 * values, -values], axis=1)
+        for compiled in [True, False]:
+            splatter = GridSplatter(x, y, z, compiled=compiled)
+            grids = splatter.features(xyz, channels)
+            assert grids.shape == (3,) + xgrid.shape
+            for grid, coeff in zip(grids, [1, 2, -1]):
+                assert np.allclose(grid, coeff * feat, atol=1E-5)
+            outs = [np.zeros(xgrid.shape) for _ in range(3)]
+            splatter.features(xyz, channels, out=outs)
+            assert np.allclose(outs, grids)
+
+        # convolution of the deposited values
+        splatter = GridSplatter(x, y, z, mode='fft')
+        grid = splatter.features(xyz, values)
+        assert np.abs(grid - feat).max() < 0.1 * np.abs(feat).max()
+        grid = splatter.densities(xyz, vdw)
+        assert np.abs(grid - dens).max() < 0.3 * dens.max()
+
+        # grids of the molecules sharing the same template
+        center = np.array([0.5, 0.5, 0.25])
+        splatter = GridSplatter.from_center(center, [30, 15, 40],
+                                            [1., 1., 0.5])
+        for axis, ref in zip(splatter.axes, [x, y, z]):
+            assert np.allclose(axis, ref)
+        template = get_grid_template((30, 15, 40), (1., 1., 0.5))
+        assert get_grid_template((30, 15, 40), (1., 1., 0.5)) is template
+        assert not template[0].flags.writeable
+        assert np.allclose(splatter.features(xyz, values), feat, atol=1E-5)
+
 
 if __name__ == '__main__':
     unittest.main()